@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import UsuarioCustomizado, Paciente, Caso, LaudoMacroscopico, LaudoMicroscopico, MetodoPreparo, LogAtividade
+from .models import UsuarioCustomizado, Paciente, Caso, LaudoMacroscopico, LaudoMicroscopico, MetodoPreparo, LogAtividade, TagMicroscopica, TarefaPdf, Termo
 
 @admin.register(UsuarioCustomizado)
 class UsuarioCustomizadoAdmin(admin.ModelAdmin):
@@ -34,6 +34,23 @@ class LaudoMicroscopicoAdmin(admin.ModelAdmin):
     search_fields = ('caso__id_laboratorio',)
     ordering = ('caso',)
 
+@admin.register(TagMicroscopica)
+class TagMicroscopicaAdmin(admin.ModelAdmin):
+    list_display = ('nome', 'chave', 'ordem', 'ativa')
+    list_editable = ('ordem', 'ativa')
+    list_filter = ('ativa',)
+    search_fields = ('nome', 'chave')
+    prepopulated_fields = {'chave': ('nome',)}
+    ordering = ('ordem', 'nome')
+
+@admin.register(Termo)
+class TermoAdmin(admin.ModelAdmin):
+    list_display = ('codigo', 'nome', 'sinonimos', 'ativo')
+    list_editable = ('ativo',)
+    list_filter = ('ativo',)
+    search_fields = ('codigo', 'nome')
+    ordering = ('codigo',)
+
 @admin.register(MetodoPreparo)
 class MetodoPreparoAdmin(admin.ModelAdmin):
     list_display = ('caso', 'metodo_padrao_he', 'notas_adicionais')
@@ -43,8 +60,15 @@ class MetodoPreparoAdmin(admin.ModelAdmin):
 
 @admin.register(LogAtividade)
 class LogAtividadeAdmin(admin.ModelAdmin):
-    list_display = ('usuario', 'acao', 'timestamp')
-    list_filter = ('timestamp', 'usuario__role')
-    search_fields = ('usuario__username', 'acao')
+    list_display = ('usuario', 'caso', 'etapa', 'acao', 'timestamp')
+    list_filter = ('timestamp', 'etapa', 'usuario__role')
+    search_fields = ('usuario__username', 'acao', 'caso__id_laboratorio')
     ordering = ('-timestamp',)
     readonly_fields = ('timestamp',)
+
+@admin.register(TarefaPdf)
+class TarefaPdfAdmin(admin.ModelAdmin):
+    list_display = ('id_laboratorio', 'status', 'tentativas', 'criada_em', 'concluida_em', 'duracao_ms', 'trabalhador')
+    list_filter = ('status',)
+    search_fields = ('id_laboratorio',)
+    ordering = ('-criada_em',)
@@ -1,6 +1,36 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
 
 
 class LaudosConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'laudos'
+
+    def ready(self):
+        from django.utils import timezone
+
+        from . import tags, terminologia
+        from .models import Caso, LaudoMacroscopico, LaudoMicroscopico, MetodoPreparo, Paciente, TagMicroscopica, Termo
+
+        def invalidar_vocabulario(**kwargs):
+            tags.invalidar()
+
+        def invalidar_terminologia(**kwargs):
+            terminologia.invalidar()
+
+        def tocar_caso(sender, instance, **kwargs):
+            # Edições fora do workflow (admin, shell) não mudam ``versao``; ``atualizado_em``
+            # entra no ETag das páginas do caso e invalida as respostas 304.
+            if sender is Paciente:
+                casos = Caso.objects.filter(paciente=instance)
+            else:
+                casos = Caso.objects.filter(pk=instance.caso_id)
+            casos.update(atualizado_em=timezone.now())
+
+        for modelo in (LaudoMacroscopico, MetodoPreparo, LaudoMicroscopico, Paciente):
+            post_save.connect(tocar_caso, sender=modelo, weak=False)
+            post_delete.connect(tocar_caso, sender=modelo, weak=False)
+        post_save.connect(invalidar_vocabulario, sender=TagMicroscopica, weak=False)
+        post_delete.connect(invalidar_vocabulario, sender=TagMicroscopica, weak=False)
+        post_save.connect(invalidar_terminologia, sender=Termo, weak=False)
+        post_delete.connect(invalidar_terminologia, sender=Termo, weak=False)
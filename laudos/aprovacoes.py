@@ -0,0 +1,90 @@
+"""Filas de aprovação dos professores, servidas pelos índices ``caso_fila_*`` de ``Caso``."""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+from django.db.models import F, Q, QuerySet
+from django.utils import timezone
+
+from . import contadores
+from .models import Caso
+
+LIMITE_PADRAO = 50
+
+
+@dataclass(frozen=True)
+class Fila:
+    slug: str
+    titulo: str
+    condicao: Q
+    # Momento em que o caso entrou na fila; a fila anda do mais antigo para o mais novo.
+    campo_espera: str
+    url_aprovar: str
+
+    def consulta(self, limite: int = LIMITE_PADRAO) -> QuerySet:
+        """Lê só a faixa da fila no índice, então o custo não depende do total de casos."""
+        return (
+            Caso.objects.filter(self.condicao)
+            .order_by(self.campo_espera, "id_laboratorio")
+            .values("id_laboratorio", "solicitante", "data_recebimento", "status")
+            .annotate(aguardando_desde=F(self.campo_espera))[:limite]
+        )
+
+
+FILAS = (
+    Fila(
+        "macro",
+        "Macroscopia",
+        Q(macro_status="AGUARDANDO_APROVACAO"),
+        "macro_preenchido_em",
+        "aprovar_macroscopia",
+    ),
+    Fila(
+        "preparo",
+        "Preparo e Coloracao",
+        Q(preparo_status="AGUARDANDO_APROVACAO"),
+        "preparo_preenchido_em",
+        "aprovar_preparo",
+    ),
+    Fila(
+        "micro",
+        "Microscopia",
+        Q(micro_status="AGUARDANDO_APROVACAO"),
+        "micro_preenchido_em",
+        "aprovar_microscopia",
+    ),
+    Fila(
+        "final",
+        "Aprovacao final",
+        Q(status="AGUARDANDO_APROVACAO_FINAL"),
+        "micro_aprovado_em",
+        "aprovar_laudo",
+    ),
+)
+FILAS_POR_SLUG = {fila.slug: fila for fila in FILAS}
+
+
+def caixa_de_entrada(limite: int = LIMITE_PADRAO) -> list[dict]:
+    """Uma entrada por fila com o total (dos contadores) e os casos que esperam há mais tempo."""
+    totais = contadores.resumo()["aguardando"]
+    agora = timezone.now()
+    caixa = []
+    for fila in FILAS:
+        casos = list(fila.consulta(limite))
+        for caso in casos:
+            desde = caso["aguardando_desde"]
+            caso["espera_segundos"] = int((agora - desde).total_seconds()) if desde else None
+        caixa.append(
+            {
+                "slug": fila.slug,
+                "titulo": fila.titulo,
+                "url_aprovar": fila.url_aprovar,
+                "total": totais[fila.slug],
+                "casos": casos,
+            }
+        )
+    return caixa
+
+
+__all__ = ["FILAS", "FILAS_POR_SLUG", "Fila", "caixa_de_entrada"]
@@ -0,0 +1,237 @@
+"""Arquivamento de casos finalizados e de logs antigos, em lotes curtos.
+
+Cada lote é uma transação própria com no máximo ``lote`` casos ou registros, para que
+o SQLite nunca segure o lock de escrita por muito tempo. Casos arquivados continuam
+legíveis por ``obter_caso_ou_404``, que reconstrói o grafo a partir do snapshot.
+"""
+
+from __future__ import annotations
+
+import datetime
+import time
+from typing import Callable, Iterator, Optional
+
+from django.conf import settings
+from django.core import serializers
+from django.db import transaction
+from django.http import Http404
+from django.utils import timezone
+
+from . import busca, cache_worklist, contadores
+from .models import (
+    Caso,
+    CasoArquivado,
+    LaudoMacroscopico,
+    LaudoMicroscopico,
+    LogAtividade,
+    LogAtividadeArquivado,
+    MetodoPreparo,
+    Paciente,
+    UsuarioCustomizado,
+)
+
+LOTE_PADRAO = 200
+# Relações um-para-um que compõem o grafo do caso, com o modelo de cada uma.
+RELACOES = (
+    ("laudo_macroscopico", LaudoMacroscopico),
+    ("metodo_preparo", MetodoPreparo),
+    ("laudo_microscopico", LaudoMicroscopico),
+)
+
+
+def dias_padrao() -> int:
+    return getattr(settings, "LAUDOS_ARQUIVO_DIAS", 365)
+
+
+def limite_para(dias: int) -> datetime.datetime:
+    return timezone.now() - datetime.timedelta(days=dias)
+
+
+def _grafo(caso: Caso) -> list:
+    objetos = [caso.paciente, caso]
+    for relacao, _ in RELACOES:
+        relacionado = getattr(caso, relacao, None)
+        if relacionado is not None:
+            objetos.append(relacionado)
+    return objetos
+
+
+def _copiar_logs(entradas: list[LogAtividade]) -> None:
+    # ignore_conflicts: um lote interrompido depois da cópia pode ser repetido sem erro.
+    LogAtividadeArquivado.objects.bulk_create(
+        [
+            LogAtividadeArquivado(
+                id=entrada.id,
+                usuario_id=entrada.usuario_id,
+                id_laboratorio=entrada.caso_id or "",
+                etapa=entrada.etapa,
+                acao=entrada.acao,
+                timestamp=entrada.timestamp,
+                detalhes=entrada.detalhes,
+            )
+            for entrada in entradas
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def arquivar_casos_lote(limite: datetime.datetime, lote: int = LOTE_PADRAO) -> int:
+    """Move até ``lote`` casos finalizados antes de ``limite``, com seus laudos e logs."""
+    with transaction.atomic():
+        # Casos finalizados não aceitam mais transições, então não há escrita concorrente.
+        casos = list(
+            Caso.objects.filter(status="FINALIZADO", data_finalizacao__lt=limite)
+            .select_related("paciente", *(relacao for relacao, _ in RELACOES))
+            .order_by("data_finalizacao", "id_laboratorio")[:lote]
+        )
+        if not casos:
+            return 0
+        ids = [caso.pk for caso in casos]
+
+        CasoArquivado.objects.bulk_create(
+            [
+                CasoArquivado(
+                    id_laboratorio=caso.pk,
+                    numero_prontuario=caso.paciente_id,
+                    data_recebimento=caso.data_recebimento,
+                    data_finalizacao=caso.data_finalizacao,
+                    versao=caso.versao,
+                    dados=serializers.serialize("json", _grafo(caso)),
+                )
+                for caso in casos
+            ],
+            ignore_conflicts=True,
+        )
+        logs = LogAtividade.objects.filter(caso_id__in=ids)
+        _copiar_logs(list(logs))
+        logs.delete()
+
+        contadores.remover(contadores.estado(caso) for caso in casos)
+        Caso.objects.filter(pk__in=ids).delete()
+        busca.remover(ids)
+        transaction.on_commit(cache_worklist.invalidar)
+    return len(casos)
+
+
+def arquivar_logs_lote(limite: datetime.datetime, lote: int = LOTE_PADRAO) -> int:
+    """Move até ``lote`` registros de log anteriores a ``limite``."""
+    with transaction.atomic():
+        entradas = list(LogAtividade.objects.filter(timestamp__lt=limite).order_by("pk")[:lote])
+        if not entradas:
+            return 0
+        _copiar_logs(entradas)
+        LogAtividade.objects.filter(pk__in=[entrada.pk for entrada in entradas]).delete()
+    return len(entradas)
+
+
+TIPOS: dict[str, Callable[[datetime.datetime, int], int]] = {
+    "casos": arquivar_casos_lote,
+    "logs": arquivar_logs_lote,
+}
+
+
+def arquivar(
+    limite: datetime.datetime,
+    lote: int = LOTE_PADRAO,
+    pausa: float = 0.0,
+    tipos: tuple[str, ...] = ("casos", "logs"),
+) -> Iterator[tuple[str, int]]:
+    """Executa lotes até esgotar cada tipo, produzindo ``(tipo, quantidade)`` por lote.
+
+    ``pausa`` (segundos) entre lotes libera o banco para as requisições interativas.
+    """
+    for tipo in tipos:
+        while True:
+            quantidade = TIPOS[tipo](limite, lote)
+            if not quantidade:
+                break
+            yield tipo, quantidade
+            if pausa:
+                time.sleep(pausa)
+
+
+def _resolver_usuarios(objetos) -> None:
+    """Liga as chaves de usuário do snapshot numa consulta só.
+
+    Nas tabelas de trabalho essas chaves são SET_NULL; no snapshot ficam os ids antigos, e
+    um usuário já excluído vira None em vez de DoesNotExist na leitura.
+    """
+    campos = [
+        (objeto, campo)
+        for objeto in objetos
+        for campo in objeto._meta.concrete_fields
+        if campo.is_relation and campo.related_model is UsuarioCustomizado
+    ]
+    usuarios = UsuarioCustomizado.objects.in_bulk(
+        {getattr(objeto, campo.attname) for objeto, campo in campos} - {None}
+    )
+    for objeto, campo in campos:
+        usuario = usuarios.get(getattr(objeto, campo.attname))
+        setattr(objeto, campo.attname, usuario.pk if usuario else None)
+        campo.set_cached_value(objeto, usuario)
+
+
+def carregar_arquivado(caso_id: str) -> Optional[Caso]:
+    """Reconstrói o caso arquivado como instâncias não salvas, com as relações em cache."""
+    registro = CasoArquivado.objects.filter(pk=caso_id).first()
+    if registro is None:
+        return None
+    # ignorenonexistent: snapshots antigos continuam legíveis depois que uma coluna sai do modelo.
+    objetos = {
+        type(item.object): item.object
+        for item in serializers.deserialize("json", registro.dados, ignorenonexistent=True)
+    }
+    _resolver_usuarios(objetos.values())
+    caso = objetos[Caso]
+    caso.paciente = objetos[Paciente]
+    for relacao, modelo in RELACOES:
+        relacionado = objetos.get(modelo)
+        # Guardar None no cache faz o acesso levantar DoesNotExist sem consultar o banco.
+        Caso._meta.get_field(relacao).set_cached_value(caso, relacionado)
+        if relacionado is not None:
+            relacionado.caso = caso
+    caso.arquivado = True
+    return caso
+
+
+def obter_caso_ou_404(caso_id: str) -> Caso:
+    """Busca o caso na tabela de trabalho e, se não estiver lá, no arquivo."""
+    caso = (
+        Caso.objects.select_related("paciente", "responsavel_final", *(relacao for relacao, _ in RELACOES))
+        .filter(id_laboratorio=caso_id)
+        .first()
+    )
+    if caso is not None:
+        caso.arquivado = False
+        return caso
+    caso = carregar_arquivado(caso_id)
+    if caso is None:
+        raise Http404("Caso não encontrado.")
+    return caso
+
+
+def linha_do_tempo(caso: Caso, limite: int) -> list:
+    """Registros mais recentes do caso, completando com os arquivados se necessário."""
+    registros = []
+    if not caso.arquivado:
+        registros = list(caso.logs.select_related("usuario").order_by("-timestamp")[:limite])
+    if len(registros) < limite:
+        registros += list(
+            LogAtividadeArquivado.objects.filter(id_laboratorio=caso.pk)
+            .select_related("usuario")
+            .order_by("-timestamp")[: limite - len(registros)]
+        )
+    return registros
+
+
+__all__ = [
+    "LOTE_PADRAO",
+    "arquivar",
+    "arquivar_casos_lote",
+    "arquivar_logs_lote",
+    "carregar_arquivado",
+    "dias_padrao",
+    "limite_para",
+    "linha_do_tempo",
+    "obter_caso_ou_404",
+]
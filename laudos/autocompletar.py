@@ -0,0 +1,240 @@
+"""Sugestões de conclusão a partir dos laudos finalizados, servidas da memória do processo.
+
+As conclusões distintas ficam num vetor ordenado pela forma normalizada (sem acentos, em
+minúsculas, espaços colapsados); o prefixo digitado vira uma faixa do vetor por ``bisect``
+e dela saem as frases mais frequentes. Prefixos largos demais percorrem uma segunda lista,
+já ordenada por frequência. A consulta não acessa o banco: ``atualizar`` lê só os casos
+finalizados desde a última leitura e troca o vetor inteiro de uma vez, então leituras
+concorrentes nunca veem um índice pela metade.
+
+A primeira sugestão do processo monta o índice na própria requisição. Depois disso,
+``aprovar_laudo_final`` chama ``avisar`` depois do commit: o processo que aprovou atualiza
+na hora e os demais conferem a versão no cache do Django no máximo a cada
+``INTERVALO_VERIFICACAO`` segundos (o cache pode ser Redis ou o banco, então não a cada
+tecla) e se atualizam numa thread, respondendo com o índice anterior enquanto isso.
+"""
+
+from __future__ import annotations
+
+import bisect
+import datetime
+import json
+import threading
+import time
+from itertools import islice
+from typing import Iterable, Optional
+
+from django.db import close_old_connections
+from django.utils import timezone
+
+from . import metricas, versoes
+from .models import CasoArquivado, LaudoMicroscopico
+from .textos import normalizar
+
+CHAVE_VERSAO = "laudos:autocompletar:versao"
+LIMITE_PADRAO = 8
+MINIMO_PREFIXO = 2
+# Aprovações concorrentes podem gravar data_finalizacao fora de ordem de commit.
+MARGEM_RELEITURA = datetime.timedelta(minutes=5)
+LOTE_CONSULTA = 2000
+# Faixas maiores do que isso são resolvidas pela lista ordenada por frequência.
+FAIXA_MAXIMA = 2048
+# Acima disso ``adicionar`` reordena os vetores inteiros em vez de reposicionar frase a frase.
+LOTE_REORDENACAO = 64
+# Segundos entre duas consultas à versão no cache do Django.
+INTERVALO_VERIFICACAO = 5.0
+
+
+class IndiceFrases:
+    """Vetor ordenado de frases normalizadas com frequência e a forma exibida de cada uma."""
+
+    def __init__(self):
+        self._chaves: list[str] = []
+        self._frequencias: dict[str, int] = {}
+        self._textos: dict[str, str] = {}
+        self._por_frequencia: list[str] = []
+        self._memoria: dict[tuple[str, int], list[dict]] = {}
+        self._trava = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._chaves)
+
+    def adicionar(self, textos: Iterable[str]) -> int:
+        """Conta as frases e publica os vetores novos; devolve quantas frases eram inéditas."""
+        with self._trava:
+            anteriores = self._frequencias
+            frequencias = dict(anteriores)
+            exibicao = dict(self._textos)
+            contadas: dict[str, int] = {}
+            for texto in textos:
+                texto = " ".join((texto or "").split())
+                chave = normalizar(texto)
+                if not chave:
+                    continue
+                exibicao.setdefault(chave, texto)
+                frequencias[chave] = frequencias.get(chave, 0) + 1
+                contadas[chave] = frequencias[chave]
+            novas = [chave for chave in contadas if chave not in anteriores]
+
+            def ordem(dicionario):
+                return lambda chave: (-dicionario[chave], chave)
+
+            if len(contadas) > LOTE_REORDENACAO:
+                chaves = sorted(self._chaves + novas)
+                por_frequencia = sorted(frequencias, key=ordem(frequencias))
+            else:
+                # Poucas frases mudaram: reposiciona só elas nas cópias dos vetores.
+                chaves = self._chaves.copy()
+                for chave in novas:
+                    bisect.insort(chaves, chave)
+                por_frequencia = self._por_frequencia.copy()
+                ordem_anterior = ordem(anteriores)
+                for chave in contadas:
+                    if chave in anteriores:
+                        posicao = bisect.bisect_left(por_frequencia, ordem_anterior(chave), key=ordem_anterior)
+                        del por_frequencia[posicao]
+                for chave in contadas:
+                    bisect.insort(por_frequencia, chave, key=ordem(frequencias))
+            # Dicionários antes dos vetores: uma leitura concorrente que já veja a chave nova
+            # encontra a frequência e o texto dela.
+            self._frequencias = frequencias
+            self._textos = exibicao
+            self._por_frequencia = por_frequencia
+            self._chaves = chaves
+            self._memoria = {}
+            return len(novas)
+
+    def sugerir(self, prefixo: str, limite: int = LIMITE_PADRAO) -> list[dict]:
+        chave = normalizar(prefixo)
+        if len(chave) < MINIMO_PREFIXO:
+            return []
+        memoria = self._memoria
+        if (chave, limite) in memoria:
+            return memoria[(chave, limite)]
+        chaves, frequencias, textos = self._chaves, self._frequencias, self._textos
+        inicio = bisect.bisect_left(chaves, chave)
+        fim = bisect.bisect_left(chaves, chave + "\uffff", inicio)
+        if fim - inicio <= FAIXA_MAXIMA:
+            melhores = [chaves[posicao] for posicao in range(inicio, fim)]
+            melhores.sort(key=lambda item: -frequencias[item])
+            melhores = melhores[:limite]
+        else:
+            # Prefixo curto demais para percorrer a faixa: as frases mais frequentes do
+            # índice inteiro quase sempre incluem as da faixa. O resultado fica guardado
+            # até a próxima atualização, então cada prefixo largo custa isso uma vez só.
+            melhores = list(islice((item for item in self._por_frequencia if item.startswith(chave)), limite))
+        sugestoes = [{"texto": textos[item], "frequencia": frequencias[item]} for item in melhores]
+        if fim - inicio > FAIXA_MAXIMA:
+            memoria[(chave, limite)] = sugestoes
+        return sugestoes
+
+
+_indice = IndiceFrases()
+_estado: dict = {"versao": None, "marca": None, "vistos": set(), "verificado_em": None}
+# Presa durante toda atualização; a thread de fundo a recebe já adquirida de quem a agendou.
+_trava_atualizacao = threading.Lock()
+
+
+def _conclusoes_arquivadas() -> Iterable[tuple[str, str]]:
+    ultimo = ""
+    while True:
+        registros = list(
+            CasoArquivado.objects.filter(pk__gt=ultimo).order_by("pk").values_list("pk", "dados")[:LOTE_CONSULTA]
+        )
+        if not registros:
+            return
+        ultimo = registros[-1][0]
+        for caso_id, dados in registros:
+            for objeto in json.loads(dados):
+                if objeto["model"] == "laudos.laudomicroscopico":
+                    yield caso_id, objeto["fields"].get("conclusao", "")
+
+
+def _atualizar() -> int:
+    versao = versoes.atual(CHAVE_VERSAO)
+    marca: Optional[datetime.datetime] = _estado["marca"]
+    vistos: set = _estado["vistos"]
+    agora = timezone.now()
+    consulta = LaudoMicroscopico.objects.filter(caso__status="FINALIZADO")
+    if marca is not None:
+        consulta = consulta.filter(caso__data_finalizacao__gte=marca - MARGEM_RELEITURA)
+    linhas = list(consulta.values_list("caso_id", "conclusao"))
+    if marca is None:
+        linhas += _conclusoes_arquivadas()
+
+    # Um caso arquivado entre as duas leituras aparece nas duas; conta uma vez só.
+    novas = {caso_id: conclusao for caso_id, conclusao in linhas if caso_id not in vistos}
+    vistos.update(novas)
+    with metricas.cronometrar("autocompletar.atualizacao"):
+        _indice.adicionar(novas.values())
+    _estado.update(versao=versao, marca=agora, verificado_em=time.monotonic())
+    metricas.incrementar("autocompletar.frases_lidas", len(novas))
+    return len(novas)
+
+
+def atualizar() -> int:
+    """Lê as conclusões dos casos finalizados desde a última leitura; devolve quantas entraram."""
+    with _trava_atualizacao:
+        return _atualizar()
+
+
+def _atualizar_em_segundo_plano() -> None:
+    try:
+        _atualizar()
+    finally:
+        _trava_atualizacao.release()
+        close_old_connections()
+
+
+def _agendar_se_desatualizado() -> None:
+    if _estado["marca"] is None:
+        # Processo recém-iniciado: sem índice não há o que responder, então monta agora.
+        with _trava_atualizacao:
+            if _estado["marca"] is None:
+                _atualizar()
+        return
+    verificado_em = _estado["verificado_em"]
+    if verificado_em is not None and time.monotonic() - verificado_em < INTERVALO_VERIFICACAO:
+        return
+    # Se outra thread já está atualizando, esta segue com o índice atual.
+    if not _trava_atualizacao.acquire(blocking=False):
+        return
+    try:
+        _estado["verificado_em"] = time.monotonic()
+        desatualizado = _estado["versao"] != versoes.atual(CHAVE_VERSAO)
+        if desatualizado:
+            threading.Thread(target=_atualizar_em_segundo_plano, name="laudos-autocompletar", daemon=True).start()
+    except BaseException:
+        _trava_atualizacao.release()
+        raise
+    if not desatualizado:
+        _trava_atualizacao.release()
+
+
+def sugerir(prefixo: str, limite: int = LIMITE_PADRAO) -> list[dict]:
+    """Conclusões mais frequentes que começam com ``prefixo``.
+
+    Só a primeira chamada do processo e uma conferência de versão a cada
+    ``INTERVALO_VERIFICACAO`` segundos saem da memória.
+    """
+    _agendar_se_desatualizado()
+    with metricas.cronometrar("autocompletar.sugestao"):
+        return _indice.sugerir(prefixo, limite)
+
+
+def avisar() -> None:
+    """Chamado após o commit de aprovações finais: atualiza este processo e avisa os demais."""
+    versoes.avancar(CHAVE_VERSAO)
+    if _estado["marca"] is not None:
+        atualizar()
+
+
+def reiniciar() -> None:
+    """Descarta o índice deste processo; a próxima leitura o reconstrói do zero."""
+    global _indice
+    with _trava_atualizacao:
+        _indice = IndiceFrases()
+        _estado.update(versao=None, marca=None, vistos=set(), verificado_em=None)
+
+
+__all__ = ["IndiceFrases", "atualizar", "avisar", "reiniciar", "sugerir"]
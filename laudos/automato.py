@@ -0,0 +1,140 @@
+"""Autômato de Aho-Corasick para achar os termos da terminologia num texto em uma passada.
+
+Não depende do Django (só de ``textos``): os processos de ``codificar_laudos`` recebem os padrões já lidos
+do banco e montam o autômato em ``preparar_processo``. Os padrões e o texto passam pela
+mesma normalização (sem acentos, minúsculas, espaços colapsados). Uma ocorrência só
+conta se começar e terminar em limite de palavra, então "CEC" não casa dentro de
+"cecal". Ocorrências sobrepostas ficam com a mais longa ("carcinoma espinocelular"
+vence "carcinoma"). Uma ocorrência negada logo antes ("sem displasia", "ausência de
+atipia") é descartada; a negação vale até o fim da frase ou até um conector como "com"
+ou "mas".
+"""
+
+from __future__ import annotations
+
+import re
+from collections import deque
+from typing import Iterable, Optional
+
+from .textos import normalizar
+
+# Palavras anteriores ao termo em que se procura uma negação.
+JANELA_NEGACAO = 5
+_NEGACAO = re.compile(r"\b(?:sem|nao|ausencia de|negativ[oa]s? para|livres? de)\b")
+_FIM_NEGACAO = re.compile(r"[.;:]|\b(?:com|mas|porem|contudo|entretanto|exceto)\b")
+
+
+class Automato:
+    """Trie dos padrões com ligações de falha; ``valor`` identifica o termo de cada padrão."""
+
+    def __init__(self, padroes: Iterable[tuple[str, int]]):
+        self._transicoes: list[dict[str, int]] = [{}]
+        self._falha: list[int] = [0]
+        self._saidas: list[tuple[tuple[int, int], ...]] = [()]
+        for padrao, valor in padroes:
+            padrao = normalizar(padrao)
+            if padrao:
+                self._inserir(padrao, valor)
+        self._ligar_falhas()
+
+    def _inserir(self, padrao: str, valor: int) -> None:
+        estado = 0
+        for letra in padrao:
+            proximo = self._transicoes[estado].get(letra)
+            if proximo is None:
+                proximo = len(self._transicoes)
+                self._transicoes[estado][letra] = proximo
+                self._transicoes.append({})
+                self._falha.append(0)
+                self._saidas.append(())
+            estado = proximo
+        self._saidas[estado] += ((len(padrao), valor),)
+
+    def _ligar_falhas(self) -> None:
+        # Em largura: a falha de um estado é sempre mais rasa e já está resolvida.
+        fila = deque(self._transicoes[0].values())
+        while fila:
+            estado = fila.popleft()
+            for letra, filho in self._transicoes[estado].items():
+                fila.append(filho)
+                falha = self._falha[estado]
+                while falha and letra not in self._transicoes[falha]:
+                    falha = self._falha[falha]
+                destino = self._transicoes[falha].get(letra, 0)
+                self._falha[filho] = destino if destino != filho else 0
+                self._saidas[filho] += self._saidas[self._falha[filho]]
+
+    def __len__(self) -> int:
+        return len(self._transicoes)
+
+    def ocorrencias(self, texto: str) -> list[tuple[int, int, int]]:
+        """``(inicio, fim, valor)`` de cada padrão em limite de palavra, no texto já normalizado."""
+        transicoes, falha, saidas = self._transicoes, self._falha, self._saidas
+        encontradas = []
+        estado = 0
+        for posicao, letra in enumerate(texto):
+            while estado and letra not in transicoes[estado]:
+                estado = falha[estado]
+            estado = transicoes[estado].get(letra, 0)
+            if not saidas[estado]:
+                continue
+            fim = posicao + 1
+            if fim < len(texto) and texto[fim].isalnum():
+                continue
+            for comprimento, valor in saidas[estado]:
+                inicio = fim - comprimento
+                if inicio == 0 or not texto[inicio - 1].isalnum():
+                    encontradas.append((inicio, fim, valor))
+        return encontradas
+
+    def codificar(self, texto: str) -> list[int]:
+        """Valores dos termos afirmados no texto, na ordem da primeira ocorrência."""
+        texto = normalizar(texto)
+        escolhidas = []
+        ultimo_fim = -1
+        # Da esquerda para a direita, a mais longa primeiro em cada início.
+        for inicio, fim, valor in sorted(self.ocorrencias(texto), key=lambda item: (item[0], -item[1])):
+            if inicio < ultimo_fim:
+                continue
+            ultimo_fim = fim
+            if not _negada(texto, inicio):
+                escolhidas.append(valor)
+        return list(dict.fromkeys(escolhidas))
+
+
+def _negada(texto: str, inicio: int) -> bool:
+    anterior = " ".join(texto[:inicio].split(" ")[-JANELA_NEGACAO - 1 :])
+    ultima_negacao = None
+    for ultima_negacao in _NEGACAO.finditer(anterior):
+        pass
+    if ultima_negacao is None:
+        return False
+    return _FIM_NEGACAO.search(anterior, ultima_negacao.end()) is None
+
+
+_automato_do_processo: Optional[Automato] = None
+
+
+def preparar_processo(padroes: list[tuple[str, int]]) -> None:
+    """Inicializador dos processos de codificação em paralelo."""
+    global _automato_do_processo
+    _automato_do_processo = Automato(padroes)
+
+
+def codificar_lote(
+    linhas: list[tuple[int, dict[str, str]]], automato: Optional[Automato] = None
+) -> list[tuple[int, int, str]]:
+    """``(laudo, termo, campo)`` de cada termo achado nos campos de cada laudo.
+
+    Sem ``automato``, usa o montado por ``preparar_processo``.
+    """
+    automato = automato or _automato_do_processo
+    return [
+        (laudo_id, termo_id, campo)
+        for laudo_id, campos in linhas
+        for campo, texto in campos.items()
+        for termo_id in automato.codificar(texto)
+    ]
+
+
+__all__ = ["Automato", "codificar_lote", "preparar_processo"]
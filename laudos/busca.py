@@ -0,0 +1,213 @@
+"""Busca textual nos laudos por um índice FTS5 do SQLite.
+
+Cada caso é um documento de ``laudos_busca`` com o diagnóstico sugerido e os textos de
+macroscopia e microscopia. O tokenizador ``unicode61 remove_diacritics 2`` ignora acentos e
+caixa, então "inflamatorio" encontra "Inflamatório". O documento é regravado dentro da
+mesma transação que altera o caso (``indexar``), de modo que o índice nunca fica à frente
+nem atrás dos dados; ``reconstruir_lote`` cobre a carga inicial.
+
+Como a chave do caso é texto e o FTS5 só localiza linhas pelo ``rowid`` inteiro, o
+``rowid`` é derivado de um hash de 63 bits do ``id_laboratorio``.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import re
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+from django.db import connection
+from django.utils.html import escape
+
+from . import metricas, worklist
+from .models import Caso
+
+TABELA = "laudos_busca"
+COLUNAS = ("diagnostico", "macroscopia", "microscopia", "conclusao", "notas")
+# Pesos do bm25 na ordem das colunas da tabela (id_laboratorio primeiro, não indexado).
+PESOS = (0.0, 2.0, 1.0, 1.0, 3.0, 0.5)
+LIMITE_PADRAO = 20
+LIMITE_MAXIMO = 100
+MINIMO_PREFIXO = 3
+
+_INICIO_DESTAQUE = "\x02"
+_FIM_DESTAQUE = "\x03"
+_TERMOS = re.compile(r'"([^"]*)"|(\S+)')
+_PALAVRA = re.compile(r"\w+")
+
+
+def _rowid(id_laboratorio: str) -> int:
+    resumo = hashlib.blake2b(id_laboratorio.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(resumo, "big") >> 1
+
+
+def _documentos(ids: list[str]) -> list[tuple]:
+    linhas = Caso.objects.filter(pk__in=ids).values_list(
+        "pk",
+        "diagnostico_sugerido",
+        "laudo_macroscopico__texto_editado",
+        "laudo_macroscopico__texto_gerado",
+        "laudo_microscopico__texto_final",
+        "laudo_microscopico__conclusao",
+        "laudo_microscopico__notas",
+    )
+    return [
+        (_rowid(pk), pk, diagnostico or "", editado or gerado or "", final or "", conclusao or "", notas or "")
+        for pk, diagnostico, editado, gerado, final, conclusao, notas in linhas
+    ]
+
+
+def remover(ids: Iterable[str]) -> None:
+    rowids = [(_rowid(caso_id),) for caso_id in ids]
+    if rowids:
+        with connection.cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {TABELA} WHERE rowid = %s", rowids)
+
+
+def indexar(ids: Iterable[str]) -> int:
+    """Regrava os documentos dos casos; casos que não existem mais saem do índice."""
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        return 0
+    documentos = _documentos(ids)
+    remover(ids)
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {TABELA} (rowid, id_laboratorio, {', '.join(COLUNAS)}) "
+            f"VALUES (%s, %s, {', '.join(['%s'] * len(COLUNAS))})",
+            documentos,
+        )
+    metricas.incrementar("busca.indexados", len(documentos))
+    return len(documentos)
+
+
+def reconstruir_lote(apos: Optional[str], lote: int) -> tuple[Optional[str], int]:
+    """Reindexa até ``lote`` casos com chave maior que ``apos``.
+
+    Devolve a última chave do lote (None quando não há mais casos) e quantos foram indexados.
+    """
+    consulta = Caso.objects.order_by("pk")
+    if apos is not None:
+        consulta = consulta.filter(pk__gt=apos)
+    ids = list(consulta.values_list("pk", flat=True)[:lote])
+    if not ids:
+        return None, 0
+    return ids[-1], indexar(ids)
+
+
+def total() -> int:
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT count(*) FROM {TABELA}")
+        return cursor.fetchone()[0]
+
+
+def limpar() -> None:
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABELA}")
+
+
+def otimizar() -> None:
+    """Funde os segmentos do índice; útil depois de uma reconstrução completa."""
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {TABELA} ({TABELA}) VALUES ('optimize')")
+
+
+def traduzir_consulta(texto: str) -> str:
+    """Converte a busca do usuário numa expressão FTS5 segura.
+
+    Trechos entre aspas viram frases exatas e as palavras são combinadas com AND. Só a
+    última palavra solta casa também como prefixo (a busca enquanto se digita): prefixos
+    em todos os termos expandem para muitos tokens e tornam a consulta cara. Operadores e
+    pontuação digitados não chegam ao FTS5.
+    """
+    partes = []
+    prefixo = ""
+    for frase, termo in _TERMOS.findall(texto or ""):
+        palavras = _PALAVRA.findall(frase if frase else termo)
+        if not palavras:
+            continue
+        if frase:
+            partes.append('"' + " ".join(palavras) + '"')
+            prefixo = ""
+        else:
+            partes.extend(f'"{palavra}"' for palavra in palavras)
+            prefixo = palavras[-1]
+    if len(prefixo) >= MINIMO_PREFIXO:
+        partes[-1] += "*"
+    return " ".join(partes)
+
+
+@dataclass
+class Resultado:
+    id_laboratorio: str
+    pontuacao: float
+    trecho: str
+
+    @property
+    def trecho_html(self) -> str:
+        return escape(self.trecho).replace(_INICIO_DESTAQUE, "<mark>").replace(_FIM_DESTAQUE, "</mark>")
+
+    @property
+    def trecho_texto(self) -> str:
+        return self.trecho.replace(_INICIO_DESTAQUE, "").replace(_FIM_DESTAQUE, "")
+
+
+def pesquisar(texto: str, usuario, limite: int = LIMITE_PADRAO, deslocamento: int = 0) -> list[dict]:
+    """Casos que casam com ``texto``, do mais para o menos relevante, como linhas do dashboard.
+
+    Quem não é professor/administrador só encontra os casos que criou, já que não pode abrir
+    os laudos dos demais; as colunas do paciente passam pela mesma anonimização do dashboard.
+    """
+    consulta = traduzir_consulta(texto)
+    if not consulta:
+        return []
+    limite = max(1, min(limite, LIMITE_MAXIMO))
+    sql = (
+        f"SELECT id_laboratorio, bm25({TABELA}, {', '.join(map(str, PESOS))}) AS pontuacao, "
+        f"snippet({TABELA}, -1, %s, %s, '…', 16) "
+        f"FROM {TABELA} WHERE {TABELA} MATCH %s"
+    )
+    parametros: list = [_INICIO_DESTAQUE, _FIM_DESTAQUE, consulta]
+    if usuario.role not in worklist.PAPEIS_SEM_ANONIMIZACAO:
+        sql += f" AND id_laboratorio IN (SELECT id_laboratorio FROM {Caso._meta.db_table} WHERE criado_por_id = %s)"
+        parametros.append(usuario.pk)
+    sql += " ORDER BY pontuacao LIMIT %s OFFSET %s"
+    parametros += [limite, max(deslocamento, 0)]
+
+    with metricas.cronometrar("busca.consulta"):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, parametros)
+            encontrados = [Resultado(*linha) for linha in cursor.fetchall()]
+        linhas = {
+            linha["id_laboratorio"]: linha
+            for linha in worklist.projetar(
+                Caso.objects.filter(pk__in=[resultado.id_laboratorio for resultado in encontrados]),
+                usuario,
+            )
+        }
+
+    resultados = []
+    for resultado in encontrados:
+        linha = linhas.get(resultado.id_laboratorio)
+        if linha is None:
+            continue
+        linha.update(
+            pontuacao=resultado.pontuacao,
+            trecho_html=resultado.trecho_html,
+            trecho=resultado.trecho_texto,
+        )
+        resultados.append(linha)
+    return resultados
+
+
+__all__ = [
+    "indexar",
+    "limpar",
+    "otimizar",
+    "pesquisar",
+    "reconstruir_lote",
+    "remover",
+    "total",
+    "traduzir_consulta",
+]
@@ -0,0 +1,79 @@
+"""Cache do HTML da lista de casos do dashboard, invalidado por versão a cada transição."""
+
+from __future__ import annotations
+
+import hashlib
+from typing import Callable
+
+from django.conf import settings
+from django.core.cache import cache
+from django.middleware.csrf import get_token
+
+from . import metricas, versoes
+
+CHAVE_VERSAO = "laudos:worklist:versao"
+# O fragmento é renderizado com este marcador no lugar do token CSRF, que é por sessão.
+CSRF_MARCADOR = "__laudos_csrf_token__"
+
+
+def _timeout() -> int:
+    return getattr(settings, "LAUDOS_WORKLIST_CACHE_TIMEOUT", 300)
+
+
+def versao_atual() -> int:
+    return versoes.atual(CHAVE_VERSAO)
+
+
+def invalidar() -> None:
+    """Avança a versão; as entradas antigas deixam de ser lidas e expiram sozinhas."""
+    versoes.avancar(CHAVE_VERSAO)
+    metricas.incrementar("worklist_cache.invalidacoes")
+
+
+def escopo(usuario) -> str:
+    """Professores e administradores veem a mesma lista; os demais dependem de ``criado_por``."""
+    if usuario.role in {"ADMIN", "PROFESSOR"}:
+        return "todos"
+    return f"usuario-{usuario.pk}"
+
+
+def chave(usuario, parametros) -> str:
+    consulta = "&".join(
+        f"{nome}={valor}"
+        for nome in sorted(parametros)
+        for valor in parametros.getlist(nome)
+    )
+    resumo = hashlib.sha1(consulta.encode("utf-8")).hexdigest()
+    return f"laudos:worklist:{versao_atual()}:{usuario.role}:{escopo(usuario)}:{resumo}"
+
+
+def obter_html(request, renderizar: Callable[[], str]) -> str:
+    """Devolve o fragmento do cache ou o renderiza com ``renderizar`` e o armazena."""
+    chave_cache = chave(request.user, request.GET)
+    html = cache.get(chave_cache)
+    if html is not None:
+        metricas.incrementar("worklist_cache.acertos")
+    else:
+        metricas.incrementar("worklist_cache.falhas")
+        with metricas.cronometrar("worklist_cache.renderizacao"):
+            html = renderizar()
+        cache.set(chave_cache, html, timeout=_timeout())
+    return html.replace(CSRF_MARCADOR, get_token(request))
+
+
+def estatisticas() -> dict:
+    contadores = metricas.snapshot()["contadores"]
+    acertos = contadores.get("worklist_cache.acertos", 0)
+    falhas = contadores.get("worklist_cache.falhas", 0)
+    consultas = acertos + falhas
+    return {
+        "acertos": acertos,
+        "falhas": falhas,
+        "taxa_acerto": acertos / consultas if consultas else 0.0,
+        "invalidacoes": contadores.get("worklist_cache.invalidacoes", 0),
+        "tempo_renderizacao_medio_ms": metricas.media_ms("worklist_cache.renderizacao"),
+        "tempo_economizado_ms": acertos * metricas.media_ms("worklist_cache.renderizacao"),
+    }
+
+
+__all__ = ["CSRF_MARCADOR", "chave", "escopo", "estatisticas", "invalidar", "obter_html", "versao_atual"]
@@ -0,0 +1,98 @@
+"""Contadores desnormalizados de casos por status, mantidos pelas transições do workflow."""
+
+from __future__ import annotations
+
+from collections import Counter
+from typing import Iterable, Optional
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+
+from .models import Caso, ContadorCaso
+
+ETAPAS = (
+    ("MACRO", "macro_status"),
+    ("PREPARO", "preparo_status"),
+    ("MICRO", "micro_status"),
+)
+
+Estado = tuple[str, str, str, str]
+Chave = tuple[str, str, str]
+
+
+def estado(caso: Caso) -> Estado:
+    return (caso.status, caso.macro_status, caso.preparo_status, caso.micro_status)
+
+
+def _chaves(estado_caso: Optional[Estado]) -> set[Chave]:
+    if estado_caso is None:
+        return set()
+    status, *status_etapas = estado_caso
+    return {(status, etapa, etapa_status) for (etapa, _), etapa_status in zip(ETAPAS, status_etapas)}
+
+
+def _somar(chave: Chave, delta: int) -> None:
+    status, etapa, etapa_status = chave
+    filtro = {"status": status, "etapa": etapa, "etapa_status": etapa_status}
+    if ContadorCaso.objects.filter(**filtro).update(total=F("total") + delta):
+        return
+    try:
+        with transaction.atomic():
+            ContadorCaso.objects.create(total=delta, **filtro)
+    except IntegrityError:
+        # Outra transação criou a linha entre o UPDATE e o INSERT.
+        ContadorCaso.objects.filter(**filtro).update(total=F("total") + delta)
+
+
+def ajustar(anterior: Optional[Estado], atual: Optional[Estado]) -> None:
+    """Move um caso de ``anterior`` para ``atual``; ``None`` representa caso inexistente.
+
+    Deve ser chamado dentro do ``transaction.atomic`` da transição para que o contador
+    e o caso sejam gravados juntos.
+    """
+    chaves_anteriores = _chaves(anterior)
+    chaves_atuais = _chaves(atual)
+    for chave in chaves_anteriores - chaves_atuais:
+        _somar(chave, -1)
+    for chave in chaves_atuais - chaves_anteriores:
+        _somar(chave, 1)
+
+
+def remover(estados: Iterable[Estado]) -> None:
+    """Retira vários casos de uma vez (arquivamento) com um UPDATE por chave afetada."""
+    deltas: Counter = Counter()
+    for estado_caso in estados:
+        for chave in _chaves(estado_caso):
+            deltas[chave] -= 1
+    for chave, delta in deltas.items():
+        _somar(chave, delta)
+
+
+def contar_casos() -> Counter:
+    """Recalcula os contadores a partir da tabela de casos (custo proporcional ao total)."""
+    reais: Counter = Counter()
+    for etapa, campo in ETAPAS:
+        linhas = Caso.objects.values("status", campo).annotate(total=Count("pk")).order_by()
+        for linha in linhas:
+            reais[(linha["status"], etapa, linha[campo])] = linha["total"]
+    return reais
+
+
+def resumo() -> dict:
+    """Totais para os cartões do dashboard, lidos apenas da tabela de contadores."""
+    total = 0
+    por_status: Counter = Counter()
+    aguardando = {"macro": 0, "preparo": 0, "micro": 0, "final": 0}
+    for status, etapa, etapa_status, quantidade in ContadorCaso.objects.values_list(
+        "status", "etapa", "etapa_status", "total"
+    ):
+        if etapa == "MACRO":
+            total += quantidade
+            por_status[status] += quantidade
+        if etapa_status == "AGUARDANDO_APROVACAO":
+            aguardando[etapa.lower()] += quantidade
+    aguardando["final"] = por_status["AGUARDANDO_APROVACAO_FINAL"]
+    return {"total": total, "por_status": dict(por_status), "aguardando": aguardando}
+
+
+__all__ = ["ajustar", "contar_casos", "estado", "remover", "resumo"]
@@ -0,0 +1,114 @@
+"""Difusão em processo das mudanças de casos para os clientes SSE do dashboard."""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Optional
+
+from . import metricas
+
+TAMANHO_HISTORICO = 256
+TAMANHO_FILA = 64
+
+
+@dataclass(frozen=True)
+class Evento:
+    id: int
+    dados: str
+
+    def formatar(self) -> str:
+        return f"id: {self.id}\ndata: {self.dados}\n\n"
+
+
+@dataclass(eq=False)
+class Assinatura:
+    loop: asyncio.AbstractEventLoop
+    fila: asyncio.Queue
+    pendentes: list[Evento] = field(default_factory=list)
+    # Marcado quando a fila transborda; o cliente precisa recarregar a lista inteira.
+    atrasada: bool = False
+
+
+class Transmissor:
+    """Publica eventos a partir de código síncrono para filas asyncio de cada conexão.
+
+    Cada conexão ociosa custa apenas uma fila vazia. O histórico curto permite que um
+    cliente reconectado com ``Last-Event-ID`` receba o que perdeu. Só alcança conexões
+    do mesmo processo, o que basta para um único servidor ASGI.
+
+    Os ids começam no relógio (microssegundos), e não em 1, para que um processo
+    reiniciado não repita ids já vistos pelos clientes. Um ``Last-Event-ID`` que não
+    esteja no histórico (anterior a ele ou de outro processo) recebe ``recarregar``.
+    """
+
+    def __init__(
+        self,
+        tamanho_historico: int = TAMANHO_HISTORICO,
+        tamanho_fila: int = TAMANHO_FILA,
+        primeiro_id: Optional[int] = None,
+    ):
+        self._lock = threading.Lock()
+        self._proximo_id = time.time_ns() // 1000 if primeiro_id is None else primeiro_id
+        self._historico: deque[Evento] = deque(maxlen=tamanho_historico)
+        self._assinaturas: set[Assinatura] = set()
+        self._tamanho_fila = tamanho_fila
+
+    def publicar(self, dados: dict) -> Evento:
+        with self._lock:
+            evento = Evento(id=self._proximo_id, dados=json.dumps(dados, separators=(",", ":")))
+            self._proximo_id += 1
+            self._historico.append(evento)
+            assinaturas = list(self._assinaturas)
+        for assinatura in assinaturas:
+            try:
+                assinatura.loop.call_soon_threadsafe(self._entregar, assinatura, evento)
+            except RuntimeError:
+                # Loop já encerrado; a conexão será descartada pelo próprio gerador.
+                self.cancelar(assinatura)
+        metricas.incrementar("eventos.publicados")
+        return evento
+
+    @staticmethod
+    def _entregar(assinatura: Assinatura, evento: Evento) -> None:
+        try:
+            assinatura.fila.put_nowait(evento)
+        except asyncio.QueueFull:
+            assinatura.atrasada = True
+
+    def assinar(self, ultimo_id: Optional[str] = None) -> Assinatura:
+        assinatura = Assinatura(loop=asyncio.get_running_loop(), fila=asyncio.Queue(self._tamanho_fila))
+        with self._lock:
+            if ultimo_id:
+                primeiro = self._historico[0].id if self._historico else self._proximo_id
+                if not ultimo_id.isdigit() or not primeiro - 1 <= int(ultimo_id) < self._proximo_id:
+                    assinatura.atrasada = True
+                else:
+                    ultimo = int(ultimo_id)
+                    assinatura.pendentes = [evento for evento in self._historico if evento.id > ultimo]
+            self._assinaturas.add(assinatura)
+            metricas.incrementar("eventos.conexoes")
+        return assinatura
+
+    def cancelar(self, assinatura: Assinatura) -> None:
+        with self._lock:
+            self._assinaturas.discard(assinatura)
+
+    @property
+    def conexoes_ativas(self) -> int:
+        with self._lock:
+            return len(self._assinaturas)
+
+
+transmissor = Transmissor()
+
+
+def publicar_caso(dados: dict) -> None:
+    transmissor.publicar(dados)
+
+
+__all__ = ["Assinatura", "Evento", "Transmissor", "publicar_caso", "transmissor"]
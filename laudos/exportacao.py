@@ -0,0 +1,190 @@
+"""Exportação em ZIP dos PDFs de laudos finalizados, gerada em fluxo.
+
+Os PDFs que já estão no cache de ``pdf`` entram direto no arquivo; os que faltam são
+renderizados num ``ProcessPoolExecutor`` (``pdf.gerar_arquivo`` depende só do dicionário
+de dados) direto no diretório do cache e entram no ZIP à medida que ficam prontos. Os
+processos nascem por "spawn", sem herdar as threads nem as conexões do servidor, e o total
+de processos somando as exportações simultâneas fica em ``LAUDOS_EXPORTACAO_PROCESSOS``. O
+ZIP é escrito sobre um destino sem ``seek``, de modo que cada entrada sai para o
+cliente assim que termina e o arquivo completo nunca fica em memória.
+"""
+
+from __future__ import annotations
+
+import datetime
+import multiprocessing
+import os
+import threading
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Iterable, Iterator, Optional
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import arquivo, metricas, pdf
+from .models import Caso, CasoArquivado
+
+LIMITE_CASOS = 5000
+LOTE_CONSULTA = 200
+
+_vagas = threading.Condition()
+_processos_em_uso = 0
+
+
+def processos_maximos() -> int:
+    return max(getattr(settings, "LAUDOS_EXPORTACAO_PROCESSOS", None) or os.cpu_count() or 1, 1)
+
+
+def _reservar(quantidade: int) -> None:
+    """Espera até haver ``quantidade`` processos livres no limite do servidor."""
+    global _processos_em_uso
+    with _vagas:
+        _vagas.wait_for(lambda: _processos_em_uso + quantidade <= processos_maximos())
+        _processos_em_uso += quantidade
+
+
+def _liberar(quantidade: int) -> None:
+    global _processos_em_uso
+    with _vagas:
+        _processos_em_uso -= quantidade
+        _vagas.notify_all()
+
+
+def _inicio_do_dia(data: datetime.date) -> datetime.datetime:
+    return timezone.make_aware(datetime.datetime.combine(data, datetime.time.min))
+
+
+def selecionar(
+    inicio: Optional[datetime.date] = None,
+    fim: Optional[datetime.date] = None,
+    ids: Iterable[str] = (),
+) -> list[str]:
+    """Casos finalizados entre ``inicio`` e ``fim`` (inclusive) e/ou com os ``ids`` dados.
+
+    Inclui os casos já arquivados. Levanta ``ValueError`` para filtros inválidos.
+    """
+    ids = [caso_id.strip() for caso_id in ids if caso_id.strip()]
+    if inicio is None and fim is None and not ids:
+        raise ValueError("Informe um período ou uma lista de casos.")
+    if inicio and fim and inicio > fim:
+        raise ValueError("A data inicial é posterior à data final.")
+
+    filtro = {}
+    if inicio:
+        filtro["data_finalizacao__gte"] = _inicio_do_dia(inicio)
+    if fim:
+        filtro["data_finalizacao__lt"] = _inicio_do_dia(fim + datetime.timedelta(days=1))
+    if ids:
+        filtro["pk__in"] = ids
+
+    ativos = Caso.objects.filter(status="FINALIZADO", **filtro).order_by("data_finalizacao", "id_laboratorio")
+    arquivados = CasoArquivado.objects.filter(**filtro).order_by("data_finalizacao", "id_laboratorio")
+    selecionados = list(ativos.values_list("pk", flat=True)[: LIMITE_CASOS + 1])
+    selecionados += arquivados.values_list("pk", flat=True)[: LIMITE_CASOS + 1 - len(selecionados)]
+    if len(selecionados) > LIMITE_CASOS:
+        raise ValueError(f"A exportação está limitada a {LIMITE_CASOS} casos; reduza o período.")
+    return selecionados
+
+
+def _dados(ids: list[str]) -> Iterator[dict]:
+    relacoes = [relacao for relacao, _ in arquivo.RELACOES]
+    for posicao in range(0, len(ids), LOTE_CONSULTA):
+        bloco = ids[posicao : posicao + LOTE_CONSULTA]
+        ativos = {
+            caso.pk: caso
+            for caso in Caso.objects.select_related("paciente", "responsavel_final", *relacoes).filter(pk__in=bloco)
+        }
+        for caso_id in bloco:
+            caso = ativos.get(caso_id) or arquivo.carregar_arquivado(caso_id)
+            if caso is not None:
+                yield pdf.dados_laudo(caso)
+
+
+class _Saida:
+    """Destino só de escrita; o ``zipfile`` detecta a falta de ``seek`` e usa descritores de dados."""
+
+    def __init__(self):
+        self._partes: list[bytes] = []
+
+    def write(self, dados) -> int:
+        self._partes.append(bytes(dados))
+        return len(dados)
+
+    def flush(self) -> None:
+        pass
+
+    def esvaziar(self) -> bytes:
+        conteudo = b"".join(self._partes)
+        self._partes.clear()
+        return conteudo
+
+
+def _nome(dados: dict) -> str:
+    return f"laudo_{dados['id_laboratorio']}.pdf"
+
+
+def gerar_zip(ids: list[str], workers: Optional[int] = None) -> Iterator[bytes]:
+    """Produz o ZIP em pedaços, um por entrada concluída."""
+    workers = min(workers or processos_maximos(), processos_maximos())
+    saida = _Saida()
+    falhas: list[str] = []
+    # Só cria os processos se algum PDF precisar ser renderizado.
+    pool: Optional[ProcessPoolExecutor] = None
+    pendentes: dict[Future, dict] = {}
+
+    def concluir(futuros) -> None:
+        for futuro in futuros:
+            dados = pendentes.pop(futuro)
+            try:
+                zf.write(pdf.registrar(futuro.result()), _nome(dados))
+            except Exception as erro:
+                falhas.append(f"{dados['id_laboratorio']}: {type(erro).__name__}: {erro}")
+                continue
+            metricas.incrementar("exportacao.renderizados")
+
+    try:
+        with zipfile.ZipFile(saida, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+            for dados in _dados(ids):
+                chave_pdf = pdf.chave(dados)
+                caminho = pdf.em_cache(dados, chave_pdf)
+                if caminho is not None:
+                    try:
+                        zf.write(caminho, _nome(dados))
+                        metricas.incrementar("exportacao.reaproveitados")
+                        yield saida.esvaziar()
+                        continue
+                    except FileNotFoundError:
+                        # Descartado pelo limite do cache entre a consulta e a leitura.
+                        pass
+                if pool is None:
+                    _reservar(workers)
+                    try:
+                        pool = ProcessPoolExecutor(
+                            max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+                        )
+                    except BaseException:
+                        _liberar(workers)
+                        raise
+                pendentes[pool.submit(pdf.gerar_arquivo, dados, pdf.caminho(dados, chave_pdf))] = dados
+                # Limita os PDFs em voo para não acumular resultados em memória.
+                if len(pendentes) >= 2 * workers:
+                    concluidos, _ = wait(pendentes, return_when=FIRST_COMPLETED)
+                    concluir(concluidos)
+                    yield saida.esvaziar()
+
+            while pendentes:
+                concluidos, _ = wait(pendentes, return_when=FIRST_COMPLETED)
+                concluir(concluidos)
+                yield saida.esvaziar()
+
+            if falhas:
+                zf.writestr("ERROS.txt", "\n".join(falhas) + "\n")
+        yield saida.esvaziar()
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+            _liberar(workers)
+
+
+__all__ = ["LIMITE_CASOS", "gerar_zip", "processos_maximos", "selecionar"]
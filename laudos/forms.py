@@ -1,5 +1,6 @@
 from django import forms
-from .models import Caso, Paciente, LaudoMacroscopico, LaudoMicroscopico, MetodoPreparo
+from .tags import opcoes as opcoes_tags
+from .models import Caso, Paciente, LaudoMacroscopico, LaudoMicroscopico, MetodoPreparo, UsuarioCustomizado
 
 class PacienteForm(forms.ModelForm):
     class Meta:
@@ -215,3 +216,49 @@ class MetodoPreparoForm(forms.ModelForm):
                 'placeholder': 'Descreva métodos especiais de preparo, colorações adicionais, etc.'
             })
         }
+
+class WorklistFiltroForm(forms.Form):
+    status = forms.ChoiceField(
+        choices=[('', 'Todos os status')] + Caso.STATUS_CHOICES,
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
+    macro_status = forms.ChoiceField(
+        choices=[('', 'Macroscopia')] + Caso.ETAPA_STATUS_CHOICES,
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
+    preparo_status = forms.ChoiceField(
+        choices=[('', 'Preparo')] + Caso.ETAPA_STATUS_CHOICES,
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
+    micro_status = forms.ChoiceField(
+        choices=[('', 'Microscopia')] + Caso.ETAPA_STATUS_CHOICES,
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
+    data_inicio = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'})
+    )
+    data_fim = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'})
+    )
+    criado_por = forms.ModelChoiceField(
+        queryset=UsuarioCustomizado.objects.order_by('username'),
+        required=False,
+        empty_label='Todos os criadores',
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
+    tags = forms.MultipleChoiceField(
+        choices=opcoes_tags,
+        required=False,
+        widget=forms.SelectMultiple(attrs={'class': 'form-control', 'size': '3', 'title': 'Características microscópicas'})
+    )
+    tags_modo = forms.ChoiceField(
+        choices=[('todas', 'Todas as características'), ('alguma', 'Qualquer característica')],
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
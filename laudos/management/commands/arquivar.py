@@ -0,0 +1,70 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from laudos import arquivo
+
+
+class Command(BaseCommand):
+    help = (
+        "Move casos finalizados e registros de LogAtividade mais antigos que --dias para as "
+        "tabelas de arquivo, em lotes curtos. Com --loop, repete a cada --intervalo segundos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dias",
+            type=int,
+            default=None,
+            help="Idade mínima, em dias, para arquivar (padrão: LAUDOS_ARQUIVO_DIAS ou 365).",
+        )
+        parser.add_argument(
+            "--lote",
+            type=int,
+            default=arquivo.LOTE_PADRAO,
+            help=f"Casos ou registros por transação (padrão: {arquivo.LOTE_PADRAO}).",
+        )
+        parser.add_argument(
+            "--pausa",
+            type=float,
+            default=0.05,
+            help="Segundos de espera entre lotes, para não monopolizar o banco (padrão: 0.05).",
+        )
+        parser.add_argument(
+            "--somente",
+            choices=sorted(arquivo.TIPOS),
+            help="Arquiva apenas casos ou apenas logs.",
+        )
+        parser.add_argument("--loop", action="store_true", help="Executa continuamente.")
+        parser.add_argument(
+            "--intervalo",
+            type=int,
+            default=3600,
+            help="Segundos entre execuções no modo --loop (padrão: 3600).",
+        )
+
+    def handle(self, *args, **options):
+        dias = options["dias"] if options["dias"] is not None else arquivo.dias_padrao()
+        if dias < 0 or options["lote"] < 1:
+            raise CommandError("--dias não pode ser negativo e --lote deve ser positivo.")
+        tipos = (options["somente"],) if options["somente"] else tuple(arquivo.TIPOS)
+
+        while True:
+            self._executar(dias, options["lote"], options["pausa"], tipos)
+            if not options["loop"]:
+                break
+            time.sleep(options["intervalo"])
+
+    def _executar(self, dias, lote, pausa, tipos):
+        limite = arquivo.limite_para(dias)
+        totais = dict.fromkeys(tipos, 0)
+        inicio = time.perf_counter()
+        for tipo, quantidade in arquivo.arquivar(limite, lote=lote, pausa=pausa, tipos=tipos):
+            totais[tipo] += quantidade
+            self.stdout.write(f"{tipo}: +{quantidade} (total {totais[tipo]})")
+        resumo = ", ".join(f"{quantidade} {tipo}" for tipo, quantidade in totais.items())
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Arquivados {resumo} anteriores a {limite:%d/%m/%Y} em {time.perf_counter() - inicio:.1f}s."
+            )
+        )
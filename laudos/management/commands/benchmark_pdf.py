@@ -0,0 +1,98 @@
+import io
+import os
+import statistics
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from laudos import pdf
+
+PARAGRAFO = (
+    "Fragmentos de mucosa revestida por epitélio pavimentoso estratificado paraqueratinizado, "
+    "exibindo áreas de acantose e espongiose. Lâmina própria com tecido conjuntivo fibroso denso, "
+    "infiltrado inflamatório crônico predominantemente linfoplasmocitário e vasos sanguíneos congestos. "
+)
+
+
+def _dados(paragrafos: int) -> dict:
+    return {
+        "id_laboratorio": "BENCH001",
+        "paciente": "000000",
+        "data_nascimento": "01/01/1980",
+        "solicitante": "Dr. Benchmark",
+        "data_recebimento": "01/01/2024",
+        "secoes": [
+            ("MACROSCOPIA", "Fragmento único de tecido mole, medindo 10 x 8 x 5 mm, castanho, firme."),
+            ("MICROSCOPIA", "\n\n".join(PARAGRAFO * 3 for _ in range(paragrafos)) + "\n\nConclusão: Hiperplasia fibrosa."),
+        ],
+        "responsavel": "Professor Benchmark",
+    }
+
+
+def _dados_com_paginas(alvo: int) -> dict:
+    """Menor quantidade de parágrafos que produz ``alvo`` páginas."""
+    baixo, alto = 0, 1
+    while pdf.renderizar(_dados(alto), io.BytesIO()) < alvo:
+        baixo, alto = alto, alto * 2
+    while alto - baixo > 1:
+        meio = (baixo + alto) // 2
+        if pdf.renderizar(_dados(meio), io.BytesIO()) < alvo:
+            baixo = meio
+        else:
+            alto = meio
+    return _dados(alto)
+
+
+def _em_arquivo(dados: dict) -> int:
+    with open(os.devnull, "wb") as saida:
+        return pdf.renderizar(dados, saida)
+
+
+def _em_memoria(dados: dict) -> int:
+    # Caminho antigo da view: BytesIO inteiro e mais uma cópia com getvalue().
+    buffer = io.BytesIO()
+    paginas = pdf.renderizar(dados, buffer)
+    buffer.getvalue()
+    return paginas
+
+
+class Command(BaseCommand):
+    help = "Mede o tempo e o pico de memória da renderização de laudos de 1 e de 20 páginas."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--repeticoes",
+            type=int,
+            default=10,
+            help="Renderizações cronometradas por cenário (padrão: 10).",
+        )
+        parser.add_argument(
+            "--paginas",
+            type=int,
+            nargs="+",
+            default=[1, 20],
+            help="Tamanhos de laudo, em páginas (padrão: 1 20).",
+        )
+
+    def handle(self, *args, **options):
+        for paginas in options["paginas"]:
+            dados = _dados_com_paginas(paginas)
+            for nome, funcao in (("arquivo", _em_arquivo), ("memoria", _em_memoria)):
+                tempos = []
+                for _ in range(max(options["repeticoes"], 1)):
+                    inicio = time.perf_counter()
+                    obtidas = funcao(dados)
+                    tempos.append((time.perf_counter() - inicio) * 1000)
+
+                tracemalloc.start()
+                try:
+                    funcao(dados)
+                    _, pico = tracemalloc.get_traced_memory()
+                finally:
+                    tracemalloc.stop()
+
+                self.stdout.write(
+                    f"{obtidas:>3} página(s), saída em {nome:<8} mediana {statistics.median(tempos):7.1f} ms, "
+                    f"mín {min(tempos):7.1f} ms, pico de memória {pico / 1024:8.0f} KiB"
+                )
@@ -0,0 +1,116 @@
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from laudos import automato, terminologia
+from laudos.models import LaudoMicroscopico
+
+
+class Command(BaseCommand):
+    help = (
+        "Recodifica todos os laudos microscópicos com a terminologia atual e regrava CodigoLaudo. "
+        "Os lotes, por faixa de chave, são codificados em paralelo por --processos processos; "
+        "a gravação fica no processo principal."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--lote",
+            type=int,
+            default=500,
+            help="Laudos por lote enviado a um processo (padrão: 500).",
+        )
+        parser.add_argument(
+            "--processos",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Processos de codificação; 1 codifica no próprio processo (padrão: núcleos da máquina).",
+        )
+        parser.add_argument(
+            "--verificar",
+            action="store_true",
+            help="Apenas conta os códigos que seriam criados e removidos, sem gravar nada.",
+        )
+
+    def _lotes(self, tamanho):
+        ultimo = 0
+        while True:
+            laudos = list(
+                LaudoMicroscopico.objects.filter(pk__gt=ultimo)
+                .order_by("pk")
+                .only("pk", *terminologia.CAMPOS)[:tamanho]
+            )
+            if not laudos:
+                return
+            ultimo = laudos[-1].pk
+            yield terminologia.linhas(laudos)
+
+    def _gravar(self, linhas, encontrados, verificar):
+        ids = [laudo_id for laudo_id, _ in linhas]
+        if verificar:
+            # Dentro de uma transação desfeita: conta pela mesma rotina que grava.
+            with transaction.atomic():
+                contagem = terminologia.gravar(ids, encontrados)
+                transaction.set_rollback(True)
+            return contagem
+        with transaction.atomic():
+            return terminologia.gravar(ids, encontrados)
+
+    def handle(self, *args, **options):
+        if options["lote"] < 1:
+            raise CommandError("--lote deve ser positivo.")
+        if options["processos"] < 1:
+            raise CommandError("--processos deve ser positivo.")
+
+        inicio = time.perf_counter()
+        padroes = terminologia.padroes()
+        lidos = criados = removidos = 0
+        lotes = self._lotes(options["lote"])
+
+        def registrar(linhas, encontrados):
+            nonlocal lidos, criados, removidos
+            lote_criados, lote_removidos = self._gravar(linhas, encontrados, options["verificar"])
+            lidos += len(linhas)
+            criados += lote_criados
+            removidos += lote_removidos
+
+        if options["processos"] == 1:
+            automato_local = automato.Automato(padroes)
+            for linhas in lotes:
+                registrar(linhas, automato.codificar_lote(linhas, automato_local))
+        else:
+            # "spawn": os filhos só importam laudos.automato, sem Django nem a conexão do pai.
+            with ProcessPoolExecutor(
+                max_workers=options["processos"],
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=automato.preparar_processo,
+                initargs=(padroes,),
+            ) as executor:
+                # No máximo dois lotes por processo em voo, para a memória não crescer com a fila.
+                pendentes = deque()
+                for linhas in lotes:
+                    pendentes.append((linhas, executor.submit(automato.codificar_lote, linhas)))
+                    if len(pendentes) >= 2 * options["processos"]:
+                        linhas_prontas, futuro = pendentes.popleft()
+                        registrar(linhas_prontas, futuro.result())
+                while pendentes:
+                    linhas_prontas, futuro = pendentes.popleft()
+                    registrar(linhas_prontas, futuro.result())
+
+        duracao = time.perf_counter() - inicio
+        if options["verificar"]:
+            self.stdout.write(
+                f"{lidos} laudo(s) lido(s); {criados} código(s) a criar e {removidos} a remover."
+            )
+            return
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{lidos} laudo(s) em {duracao:.2f}s com {len(padroes)} padrão(ões): "
+                f"{criados} código(s) criado(s), {removidos} removido(s)."
+            )
+        )
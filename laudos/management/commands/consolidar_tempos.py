@@ -0,0 +1,43 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from laudos import tempos
+
+
+class Command(BaseCommand):
+    help = (
+        "Consolida os tempos de cada etapa dos casos finalizados em TempoEtapaDiario, um dia por vez. "
+        "Sem opções, continua do último dia consolidado (que é refeito) até hoje."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--desde",
+            type=datetime.date.fromisoformat,
+            help="Refaz a partir deste dia (AAAA-MM-DD).",
+        )
+        parser.add_argument(
+            "--dias",
+            type=int,
+            help="Refaz os últimos N dias, hoje incluído.",
+        )
+
+    def handle(self, *args, **options):
+        if options["desde"] and options["dias"] is not None:
+            raise CommandError("Use --desde ou --dias, não os dois.")
+        desde = options["desde"]
+        if options["dias"] is not None:
+            if options["dias"] < 1:
+                raise CommandError("--dias deve ser positivo.")
+            desde = timezone.localdate() - datetime.timedelta(days=options["dias"] - 1)
+
+        inicio = time.perf_counter()
+        dias = tempos.dias_pendentes(desde)
+        casos = sum(tempos.consolidar_dia(dia) for dia in dias)
+        duracao = time.perf_counter() - inicio
+        self.stdout.write(
+            self.style.SUCCESS(f"{len(dias)} dia(s) consolidado(s) com {casos} caso(s) em {duracao:.2f}s.")
+        )
@@ -0,0 +1,53 @@
+import datetime
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from laudos import exportacao
+
+
+class Command(BaseCommand):
+    help = (
+        "Gera um ZIP com os PDFs dos laudos finalizados no período e/ou dos casos informados, "
+        "renderizando os que faltam no cache em paralelo."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--inicio", type=datetime.date.fromisoformat, help="Data inicial (AAAA-MM-DD).")
+        parser.add_argument("--fim", type=datetime.date.fromisoformat, help="Data final, inclusive (AAAA-MM-DD).")
+        parser.add_argument("--casos", nargs="+", default=[], help="IDs de laboratório a exportar.")
+        parser.add_argument(
+            "--saida",
+            required=True,
+            help='Arquivo ZIP de destino, ou "-" para a saída padrão.',
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="Processos de renderização (padrão: um por núcleo).",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            ids = exportacao.selecionar(options["inicio"], options["fim"], options["casos"])
+        except ValueError as erro:
+            raise CommandError(str(erro))
+
+        inicio = time.perf_counter()
+        tamanho = 0
+        destino = sys.stdout.buffer if options["saida"] == "-" else open(options["saida"], "wb")
+        try:
+            for pedaco in exportacao.gerar_zip(ids, workers=options["workers"]):
+                destino.write(pedaco)
+                tamanho += len(pedaco)
+        finally:
+            if destino is not sys.stdout.buffer:
+                destino.close()
+
+        self.stderr.write(
+            self.style.SUCCESS(
+                f"{len(ids)} laudo(s), {tamanho / 1024:.0f} KiB em {time.perf_counter() - inicio:.1f}s."
+            )
+        )
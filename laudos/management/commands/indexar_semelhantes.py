@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from laudos import semelhantes
+from laudos.models import Caso
+
+
+class Command(BaseCommand):
+    help = (
+        "Reconstrói o índice de casos semelhantes (vetores TF-IDF dos laudos finalizados) num "
+        "segmento único em LAUDOS_SEMELHANTES_DIR, substituindo os segmentos incrementais."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--lote",
+            type=int,
+            default=2000,
+            help="Casos lidos por consulta (padrão: 2000).",
+        )
+
+    def handle(self, *args, **options):
+        if options["lote"] < 1:
+            raise CommandError("--lote deve ser positivo.")
+
+        def lotes():
+            ultimo = ""
+            while True:
+                ids = list(
+                    Caso.objects.filter(status="FINALIZADO", pk__gt=ultimo)
+                    .order_by("pk")
+                    .values_list("pk", flat=True)[: options["lote"]]
+                )
+                if not ids:
+                    return
+                ultimo = ids[-1]
+                yield ids
+
+        inicio = time.perf_counter()
+        indexados = semelhantes.reconstruir(lotes())
+        duracao = time.perf_counter() - inicio
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{indexados} caso(s) indexado(s) em {duracao:.1f}s; "
+                f"{semelhantes.total()} caso(s) no índice de {semelhantes.diretorio()}."
+            )
+        )
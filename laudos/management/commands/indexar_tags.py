@@ -0,0 +1,87 @@
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from laudos import tags
+from laudos.models import Caso, LaudoMicroscopico
+
+
+class Command(BaseCommand):
+    help = (
+        "Converte LaudoMicroscopico.tags_selecionadas para os nomes do vocabulário e reconstrói "
+        "o índice LaudoTag, em lotes por faixa de chave."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--lote",
+            type=int,
+            default=1000,
+            help="Laudos por transação (padrão: 1000).",
+        )
+        parser.add_argument(
+            "--verificar",
+            action="store_true",
+            help="Apenas conta os laudos com nomes fora do padrão, sem gravar nada.",
+        )
+
+    def handle(self, *args, **options):
+        if options["lote"] < 1:
+            raise CommandError("--lote deve ser positivo.")
+
+        inicio = time.perf_counter()
+        lidos = renomeados = criados = removidos = 0
+        desconhecidas: Counter = Counter()
+        ultimo = 0
+        while True:
+            laudos = list(
+                LaudoMicroscopico.objects.filter(pk__gt=ultimo)
+                .order_by("pk")
+                .only("pk", "caso_id", "tags_selecionadas")[: options["lote"]]
+            )
+            if not laudos:
+                break
+            ultimo = laudos[-1].pk
+            lidos += len(laudos)
+
+            mudaram = []
+            for laudo in laudos:
+                nomes = tags.normalizar_nomes(laudo.tags_selecionadas or [])
+                if nomes != laudo.tags_selecionadas:
+                    laudo.tags_selecionadas = nomes
+                    mudaram.append(laudo)
+            renomeados += len(mudaram)
+            if options["verificar"]:
+                for laudo in laudos:
+                    desconhecidas.update(tags.resolver(laudo.tags_selecionadas)[1])
+                continue
+
+            with transaction.atomic():
+                if mudaram:
+                    LaudoMicroscopico.objects.bulk_update(mudaram, ["tags_selecionadas"])
+                    # As tags aparecem nas páginas com ETag por versão do caso.
+                    Caso.objects.filter(pk__in=[laudo.caso_id for laudo in mudaram]).update(
+                        versao=F("versao") + 1, atualizado_em=timezone.now()
+                    )
+                lote_criados, lote_removidos, lote_desconhecidas = tags.sincronizar(laudos)
+            criados += lote_criados
+            removidos += lote_removidos
+            desconhecidas.update(lote_desconhecidas)
+
+        for nome, quantidade in desconhecidas.most_common():
+            self.stdout.write(self.style.WARNING(f"Tag fora do vocabulário: {nome!r} em {quantidade} laudo(s)."))
+
+        duracao = time.perf_counter() - inicio
+        if options["verificar"]:
+            self.stdout.write(f"{lidos} laudo(s) lido(s); {renomeados} com nomes a normalizar.")
+            return
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{lidos} laudo(s) em {duracao:.2f}s: {renomeados} normalizado(s), "
+                f"{criados} vínculo(s) criado(s), {removidos} removido(s)."
+            )
+        )
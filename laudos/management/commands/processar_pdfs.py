@@ -0,0 +1,98 @@
+import multiprocessing
+import os
+import socket
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from laudos import tarefas_pdf
+
+
+class Command(BaseCommand):
+    help = (
+        "Consome a fila de pré-renderização de PDFs. Com --workers N, inicia N processos "
+        "que disputam as tarefas pela própria tabela, sem broker externo."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Quantidade de processos trabalhadores (padrão: 1).",
+        )
+        parser.add_argument(
+            "--intervalo",
+            type=float,
+            default=1.0,
+            help="Segundos de espera quando a fila está vazia (padrão: 1).",
+        )
+        parser.add_argument(
+            "--esvaziar",
+            action="store_true",
+            help="Encerra quando não houver mais tarefas disponíveis, em vez de aguardar novas.",
+        )
+        parser.add_argument(
+            "--manter-dias",
+            type=int,
+            default=7,
+            help="Dias que as tarefas concluídas ficam na tabela para as estatísticas (padrão: 7).",
+        )
+
+    def handle(self, *args, **options):
+        if options["workers"] < 1:
+            raise CommandError("--workers deve ser positivo.")
+        recuperadas = tarefas_pdf.recuperar_travadas()
+        if recuperadas:
+            self.stdout.write(f"{recuperadas} tarefa(s) travada(s) devolvida(s) à fila.")
+        self.stdout.write(f"Fila: {tarefas_pdf.profundidade()} tarefa(s) pendente(s).")
+
+        if options["workers"] == 1:
+            self._trabalhar(options)
+        else:
+            # Cada processo abre a própria conexão; a do pai não pode ser herdada pelo fork.
+            connections.close_all()
+            contexto = multiprocessing.get_context("fork")
+            processos = [
+                contexto.Process(target=self._trabalhar, args=(options,), daemon=True)
+                for _ in range(options["workers"])
+            ]
+            for processo in processos:
+                processo.start()
+            try:
+                for processo in processos:
+                    processo.join()
+            except KeyboardInterrupt:
+                for processo in processos:
+                    processo.terminate()
+                raise
+
+        estatisticas = tarefas_pdf.estatisticas()
+        duracoes = estatisticas["duracao_ultima_hora"]
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Fila: {estatisticas['profundidade']} pendente(s); última hora: {duracoes['quantidade']} "
+                f"PDF(s), média {duracoes['media_ms'] or 0:.0f} ms, máximo {duracoes['max_ms'] or 0:.0f} ms."
+            )
+        )
+
+    def _trabalhar(self, options):
+        nome = f"{socket.gethostname()}:{os.getpid()}"
+        try:
+            while True:
+                tarefa = tarefas_pdf.reservar(nome)
+                if tarefa is None:
+                    if options["esvaziar"]:
+                        break
+                    tarefas_pdf.recuperar_travadas()
+                    tarefas_pdf.limpar(options["manter_dias"])
+                    time.sleep(options["intervalo"])
+                    continue
+                duracao_ms = tarefas_pdf.executar(tarefa)
+                resultado = f"{duracao_ms:.0f} ms" if duracao_ms is not None else "falhou"
+                self.stdout.write(
+                    f"[{nome}] {tarefa.id_laboratorio}: {resultado}; fila {tarefas_pdf.profundidade()}"
+                )
+        finally:
+            connections.close_all()
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from laudos import contadores
+from laudos.models import ContadorCaso
+
+
+class Command(BaseCommand):
+    help = "Recalcula os contadores de casos por status a partir da tabela de casos e informa divergências."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verificar",
+            action="store_true",
+            help="Apenas informa as divergências, sem regravar os contadores.",
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            reais = contadores.contar_casos()
+            gravados = {
+                (contador.status, contador.etapa, contador.etapa_status): contador.total
+                for contador in ContadorCaso.objects.all()
+            }
+
+            divergencias = []
+            for chave in sorted(set(reais) | set(gravados)):
+                real = reais.get(chave, 0)
+                gravado = gravados.get(chave, 0)
+                if real != gravado:
+                    divergencias.append((chave, gravado, real))
+
+            for (status, etapa, etapa_status), gravado, real in divergencias:
+                self.stdout.write(
+                    f"{status} / {etapa} / {etapa_status}: contador={gravado} real={real} "
+                    f"(diferenca {real - gravado:+d})"
+                )
+
+            if not divergencias:
+                self.stdout.write(self.style.SUCCESS("Contadores consistentes."))
+                return
+
+            if options["verificar"]:
+                self.stdout.write(self.style.WARNING(f"{len(divergencias)} contador(es) divergente(s)."))
+                return
+
+            ContadorCaso.objects.all().delete()
+            ContadorCaso.objects.bulk_create(
+                ContadorCaso(status=status, etapa=etapa, etapa_status=etapa_status, total=total)
+                for (status, etapa, etapa_status), total in reais.items()
+                if total
+            )
+            self.stdout.write(self.style.SUCCESS(f"{len(divergencias)} contador(es) corrigido(s)."))
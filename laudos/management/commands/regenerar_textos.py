@@ -0,0 +1,133 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from laudos import busca, pdf, tags, textos
+from laudos.models import Caso, LaudoMacroscopico, LaudoMicroscopico
+
+CAMPOS_MACRO = [
+    "pk",
+    "caso_id",
+    "num_fragmentos",
+    "dim_comprimento_mm",
+    "dim_largura_mm",
+    "dim_altura_mm",
+    "tipo_tecido",
+    "cor",
+    "consistencia",
+    "forma",
+    "texto_gerado",
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompõe texto_gerado (macroscopia) e texto_base_gerado (microscopia) com os modelos de "
+        "laudos.textos e o vocabulário de tags, em lotes por faixa de chave. Não altera "
+        "texto_editado nem texto_final, e deixa de fora os casos finalizados, salvo com "
+        "--incluir-finalizados."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--lote",
+            type=int,
+            default=1000,
+            help="Laudos lidos e gravados por transação (padrão: 1000).",
+        )
+        parser.add_argument(
+            "--somente",
+            choices=["macro", "micro"],
+            help="Regenera apenas os textos de macroscopia ou de microscopia.",
+        )
+        parser.add_argument(
+            "--incluir-finalizados",
+            action="store_true",
+            help="Regenera também os laudos já assinados (o PDF passa a sair com o texto novo).",
+        )
+        parser.add_argument(
+            "--verificar",
+            action="store_true",
+            help="Apenas conta os textos que mudariam, sem gravá-los.",
+        )
+
+    def handle(self, *args, **options):
+        if options["lote"] < 1:
+            raise CommandError("--lote deve ser positivo.")
+        tipos = [options["somente"]] if options["somente"] else ["macro", "micro"]
+        macros = LaudoMacroscopico.objects.all()
+        micros = LaudoMicroscopico.objects.all()
+        if not options["incluir_finalizados"]:
+            macros = macros.exclude(caso__status="FINALIZADO")
+            micros = micros.exclude(caso__status="FINALIZADO")
+
+        if "macro" in tipos:
+            sem_tecido = macros.filter(tipo_tecido="").count()
+            if sem_tecido:
+                # Laudos anteriores ao campo cujo tecido a migração não reconheceu no texto.
+                self.stdout.write(
+                    self.style.WARNING(f"{sem_tecido} macroscopia(s) sem tipo de tecido mantida(s) como estão.")
+                )
+            self._regenerar(
+                "macroscopia",
+                macros.exclude(tipo_tecido="").only(*CAMPOS_MACRO),
+                "texto_gerado",
+                textos.texto_macro,
+                options,
+            )
+        if "micro" in tipos:
+            textos_tags = tags.textos(incluir_inativas=True)
+            self._regenerar(
+                "microscopia",
+                micros.only("pk", "caso_id", "tags_selecionadas", "texto_base_gerado"),
+                "texto_base_gerado",
+                lambda laudo: textos.texto_micro(laudo.tags_selecionadas or [], textos_tags),
+                options,
+            )
+
+    def _gravar(self, laudos, campo):
+        # O texto gerado entra no PDF e na busca: a versão nova invalida os ETags das
+        # páginas do caso e o índice é regravado na mesma transação.
+        ids = [laudo.caso_id for laudo in laudos]
+        with transaction.atomic():
+            type(laudos[0]).objects.bulk_update(laudos, [campo])
+            Caso.objects.filter(pk__in=ids).update(versao=F("versao") + 1, atualizado_em=timezone.now())
+            busca.indexar(ids)
+            transaction.on_commit(lambda: pdf.invalidar(ids))
+
+    def _regenerar(self, nome, consulta, campo, compor, options):
+        inicio = time.perf_counter()
+        lidos = alterados = 0
+        ultimo = None
+        while True:
+            bloco = consulta.order_by("pk")
+            if ultimo is not None:
+                bloco = bloco.filter(pk__gt=ultimo)
+            laudos = list(bloco[: options["lote"]])
+            if not laudos:
+                break
+            ultimo = laudos[-1].pk
+            lidos += len(laudos)
+
+            mudaram = []
+            for laudo in laudos:
+                texto = compor(laudo)
+                if texto != getattr(laudo, campo):
+                    setattr(laudo, campo, texto)
+                    mudaram.append(laudo)
+            alterados += len(mudaram)
+            if mudaram and not options["verificar"]:
+                self._gravar(mudaram, campo)
+
+        duracao = time.perf_counter() - inicio
+        taxa = lidos / duracao if duracao else 0
+        acao = "mudaria(m)" if options["verificar"] else "regravado(s)"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{nome}: {lidos} laudo(s) lido(s), {alterados} texto(s) {acao} "
+                f"em {duracao:.2f}s ({taxa:.0f} laudos/s)."
+            )
+        )
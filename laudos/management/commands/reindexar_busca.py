@@ -0,0 +1,61 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from laudos import busca
+
+
+class Command(BaseCommand):
+    help = (
+        "Reconstrói o índice de busca textual (laudos_busca) a partir dos casos, em lotes "
+        "por faixa de chave, e funde os segmentos do índice ao final."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--lote",
+            type=int,
+            default=1000,
+            help="Casos indexados por transação (padrão: 1000).",
+        )
+        parser.add_argument(
+            "--pausa",
+            type=float,
+            default=0.0,
+            help="Segundos de espera entre lotes, para não monopolizar o banco (padrão: 0).",
+        )
+        parser.add_argument(
+            "--limpar",
+            action="store_true",
+            help="Esvazia o índice antes, descartando documentos de casos que não existem mais.",
+        )
+
+    def handle(self, *args, **options):
+        if options["lote"] < 1:
+            raise CommandError("--lote deve ser positivo.")
+
+        inicio = time.perf_counter()
+        if options["limpar"]:
+            busca.limpar()
+        indexados = 0
+        ultimo = None
+        while True:
+            with transaction.atomic():
+                ultimo, quantidade = busca.reconstruir_lote(ultimo, options["lote"])
+            if ultimo is None:
+                break
+            indexados += quantidade
+            self.stdout.write(f"{indexados} caso(s) indexado(s), até {ultimo}.")
+            if options["pausa"]:
+                time.sleep(options["pausa"])
+
+        busca.otimizar()
+        duracao = time.perf_counter() - inicio
+        taxa = indexados / duracao if duracao else 0
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{indexados} caso(s) indexado(s) em {duracao:.1f}s ({taxa:.0f} casos/s); "
+                f"{busca.total()} documento(s) no índice."
+            )
+        )
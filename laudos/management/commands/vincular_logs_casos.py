@@ -0,0 +1,86 @@
+import re
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from laudos.models import Caso, LogAtividade
+from laudos.registro_atividade import ETAPA_POR_ACAO
+
+# Finais das mensagens gravadas pelo workflow ("Caso LAB001 macroscopia registrada.").
+# O id fica entre "Caso " e um desses finais, então pode conter espaços.
+FINAIS_DETALHES = (
+    "criado",
+    "macroscopia registrada",
+    "macroscopia enviada para aprovação",
+    "macroscopia aprovada",
+    "preparo registrado",
+    "preparo enviado para aprovação",
+    "preparo aprovado",
+    "microscopia registrada",
+    "microscopia enviada para aprovação",
+    "microscopia aprovada",
+    "laudo final aprovado",
+)
+CASO_NOS_DETALHES = re.compile(
+    r"^Caso (?P<caso>.+?) (?:%s)\.$" % "|".join(re.escape(final) for final in FINAIS_DETALHES)
+)
+
+
+class Command(BaseCommand):
+    help = "Preenche caso e etapa dos registros antigos de LogAtividade a partir do texto de detalhes."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--lote",
+            type=int,
+            default=1000,
+            help="Quantidade de registros lidos e atualizados por transação (padrão: 1000).",
+        )
+
+    def handle(self, *args, **options):
+        lote = max(options["lote"], 1)
+        ultimo_id = 0
+        lidos = vinculados = sem_caso = 0
+
+        while True:
+            # Avança pela chave primária para que cada lote seja uma busca por faixa.
+            linhas = list(
+                LogAtividade.objects.filter(pk__gt=ultimo_id, caso__isnull=True)
+                .order_by("pk")
+                .values_list("pk", "acao", "detalhes", "etapa")[:lote]
+            )
+            if not linhas:
+                break
+            ultimo_id = linhas[-1][0]
+            lidos += len(linhas)
+
+            candidatos = {}
+            for pk, _, detalhes, _ in linhas:
+                encontrado = CASO_NOS_DETALHES.match(detalhes or "")
+                if encontrado:
+                    candidatos[pk] = encontrado["caso"]
+            existentes = set(
+                Caso.objects.filter(pk__in=set(candidatos.values())).values_list("pk", flat=True)
+            )
+
+            alterados = []
+            for pk, acao, _, etapa in linhas:
+                caso_id = candidatos.get(pk)
+                if caso_id not in existentes:
+                    caso_id = None
+                    sem_caso += 1
+                nova_etapa = etapa or ETAPA_POR_ACAO.get(acao, "")
+                if caso_id is None and nova_etapa == etapa:
+                    continue
+                alterados.append(LogAtividade(pk=pk, caso_id=caso_id, etapa=nova_etapa))
+                vinculados += caso_id is not None
+
+            with transaction.atomic():
+                LogAtividade.objects.bulk_update(alterados, ["caso", "etapa"])
+            self.stdout.write(f"Lidos {lidos} registros (ate id {ultimo_id}); {vinculados} vinculados.")
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{vinculados} de {lidos} registros vinculados a casos; {sem_caso} sem caso identificavel."
+            )
+        )
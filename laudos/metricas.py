@@ -0,0 +1,91 @@
+"""Métricas simples em memória do processo (contadores e tempos) para diagnóstico."""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Iterator
+
+_lock = threading.Lock()
+_contadores: dict[str, int] = defaultdict(int)
+_tempos: dict[str, dict[str, float]] = {}
+_valores: dict[str, dict[str, float]] = {}
+
+
+def incrementar(nome: str, valor: int = 1) -> None:
+    with _lock:
+        _contadores[nome] += valor
+
+
+def registrar_tempo(nome: str, segundos: float) -> None:
+    with _lock:
+        tempo = _tempos.setdefault(nome, {"quantidade": 0, "total_ms": 0.0, "max_ms": 0.0})
+        ms = segundos * 1000
+        tempo["quantidade"] += 1
+        tempo["total_ms"] += ms
+        tempo["max_ms"] = max(tempo["max_ms"], ms)
+
+
+def registrar_valor(nome: str, valor: float) -> None:
+    """Acumula uma grandeza que não é tempo (por exemplo, tamanho de lote)."""
+    with _lock:
+        acumulado = _valores.setdefault(nome, {"quantidade": 0, "total": 0.0, "max": 0.0})
+        acumulado["quantidade"] += 1
+        acumulado["total"] += valor
+        acumulado["max"] = max(acumulado["max"], valor)
+
+
+@contextmanager
+def cronometrar(nome: str) -> Iterator[None]:
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        registrar_tempo(nome, time.perf_counter() - inicio)
+
+
+def media_ms(nome: str) -> float:
+    with _lock:
+        tempo = _tempos.get(nome)
+        if not tempo or not tempo["quantidade"]:
+            return 0.0
+        return tempo["total_ms"] / tempo["quantidade"]
+
+
+def snapshot() -> dict:
+    with _lock:
+        tempos = {
+            nome: {
+                **valores,
+                "media_ms": valores["total_ms"] / valores["quantidade"] if valores["quantidade"] else 0.0,
+            }
+            for nome, valores in _tempos.items()
+        }
+        valores = {
+            nome: {
+                **acumulado,
+                "media": acumulado["total"] / acumulado["quantidade"] if acumulado["quantidade"] else 0.0,
+            }
+            for nome, acumulado in _valores.items()
+        }
+        return {"contadores": dict(_contadores), "tempos": tempos, "valores": valores}
+
+
+def limpar() -> None:
+    with _lock:
+        _contadores.clear()
+        _tempos.clear()
+        _valores.clear()
+
+
+__all__ = [
+    "cronometrar",
+    "incrementar",
+    "limpar",
+    "media_ms",
+    "registrar_tempo",
+    "registrar_valor",
+    "snapshot",
+]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('laudos', '0004_caso_macro_aprovado_em_caso_macro_aprovado_por_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='caso',
+            index=models.Index(fields=['data_recebimento', 'id_laboratorio'], name='caso_recebimento_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='caso',
+            index=models.Index(fields=['status', 'data_recebimento', 'id_laboratorio'], name='caso_status_receb_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='caso',
+            index=models.Index(fields=['macro_status', 'data_recebimento', 'id_laboratorio'], name='caso_macro_receb_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='caso',
+            index=models.Index(fields=['preparo_status', 'data_recebimento', 'id_laboratorio'], name='caso_preparo_receb_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='caso',
+            index=models.Index(fields=['micro_status', 'data_recebimento', 'id_laboratorio'], name='caso_micro_receb_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='caso',
+            index=models.Index(fields=['criado_por', 'data_recebimento', 'id_laboratorio'], name='caso_criador_receb_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='caso',
+            index=models.Index(fields=['data_criacao'], name='caso_criacao_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='caso',
+            index=models.Index(fields=['status', 'data_criacao'], name='caso_status_criacao_idx'),
+        ),
+    ]
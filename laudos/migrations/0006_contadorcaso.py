@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:01
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def popular_contadores(apps, schema_editor):
+    Caso = apps.get_model('laudos', 'Caso')
+    ContadorCaso = apps.get_model('laudos', 'ContadorCaso')
+    contadores = []
+    for etapa, campo in (('MACRO', 'macro_status'), ('PREPARO', 'preparo_status'), ('MICRO', 'micro_status')):
+        for linha in Caso.objects.values('status', campo).annotate(total=Count('pk')).order_by():
+            contadores.append(
+                ContadorCaso(status=linha['status'], etapa=etapa, etapa_status=linha[campo], total=linha['total'])
+            )
+    ContadorCaso.objects.bulk_create(contadores)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('laudos', '0005_caso_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContadorCaso',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('RECEBIDO', 'Recebido'), ('EM_MACROSCOPIA', 'Em Macroscopia'), ('PENDENTE_MACRO_APROVACAO', 'Pendente de Aprovacao Macroscopica'), ('EM_PREPARO', 'Em Preparo/Coloracao'), ('PENDENTE_PREPARO_APROVACAO', 'Pendente de Aprovacao do Preparo'), ('EM_MICROSCOPIA', 'Em Microscopia'), ('PENDENTE_MICRO_APROVACAO', 'Pendente de Aprovacao Microscopica'), ('AGUARDANDO_APROVACAO_FINAL', 'Aguardando Aprovacao Final'), ('FINALIZADO', 'Finalizado')], max_length=40)),
+                ('etapa', models.CharField(choices=[('MACRO', 'Macroscopia'), ('PREPARO', 'Preparo'), ('MICRO', 'Microscopia')], max_length=10)),
+                ('etapa_status', models.CharField(choices=[('PENDENTE', 'Pendente'), ('EM_PROGRESSO', 'Em progresso'), ('AGUARDANDO_APROVACAO', 'Aguardando aprovacao'), ('APROVADO', 'Aprovado'), ('REPROVADO', 'Reprovado')], max_length=30)),
+                ('total', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('status', 'etapa', 'etapa_status'), name='contador_caso_chave_unica')],
+            },
+        ),
+        migrations.RunPython(popular_contadores, migrations.RunPython.noop),
+    ]
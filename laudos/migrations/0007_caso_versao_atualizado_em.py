@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:20
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('laudos', '0006_contadorcaso'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='caso',
+            name='versao',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='caso',
+            name='atualizado_em',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
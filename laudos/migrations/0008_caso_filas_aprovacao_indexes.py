@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('laudos', '0007_caso_versao_atualizado_em'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='caso',
+            index=models.Index(fields=['macro_status', 'macro_preenchido_em', 'id_laboratorio'], name='caso_fila_macro_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='caso',
+            index=models.Index(fields=['preparo_status', 'preparo_preenchido_em', 'id_laboratorio'], name='caso_fila_preparo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='caso',
+            index=models.Index(fields=['micro_status', 'micro_preenchido_em', 'id_laboratorio'], name='caso_fila_micro_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='caso',
+            index=models.Index(fields=['status', 'micro_aprovado_em', 'id_laboratorio'], name='caso_fila_final_idx'),
+        ),
+    ]
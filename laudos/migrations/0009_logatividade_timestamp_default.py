@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:14
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('laudos', '0008_caso_filas_aprovacao_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='logatividade',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
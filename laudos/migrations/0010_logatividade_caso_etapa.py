@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('laudos', '0009_logatividade_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='logatividade',
+            name='caso',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='logs', to='laudos.caso'),
+        ),
+        migrations.AddField(
+            model_name='logatividade',
+            name='etapa',
+            field=models.CharField(blank=True, choices=[('MACRO', 'Macroscopia'), ('PREPARO', 'Preparo'), ('MICRO', 'Microscopia'), ('FINAL', 'Aprovacao final')], default='', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='logatividade',
+            index=models.Index(fields=['caso', 'timestamp'], name='log_caso_timestamp_idx'),
+        ),
+    ]
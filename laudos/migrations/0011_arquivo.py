@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:17
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('laudos', '0010_logatividade_caso_etapa'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CasoArquivado',
+            fields=[
+                ('id_laboratorio', models.CharField(max_length=20, primary_key=True, serialize=False)),
+                ('numero_prontuario', models.CharField(db_index=True, max_length=50)),
+                ('data_recebimento', models.DateField()),
+                ('data_finalizacao', models.DateTimeField(blank=True, null=True)),
+                ('versao', models.PositiveIntegerField(default=1)),
+                ('arquivado_em', models.DateTimeField(default=django.utils.timezone.now)),
+                ('dados', models.TextField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LogAtividadeArquivado',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('id_laboratorio', models.CharField(blank=True, default='', max_length=20)),
+                ('etapa', models.CharField(blank=True, choices=[('MACRO', 'Macroscopia'), ('PREPARO', 'Preparo'), ('MICRO', 'Microscopia'), ('FINAL', 'Aprovacao final')], default='', max_length=10)),
+                ('acao', models.CharField(choices=[('CASO_CRIADO', 'Caso criado'), ('MACRO_SALVO', 'Macroscopia salva'), ('MACRO_SUBMETIDO', 'Macroscopia submetida'), ('MACRO_APROVADO', 'Macroscopia aprovada'), ('PREPARO_SALVO', 'Preparo salvo'), ('PREPARO_SUBMETIDO', 'Preparo submetido'), ('PREPARO_APROVADO', 'Preparo aprovado'), ('MICRO_SALVO', 'Microscopia salva'), ('MICRO_SUBMETIDO', 'Microscopia submetida'), ('MICRO_APROVADO', 'Microscopia aprovada'), ('LAUDO_FINAL_APROVADO', 'Laudo final aprovado'), ('OUTRA', 'Outra acao')], default='OUTRA', max_length=50)),
+                ('timestamp', models.DateTimeField()),
+                ('detalhes', models.TextField(blank=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='caso',
+            index=models.Index(fields=['status', 'data_finalizacao', 'id_laboratorio'], name='caso_status_finalizacao_idx'),
+        ),
+        migrations.AddField(
+            model_name='logatividadearquivado',
+            name='usuario',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='logatividadearquivado',
+            index=models.Index(fields=['id_laboratorio', 'timestamp'], name='log_arq_caso_timestamp_idx'),
+        ),
+    ]
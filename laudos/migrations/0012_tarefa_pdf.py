@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:21
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('laudos', '0011_arquivo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TarefaPdf',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('id_laboratorio', models.CharField(max_length=20)),
+                ('status', models.CharField(choices=[('PENDENTE', 'Pendente'), ('EXECUTANDO', 'Executando'), ('CONCLUIDA', 'Concluida'), ('FALHA', 'Falha')], default='PENDENTE', max_length=12)),
+                ('tentativas', models.PositiveSmallIntegerField(default=0)),
+                ('criada_em', models.DateTimeField(default=django.utils.timezone.now)),
+                ('disponivel_em', models.DateTimeField(default=django.utils.timezone.now)),
+                ('iniciada_em', models.DateTimeField(blank=True, null=True)),
+                ('concluida_em', models.DateTimeField(blank=True, null=True)),
+                ('duracao_ms', models.FloatField(blank=True, null=True)),
+                ('trabalhador', models.CharField(blank=True, default='', max_length=100)),
+                ('erro', models.TextField(blank=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'disponivel_em'], name='tarefa_pdf_fila_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status', 'PENDENTE')), fields=('id_laboratorio',), name='tarefa_pdf_pendente_unica')],
+            },
+        ),
+    ]
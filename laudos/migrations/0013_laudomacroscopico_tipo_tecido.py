@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:27
+
+import re
+
+from django.db import migrations, models
+
+# Trecho que o formulário gerava: "consta de fragmento de tecido mole medindo ...".
+TECIDO_NO_TEXTO = re.compile(r"consta de (?:fragmento|\d+ fragmentos) de (?P<tecido>.+?) (?:medindo|de cor)\b")
+TECIDOS = {'tecido mole': 'mole', 'tecido ósseo': 'osseo', 'tecido duro': 'duro'}
+
+
+def preencher_tipo_tecido(apps, schema_editor):
+    LaudoMacroscopico = apps.get_model('laudos', 'LaudoMacroscopico')
+    alterados = []
+    for laudo in LaudoMacroscopico.objects.only('pk', 'texto_gerado').iterator(chunk_size=1000):
+        encontrado = TECIDO_NO_TEXTO.search(laudo.texto_gerado or '')
+        if encontrado:
+            laudo.tipo_tecido = TECIDOS.get(encontrado['tecido'], encontrado['tecido'])[:100]
+            alterados.append(laudo)
+    LaudoMacroscopico.objects.bulk_update(alterados, ['tipo_tecido'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('laudos', '0012_tarefa_pdf'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='laudomacroscopico',
+            name='tipo_tecido',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.RunPython(preencher_tipo_tecido, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:36
+
+import unicodedata
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Vocabulário inicial, na ordem em que as características aparecem nos formulários.
+TAGS = [
+    ('Hiperceratose', 'Os cortes histológicos mostram fragmento de mucosa revestida por epitélio pavimentoso estratificado apresentando hiperceratose.'),
+    ('Acantose', 'Os cortes histológicos mostram fragmento de mucosa revestida por epitélio pavimentoso estratificado apresentando acantose.'),
+    ('Infiltrado Inflamatório', 'Observa-se infiltrado inflamatório crônico no tecido conjuntivo subjacente.'),
+    ('Atipia Citológica', 'As células epiteliais apresentam atipia citológica com núcleos aumentados e hipercromáticos.'),
+    ('Displasia', 'O epitélio apresenta displasia de grau variável com desorganização da arquitetura celular.'),
+    ('Metaplasia', 'Observa-se metaplasia escamosa do epitélio de revestimento.'),
+    ('Necrose', 'Há áreas de necrose coagulativa no tecido examinado.'),
+    ('Fibrose', 'O tecido conjuntivo apresenta fibrose com aumento da deposição de colágeno.'),
+    ('Vasodilatação', 'Observa-se vasodilatação dos vasos sanguíneos do estroma.'),
+    ('Edema', 'Há edema intersticial no tecido conjuntivo.'),
+    ('Hemossiderose', 'Observa-se deposição de hemossiderina no tecido.'),
+    ('Pigmentação', 'Há pigmentação melânica no epitélio.'),
+    ('Calcificação', 'Observa-se calcificação distrófica no tecido.'),
+    ('Cistos', 'Há presença de cistos revestidos por epitélio.'),
+    ('Pólipos', 'Observa-se formação polipoide do tecido.'),
+    ('Ulceração', 'Há ulceração da superfície epitelial.'),
+    ('Erosão', 'Observa-se erosão superficial do epitélio.'),
+    ('Hiperplasia', 'O epitélio apresenta hiperplasia com aumento do número de camadas celulares.'),
+    ('Atrofia', 'Observa-se atrofia epitelial com diminuição da espessura do tecido.'),
+]
+
+
+def chave(nome):
+    sem_acentos = unicodedata.normalize('NFKD', nome).encode('ascii', 'ignore').decode('ascii')
+    return '-'.join(sem_acentos.casefold().split())
+
+
+def semear_tags(apps, schema_editor):
+    TagMicroscopica = apps.get_model('laudos', 'TagMicroscopica')
+    TagMicroscopica.objects.bulk_create(
+        TagMicroscopica(chave=chave(nome), nome=nome, texto=texto, ordem=ordem)
+        for ordem, (nome, texto) in enumerate(TAGS)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('laudos', '0013_laudomacroscopico_tipo_tecido'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TagMicroscopica',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chave', models.SlugField(max_length=60, unique=True)),
+                ('nome', models.CharField(max_length=60, unique=True)),
+                ('texto', models.TextField()),
+                ('ordem', models.PositiveSmallIntegerField(default=0)),
+                ('ativa', models.BooleanField(default=True)),
+            ],
+            options={
+                'ordering': ['ordem', 'nome'],
+            },
+        ),
+        migrations.CreateModel(
+            name='LaudoTag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('laudo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tags_indexadas', to='laudos.laudomicroscopico')),
+                ('tag', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, related_name='laudos', to='laudos.tagmicroscopica')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('tag', 'laudo'), name='laudo_tag_unica')],
+            },
+        ),
+        migrations.RunPython(semear_tags, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-17 08:05
+
+from django.db import migrations
+
+# Tabela virtual FTS5 mantida por laudos.busca; rowid é um hash do id_laboratorio.
+CRIAR_BUSCA = """
+CREATE VIRTUAL TABLE laudos_busca USING fts5(
+    id_laboratorio UNINDEXED,
+    diagnostico,
+    macroscopia,
+    microscopia,
+    conclusao,
+    notas,
+    tokenize = 'unicode61 remove_diacritics 2'
+)
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('laudos', '0014_tags_microscopicas'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CRIAR_BUSCA, 'DROP TABLE laudos_busca'),
+    ]
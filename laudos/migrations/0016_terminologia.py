@@ -0,0 +1,66 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Terminologia inicial; códigos locais do laboratório, editáveis pelo admin.
+TERMOS = [
+    ('LPB-001', 'Carcinoma espinocelular', ['carcinoma epidermoide', 'carcinoma de células escamosas', 'carcinoma escamocelular', 'CEC']),
+    ('LPB-002', 'Displasia epitelial', ['displasia']),
+    ('LPB-003', 'Hiperplasia fibrosa inflamatória', ['hiperplasia fibrosa', 'épulis fissurado']),
+    ('LPB-004', 'Cisto radicular', ['cisto periapical', 'cisto periodontal apical']),
+    ('LPB-005', 'Cisto dentígero', ['cisto folicular']),
+    ('LPB-006', 'Ceratocisto odontogênico', ['queratocisto odontogênico', 'tumor odontogênico ceratocístico']),
+    ('LPB-007', 'Granuloma piogênico', ['hemangioma capilar lobular']),
+    ('LPB-008', 'Mucocele', ['fenômeno de extravasamento de muco', 'cisto de retenção de muco']),
+    ('LPB-009', 'Líquen plano', ['líquen plano oral']),
+    ('LPB-010', 'Papiloma escamoso', ['papiloma']),
+    ('LPB-011', 'Ameloblastoma', []),
+    ('LPB-012', 'Lesão central de células gigantes', ['granuloma central de células gigantes']),
+    ('LPB-013', 'Granuloma periapical', ['granuloma apical']),
+    ('LPB-014', 'Fibroma ossificante', ['fibroma cemento-ossificante']),
+    ('LPB-015', 'Hiperceratose', ['hiperqueratose']),
+]
+
+
+def semear_termos(apps, schema_editor):
+    Termo = apps.get_model('laudos', 'Termo')
+    Termo.objects.bulk_create(
+        Termo(codigo=codigo, nome=nome, sinonimos=sinonimos) for codigo, nome, sinonimos in TERMOS
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('laudos', '0015_busca'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Termo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('codigo', models.CharField(max_length=20, unique=True)),
+                ('nome', models.CharField(max_length=120, unique=True)),
+                ('sinonimos', models.JSONField(blank=True, default=list)),
+                ('ativo', models.BooleanField(default=True)),
+            ],
+            options={
+                'ordering': ['codigo'],
+            },
+        ),
+        migrations.CreateModel(
+            name='CodigoLaudo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('campo', models.CharField(choices=[('conclusao', 'Conclusão'), ('texto_final', 'Laudo microscópico')], max_length=20)),
+                ('laudo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='codigos', to='laudos.laudomicroscopico')),
+                ('termo', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, related_name='laudos', to='laudos.termo')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('termo', 'laudo', 'campo'), name='laudo_codigo_unico')],
+            },
+        ),
+        migrations.RunPython(semear_termos, migrations.RunPython.noop),
+    ]
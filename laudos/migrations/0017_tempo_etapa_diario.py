@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 08:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('laudos', '0016_terminologia'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TempoEtapaDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimensao', models.CharField(choices=[('geral', 'Geral'), ('solicitante', 'Solicitante'), ('usuario', 'Usuário')], max_length=12)),
+                ('dia', models.DateField()),
+                ('metrica', models.CharField(max_length=20)),
+                ('valor', models.CharField(blank=True, default='', max_length=255)),
+                ('quantidade', models.PositiveIntegerField()),
+                ('duracoes', models.BinaryField()),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('dimensao', 'dia', 'metrica', 'valor'), name='tempo_etapa_dia_unico')],
+            },
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.utils import timezone
 
 class UsuarioCustomizado(AbstractUser):
     ROLE_CHOICES = [
@@ -98,6 +99,66 @@ class Caso(models.Model):
         related_name='micros_aprovados'
     )
     micro_aprovado_em = models.DateTimeField(null=True, blank=True)
+    # Incrementada a cada transição do workflow (inclusive edições dos laudos filhos).
+    versao = models.PositiveIntegerField(default=1)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Lista do dashboard: ordem por (data_recebimento, id_laboratorio) com filtros opcionais.
+            models.Index(fields=['data_recebimento', 'id_laboratorio'], name='caso_recebimento_idx'),
+            models.Index(fields=['status', 'data_recebimento', 'id_laboratorio'], name='caso_status_receb_idx'),
+            models.Index(fields=['macro_status', 'data_recebimento', 'id_laboratorio'], name='caso_macro_receb_idx'),
+            models.Index(fields=['preparo_status', 'data_recebimento', 'id_laboratorio'], name='caso_preparo_receb_idx'),
+            models.Index(fields=['micro_status', 'data_recebimento', 'id_laboratorio'], name='caso_micro_receb_idx'),
+            models.Index(fields=['criado_por', 'data_recebimento', 'id_laboratorio'], name='caso_criador_receb_idx'),
+            # CasoAdmin: ordem por -data_criacao, filtrando por status.
+            models.Index(fields=['data_criacao'], name='caso_criacao_idx'),
+            models.Index(fields=['status', 'data_criacao'], name='caso_status_criacao_idx'),
+            # Filas de aprovação: o status fixo na frente deixa cada fila contígua no índice,
+            # já ordenada pelo momento em que o caso começou a esperar. (Um índice parcial
+            # não serviria: o SQLite não o usa quando o status chega como parâmetro.)
+            models.Index(
+                fields=['macro_status', 'macro_preenchido_em', 'id_laboratorio'],
+                name='caso_fila_macro_idx',
+            ),
+            models.Index(
+                fields=['preparo_status', 'preparo_preenchido_em', 'id_laboratorio'],
+                name='caso_fila_preparo_idx',
+            ),
+            models.Index(
+                fields=['micro_status', 'micro_preenchido_em', 'id_laboratorio'],
+                name='caso_fila_micro_idx',
+            ),
+            models.Index(
+                fields=['status', 'micro_aprovado_em', 'id_laboratorio'],
+                name='caso_fila_final_idx',
+            ),
+            # Arquivamento: finalizados mais antigos primeiro, em lotes.
+            models.Index(
+                fields=['status', 'data_finalizacao', 'id_laboratorio'],
+                name='caso_status_finalizacao_idx',
+            ),
+        ]
+
+
+class ContadorCaso(models.Model):
+    """Quantidade de casos por (status, etapa, status da etapa), mantida pelo workflow."""
+
+    ETAPA_CHOICES = [
+        ('MACRO', 'Macroscopia'),
+        ('PREPARO', 'Preparo'),
+        ('MICRO', 'Microscopia'),
+    ]
+    status = models.CharField(max_length=40, choices=Caso.STATUS_CHOICES)
+    etapa = models.CharField(max_length=10, choices=ETAPA_CHOICES)
+    etapa_status = models.CharField(max_length=30, choices=Caso.ETAPA_STATUS_CHOICES)
+    total = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['status', 'etapa', 'etapa_status'], name='contador_caso_chave_unica'),
+        ]
 
 
 class LaudoMacroscopico(models.Model):
@@ -106,6 +167,8 @@ class LaudoMacroscopico(models.Model):
     dim_comprimento_mm = models.DecimalField(max_digits=5, decimal_places=2, verbose_name='Comprimento (mm)')
     dim_largura_mm = models.DecimalField(max_digits=5, decimal_places=2, verbose_name='Largura (mm)')
     dim_altura_mm = models.DecimalField(max_digits=5, decimal_places=2, verbose_name='Altura (mm)')
+    # Chave de textos.TECIDOS ("mole", "osseo", "duro") ou a descrição livre.
+    tipo_tecido = models.CharField(max_length=100, blank=True, default='')
     cor = models.CharField(max_length=100)
     consistencia = models.CharField(max_length=100)
     forma = models.CharField(max_length=100)
@@ -120,6 +183,94 @@ class LaudoMicroscopico(models.Model):
     conclusao = models.TextField()
     notas = models.TextField(blank=True, null=True)
 
+class TagMicroscopica(models.Model):
+    """Característica microscópica selecionável; ``texto`` entra no texto base da microscopia."""
+
+    # Nome sem acentos, em minúsculas e com hífens: "infiltrado-inflamatorio".
+    chave = models.SlugField(max_length=60, unique=True)
+    nome = models.CharField(max_length=60, unique=True)
+    texto = models.TextField()
+    ordem = models.PositiveSmallIntegerField(default=0)
+    ativa = models.BooleanField(default=True)
+
+    class Meta:
+        ordering = ['ordem', 'nome']
+
+    def __str__(self):
+        return self.nome
+
+class LaudoTag(models.Model):
+    """Índice invertido tag -> laudo, mantido junto com ``LaudoMicroscopico.tags_selecionadas``."""
+
+    laudo = models.ForeignKey(LaudoMicroscopico, on_delete=models.CASCADE, related_name='tags_indexadas')
+    # Sem índice próprio: laudo_tag_unica começa por tag e atende às buscas por tag.
+    tag = models.ForeignKey(TagMicroscopica, on_delete=models.PROTECT, related_name='laudos', db_index=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['tag', 'laudo'], name='laudo_tag_unica'),
+        ]
+
+class Termo(models.Model):
+    """Entrada da terminologia local; o nome e os sinônimos são procurados nos textos da microscopia."""
+
+    codigo = models.CharField(max_length=20, unique=True)
+    nome = models.CharField(max_length=120, unique=True)
+    # Variantes de escrita do diagnóstico: ["CEC", "carcinoma epidermoide", ...].
+    sinonimos = models.JSONField(default=list, blank=True)
+    ativo = models.BooleanField(default=True)
+
+    class Meta:
+        ordering = ['codigo']
+
+    def __str__(self):
+        return f"{self.codigo} {self.nome}"
+
+class CodigoLaudo(models.Model):
+    """Termo encontrado num campo do laudo microscópico; recalculado a cada gravação do laudo."""
+
+    CAMPO_CHOICES = [
+        ('conclusao', 'Conclusão'),
+        ('texto_final', 'Laudo microscópico'),
+    ]
+
+    laudo = models.ForeignKey(LaudoMicroscopico, on_delete=models.CASCADE, related_name='codigos')
+    # Sem índice próprio: laudo_codigo_unico começa por termo e atende às buscas por código.
+    termo = models.ForeignKey(Termo, on_delete=models.PROTECT, related_name='laudos', db_index=False)
+    campo = models.CharField(max_length=20, choices=CAMPO_CHOICES)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['termo', 'laudo', 'campo'], name='laudo_codigo_unico'),
+        ]
+
+class TempoEtapaDiario(models.Model):
+    """Durações, em horas, de uma métrica de tempo dos casos finalizados num dia.
+
+    Uma linha por (dimensão, dia, métrica, valor); ``duracoes`` guarda o vetor float32
+    (little-endian) de todas as durações, para que os percentis de qualquer período
+    saiam da junção das linhas diárias sem reler os casos.
+    """
+
+    DIMENSAO_CHOICES = [
+        ('geral', 'Geral'),
+        ('solicitante', 'Solicitante'),
+        ('usuario', 'Usuário'),
+    ]
+
+    dimensao = models.CharField(max_length=12, choices=DIMENSAO_CHOICES)
+    dia = models.DateField()
+    metrica = models.CharField(max_length=20)
+    valor = models.CharField(max_length=255, blank=True, default='')
+    quantidade = models.PositiveIntegerField()
+    duracoes = models.BinaryField()
+
+    class Meta:
+        constraints = [
+            # Também atende à leitura do painel (dimensão + faixa de dias) e à troca de um dia.
+            models.UniqueConstraint(fields=['dimensao', 'dia', 'metrica', 'valor'], name='tempo_etapa_dia_unico'),
+        ]
+
 class MetodoPreparo(models.Model):
     caso = models.OneToOneField(Caso, on_delete=models.CASCADE, related_name='metodo_preparo')
     metodo_padrao_he = models.BooleanField(default=True, verbose_name='Método Padrão H&E')
@@ -140,9 +291,92 @@ class LogAtividade(models.Model):
         ('LAUDO_FINAL_APROVADO', 'Laudo final aprovado'),
         ('OUTRA', 'Outra acao'),
     ]
+    ETAPA_CHOICES = [
+        ('MACRO', 'Macroscopia'),
+        ('PREPARO', 'Preparo'),
+        ('MICRO', 'Microscopia'),
+        ('FINAL', 'Aprovacao final'),
+    ]
     usuario = models.ForeignKey(UsuarioCustomizado, on_delete=models.SET_NULL, null=True)
+    # Sem índice próprio: log_caso_timestamp_idx começa por caso e já atende às buscas.
+    caso = models.ForeignKey(
+        Caso, on_delete=models.SET_NULL, null=True, blank=True, related_name='logs', db_index=False
+    )
+    etapa = models.CharField(max_length=10, choices=ETAPA_CHOICES, blank=True, default='')
     acao = models.CharField(max_length=50, choices=ACTION_CHOICES, default='OUTRA')
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Preenchido no registro, não na gravação, que pode ser adiada para depois do commit.
+    timestamp = models.DateTimeField(default=timezone.now)
     detalhes = models.TextField(blank=True)
 
+    class Meta:
+        indexes = [
+            # Linha do tempo de um caso: igualdade em caso, faixa/ordem em timestamp.
+            models.Index(fields=['caso', 'timestamp'], name='log_caso_timestamp_idx'),
+        ]
+
+
+class CasoArquivado(models.Model):
+    """Caso finalizado retirado das tabelas de trabalho, com o grafo completo serializado."""
+
+    id_laboratorio = models.CharField(max_length=20, primary_key=True)
+    numero_prontuario = models.CharField(max_length=50, db_index=True)
+    data_recebimento = models.DateField()
+    data_finalizacao = models.DateTimeField(null=True, blank=True)
+    versao = models.PositiveIntegerField(default=1)
+    arquivado_em = models.DateTimeField(default=timezone.now)
+    # Saída de django.core.serializers ("json") com Paciente, Caso, laudos e preparo.
+    dados = models.TextField()
+
+
+class LogAtividadeArquivado(models.Model):
+    """Cópia de LogAtividade antigo; mantém o id original para que o arquivamento seja idempotente."""
+
+    id = models.BigIntegerField(primary_key=True)
+    usuario = models.ForeignKey(UsuarioCustomizado, on_delete=models.SET_NULL, null=True, related_name='+')
+    # Sem FK: o caso pode estar na tabela de trabalho ou em CasoArquivado.
+    id_laboratorio = models.CharField(max_length=20, blank=True, default='')
+    etapa = models.CharField(max_length=10, choices=LogAtividade.ETAPA_CHOICES, blank=True, default='')
+    acao = models.CharField(max_length=50, choices=LogAtividade.ACTION_CHOICES, default='OUTRA')
+    timestamp = models.DateTimeField()
+    detalhes = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['id_laboratorio', 'timestamp'], name='log_arq_caso_timestamp_idx'),
+        ]
+
+
+class TarefaPdf(models.Model):
+    """Renderização de PDF pendente, consumida pelo comando ``processar_pdfs``."""
+
+    STATUS_CHOICES = [
+        ('PENDENTE', 'Pendente'),
+        ('EXECUTANDO', 'Executando'),
+        ('CONCLUIDA', 'Concluida'),
+        ('FALHA', 'Falha'),
+    ]
+    # Sem FK: o caso pode ser arquivado antes de a tarefa rodar.
+    id_laboratorio = models.CharField(max_length=20)
+    status = models.CharField(max_length=12, choices=STATUS_CHOICES, default='PENDENTE')
+    tentativas = models.PositiveSmallIntegerField(default=0)
+    criada_em = models.DateTimeField(default=timezone.now)
+    disponivel_em = models.DateTimeField(default=timezone.now)
+    iniciada_em = models.DateTimeField(null=True, blank=True)
+    concluida_em = models.DateTimeField(null=True, blank=True)
+    duracao_ms = models.FloatField(null=True, blank=True)
+    trabalhador = models.CharField(max_length=100, blank=True, default='')
+    erro = models.TextField(blank=True)
 
+    class Meta:
+        indexes = [
+            # Próxima tarefa: igualdade em status, ordem por disponivel_em.
+            models.Index(fields=['status', 'disponivel_em'], name='tarefa_pdf_fila_idx'),
+        ]
+        constraints = [
+            # No máximo uma tarefa pendente por caso; enfileirar de novo não duplica trabalho.
+            models.UniqueConstraint(
+                fields=['id_laboratorio'],
+                condition=models.Q(status='PENDENTE'),
+                name='tarefa_pdf_pendente_unica',
+            ),
+        ]
@@ -0,0 +1,338 @@
+"""Geração do PDF do laudo com cache em disco endereçado pelo conteúdo.
+
+O arquivo fica em ``LAUDOS_PDF_CACHE_DIR`` com o nome ``<caso>-<hash>.pdf``, em que o
+hash cobre tudo o que é desenhado na página (e ``VERSAO_LAYOUT``). Um laudo reaberto ou
+editado produz outro hash, portanto nunca se serve um PDF desatualizado; as transições
+ainda apagam os arquivos do caso depois do commit para liberar espaço. O diretório é
+limitado a ``LAUDOS_PDF_CACHE_MAX_BYTES``, descartando os arquivos usados há mais tempo.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import tempfile
+from functools import partial
+from pathlib import Path
+from typing import TYPE_CHECKING, BinaryIO, Iterable, Optional, Union
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.lib.units import cm
+from reportlab.pdfgen import canvas
+from reportlab.platypus import (
+    BaseDocTemplate,
+    Frame,
+    KeepTogether,
+    PageTemplate,
+    Paragraph,
+    Spacer,
+    Table,
+    TableStyle,
+)
+
+from . import metricas
+
+if TYPE_CHECKING:
+    # Só para anotação: ``renderizar`` roda em processos que não carregam os apps do Django.
+    from .models import Caso
+
+# Incrementar quando o desenho mudar, para que os PDFs antigos deixem de ser usados.
+VERSAO_LAYOUT = 2
+LIMITE_PADRAO_BYTES = 256 * 1024 * 1024
+_NOME_INSEGURO = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+def diretorio() -> Path:
+    return Path(getattr(settings, "LAUDOS_PDF_CACHE_DIR", Path(settings.BASE_DIR) / "var" / "pdf"))
+
+
+def limite_bytes() -> int:
+    return getattr(settings, "LAUDOS_PDF_CACHE_MAX_BYTES", LIMITE_PADRAO_BYTES)
+
+
+def dados_laudo(caso: Caso) -> dict:
+    """Tudo o que aparece no PDF, já como texto; é a entrada do hash e do desenho."""
+    secoes = []
+    if hasattr(caso, "laudo_macroscopico"):
+        macro = caso.laudo_macroscopico
+        secoes.append(("MACROSCOPIA", macro.texto_editado or macro.texto_gerado))
+
+    if hasattr(caso, "metodo_preparo"):
+        preparo = caso.metodo_preparo
+        preparo_texto = "Processamento histológico padrão, microtomia e coloração de H&E" if preparo.metodo_padrao_he else "Método especial de preparo"
+        if preparo.notas_adicionais:
+            preparo_texto += f"\nNotas adicionais: {preparo.notas_adicionais}"
+        secoes.append(("PREPARO/COLOCAÇÃO", preparo_texto))
+
+    if hasattr(caso, "laudo_microscopico"):
+        micro = caso.laudo_microscopico
+        micro_texto = f"{micro.texto_final}\n\nConclusão: {micro.conclusao}"
+        if micro.notas:
+            micro_texto += f"\nNotas: {micro.notas}"
+        secoes.append(("MICROSCOPIA", micro_texto))
+
+    return {
+        "id_laboratorio": caso.id_laboratorio,
+        "paciente": caso.paciente.numero_prontuario,
+        "data_nascimento": caso.paciente.data_nascimento.strftime("%d/%m/%Y"),
+        "solicitante": caso.solicitante,
+        "data_recebimento": caso.data_recebimento.strftime("%d/%m/%Y"),
+        "secoes": secoes,
+        "responsavel": caso.responsavel_final.get_full_name() if caso.responsavel_final else "Responsável",
+    }
+
+
+def chave(dados: dict) -> str:
+    serializado = json.dumps([VERSAO_LAYOUT, dados], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(serializado.encode("utf-8")).hexdigest()
+
+
+ESTILOS = {
+    "secao": ParagraphStyle("secao", fontName="Helvetica-Bold", fontSize=12, leading=15, spaceBefore=6, spaceAfter=4),
+    "texto": ParagraphStyle("texto", fontName="Helvetica", fontSize=11, leading=14, spaceAfter=6),
+    "celula": ParagraphStyle("celula", fontName="Helvetica", fontSize=10, leading=12),
+    "assinatura": ParagraphStyle("assinatura", fontName="Helvetica", fontSize=10, leading=13, alignment=TA_CENTER),
+}
+MARGEM = 2 * cm
+# Espaço reservado ao cabeçalho e ao rodapé fixos de cada página.
+ALTURA_CABECALHO = 4.2 * cm
+ALTURA_RODAPE = 2 * cm
+FORMULARIO_CABECALHO = "cabecalho_lpb"
+
+
+def _paragrafo(texto: str, estilo: str) -> Paragraph:
+    return Paragraph(escape(texto).replace("\n", "<br/>"), ESTILOS[estilo])
+
+
+def _desenhar_cabecalho(p: canvas.Canvas, dados: dict) -> None:
+    width, height = A4
+    p.setFont("Helvetica-Bold", 14)
+    p.drawCentredString(width / 2.0, height - 2 * cm, "LPB - Laboratório de Patologia Bucal")
+    p.setFont("Helvetica", 12)
+    p.drawCentredString(width / 2.0, height - 2.6 * cm, "Universidade Federal de Santa Catarina")
+    p.setFont("Helvetica-Bold", 12)
+    p.drawCentredString(width / 2.0, height - 3.5 * cm, f"LAUDO ANATOMOPATOLÓGICO - Nº {dados['id_laboratorio']}")
+    p.setLineWidth(0.5)
+    p.line(MARGEM, ALTURA_RODAPE - 0.3 * cm, width - MARGEM, ALTURA_RODAPE - 0.3 * cm)
+    p.setFont("Helvetica", 8)
+    p.drawString(MARGEM, ALTURA_RODAPE - 0.8 * cm, "LPB - Laboratório de Patologia Bucal - UFSC")
+
+
+def _tabela_paciente(dados: dict) -> Table:
+    celula = partial(_paragrafo, estilo="celula")
+    tabela = Table(
+        [
+            ["Paciente", celula(dados["paciente"]), "Solicitante", celula(dados["solicitante"])],
+            ["Data de nascimento", dados["data_nascimento"], "Data de recebimento", dados["data_recebimento"]],
+        ],
+        colWidths=[3.5 * cm, 5 * cm, 3.5 * cm, 5 * cm],
+    )
+    tabela.setStyle(
+        TableStyle(
+            [
+                ("BACKGROUND", (0, 0), (-1, 0), colors.lightgrey),
+                ("BOX", (0, 0), (-1, -1), 0.5, colors.black),
+                ("INNERGRID", (0, 0), (-1, -1), 0.25, colors.black),
+                ("FONT", (0, 0), (-1, -1), "Helvetica", 10),
+                ("VALIGN", (0, 0), (-1, -1), "TOP"),
+            ]
+        )
+    )
+    return tabela
+
+
+def renderizar(dados: dict, saida: BinaryIO) -> int:
+    """Compõe o laudo com quebra de linha e de página direto em ``saida``; devolve as páginas.
+
+    Cabeçalho e rodapé fixos são desenhados uma vez como form XObject e reaproveitados
+    em cada página. Depende só de ``dados``, então pode rodar num ``ProcessPoolExecutor``.
+    """
+    width, height = A4
+
+    def pagina(p: canvas.Canvas, documento: BaseDocTemplate) -> None:
+        if documento.page == 1:
+            p.beginForm(FORMULARIO_CABECALHO)
+            _desenhar_cabecalho(p, dados)
+            p.endForm()
+        p.doForm(FORMULARIO_CABECALHO)
+        p.setFont("Helvetica", 8)
+        p.drawRightString(width - MARGEM, ALTURA_RODAPE - 0.8 * cm, f"Página {documento.page}")
+
+    documento = BaseDocTemplate(
+        saida,
+        pagesize=A4,
+        title=f"Laudo {dados['id_laboratorio']}",
+        author="LPB - Laboratório de Patologia Bucal",
+        leftMargin=MARGEM,
+        rightMargin=MARGEM,
+        topMargin=ALTURA_CABECALHO,
+        bottomMargin=ALTURA_RODAPE,
+    )
+    documento.addPageTemplates(
+        PageTemplate(
+            id="laudo",
+            frames=[Frame(MARGEM, ALTURA_RODAPE, width - 2 * MARGEM, height - ALTURA_CABECALHO - ALTURA_RODAPE, id="corpo")],
+            onPage=pagina,
+        )
+    )
+
+    conteudo = [_tabela_paciente(dados), Spacer(1, 0.5 * cm)]
+    for titulo, texto in dados["secoes"]:
+        conteudo.append(_paragrafo(titulo, "secao"))
+        conteudo.extend(_paragrafo(trecho, "texto") for trecho in texto.split("\n\n"))
+    conteudo.append(
+        KeepTogether(
+            [
+                Spacer(1, 1.5 * cm),
+                _paragrafo("____________________________________", "assinatura"),
+                _paragrafo(dados["responsavel"], "assinatura"),
+                _paragrafo("Professor Responsável", "assinatura"),
+            ]
+        )
+    )
+    documento.build(conteudo)
+    return documento.page
+
+
+def gerar_arquivo(dados: dict, destino: Union[str, Path]) -> Path:
+    """Renderiza direto num arquivo temporário ao lado de ``destino`` e o renomeia.
+
+    Leitores nunca veem um PDF parcial; não lê configurações, então serve a processos
+    auxiliares sem Django configurado.
+    """
+    destino = Path(destino)
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    descritor, temporario = tempfile.mkstemp(dir=destino.parent, suffix=".tmp")
+    try:
+        with os.fdopen(descritor, "wb") as saida:
+            renderizar(dados, saida)
+        os.replace(temporario, destino)
+    except BaseException:
+        Path(temporario).unlink(missing_ok=True)
+        raise
+    return destino
+
+
+def _prefixo(caso_id: str) -> str:
+    # O hash curto do id original separa casos cujo nome higienizado coincide ("A/1" e "A_1").
+    resumo = hashlib.sha1(caso_id.encode("utf-8")).hexdigest()[:8]
+    return f"{_NOME_INSEGURO.sub('_', caso_id)}_{resumo}"
+
+
+def caminho(dados: dict, chave_pdf: str) -> Path:
+    return diretorio() / f"{_prefixo(dados['id_laboratorio'])}-{chave_pdf}.pdf"
+
+
+def _remover_antigos(destino: Path) -> None:
+    """Apaga as versões anteriores do mesmo caso, que não voltarão a ser pedidas."""
+    prefixo = destino.name.rsplit("-", 1)[0]
+    for antigo in destino.parent.glob(f"{prefixo}-*.pdf"):
+        if antigo != destino and antigo.name.rsplit("-", 1)[0] == prefixo:
+            antigo.unlink(missing_ok=True)
+
+
+def aplicar_limite(preservar: Path | None = None) -> int:
+    """Descarta os arquivos menos usados até caber em ``limite_bytes``; devolve quantos."""
+    arquivos = []
+    total = 0
+    with os.scandir(diretorio()) as entradas:
+        for entrada in entradas:
+            if not entrada.name.endswith(".pdf"):
+                continue
+            try:
+                estado = entrada.stat()
+            except FileNotFoundError:
+                continue
+            arquivos.append((estado.st_mtime, estado.st_size, entrada.path))
+            total += estado.st_size
+
+    removidos = 0
+    limite = limite_bytes()
+    for _, tamanho, arquivo in sorted(arquivos):
+        if total <= limite:
+            break
+        if preservar is not None and arquivo == str(preservar):
+            continue
+        Path(arquivo).unlink(missing_ok=True)
+        total -= tamanho
+        removidos += 1
+    if removidos:
+        metricas.incrementar("pdf_cache.descartados", removidos)
+    return removidos
+
+
+def em_cache(dados: dict, chave_pdf: str) -> Optional[Path]:
+    """Caminho do PDF se já estiver em cache, marcando-o como usado agora."""
+    destino = caminho(dados, chave_pdf)
+    try:
+        # A data de modificação marca o último uso para o descarte LRU.
+        os.utime(destino)
+    except FileNotFoundError:
+        metricas.incrementar("pdf_cache.falhas")
+        return None
+    metricas.incrementar("pdf_cache.acertos")
+    return destino
+
+
+def registrar(destino: Path) -> Path:
+    """Conclui a entrada de um PDF recém-gravado: apaga versões antigas e aplica o limite."""
+    _remover_antigos(destino)
+    aplicar_limite(preservar=destino)
+    return destino
+
+
+def obter(dados: dict, chave_pdf: str | None = None) -> Path:
+    """Caminho do PDF em cache, renderizando e gravando se ainda não existir."""
+    chave_pdf = chave_pdf or chave(dados)
+    destino = em_cache(dados, chave_pdf)
+    if destino is not None:
+        return destino
+    destino = caminho(dados, chave_pdf)
+    with metricas.cronometrar("pdf.renderizacao"):
+        gerar_arquivo(dados, destino)
+    return registrar(destino)
+
+
+def abrir(dados: dict, chave_pdf: str | None = None) -> BinaryIO:
+    """Abre o PDF em cache; se outro processo o descartar no meio do caminho, renderiza de novo."""
+    try:
+        return open(obter(dados, chave_pdf), "rb")
+    except FileNotFoundError:
+        return open(obter(dados, chave_pdf), "rb")
+
+
+def invalidar(casos: Iterable[str]) -> None:
+    """Remove os PDFs em cache dos casos informados."""
+    pasta = diretorio()
+    if not pasta.is_dir():
+        return
+    for caso_id in casos:
+        prefixo = _prefixo(caso_id)
+        for arquivo in pasta.glob(f"{prefixo}-*.pdf"):
+            if arquivo.name.rsplit("-", 1)[0] == prefixo:
+                arquivo.unlink(missing_ok=True)
+
+
+__all__ = [
+    "VERSAO_LAYOUT",
+    "abrir",
+    "aplicar_limite",
+    "caminho",
+    "chave",
+    "dados_laudo",
+    "diretorio",
+    "em_cache",
+    "gerar_arquivo",
+    "invalidar",
+    "limite_bytes",
+    "obter",
+    "registrar",
+    "renderizar",
+]
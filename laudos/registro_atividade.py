@@ -0,0 +1,227 @@
+"""Gravação em lote do ``LogAtividade``, feita depois do commit das transições.
+
+As entradas são confirmadas com ``transaction.on_commit``, então uma transição desfeita
+(ou um savepoint revertido) não deixa log. Dentro de ``coletar()`` — usado pelo
+middleware em cada requisição e por operações em lote — as entradas confirmadas se
+acumulam e são gravadas com um único ``bulk_create`` ao final. Com ``assincrono=True``
+(ou ``LAUDOS_LOG_ASSINCRONO``) o lote vai para uma thread de fundo, o que serve a
+importações grandes em que a latência do log importa menos que a do chamador.
+"""
+
+from __future__ import annotations
+
+import contextvars
+import logging
+import queue
+import threading
+from contextlib import contextmanager
+from functools import partial
+from typing import Iterable, Iterator, Optional, Union
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from . import metricas
+from .models import Caso, LogAtividade, UsuarioCustomizado
+
+logger = logging.getLogger(__name__)
+
+TAMANHO_LOTE = 500
+
+ETAPA_POR_ACAO = {
+    "MACRO_SALVO": "MACRO",
+    "MACRO_SUBMETIDO": "MACRO",
+    "MACRO_APROVADO": "MACRO",
+    "PREPARO_SALVO": "PREPARO",
+    "PREPARO_SUBMETIDO": "PREPARO",
+    "PREPARO_APROVADO": "PREPARO",
+    "MICRO_SALVO": "MICRO",
+    "MICRO_SUBMETIDO": "MICRO",
+    "MICRO_APROVADO": "MICRO",
+    "LAUDO_FINAL_APROVADO": "FINAL",
+}
+
+# Variável de contexto, e não threading.local, para acompanhar a view síncrona que o
+# ASGI executa em outra thread via ``sync_to_async``.
+_coletor: contextvars.ContextVar[Optional[list[LogAtividade]]] = contextvars.ContextVar(
+    "laudos_coletor_logs", default=None
+)
+
+
+def _assincrono_padrao() -> bool:
+    return getattr(settings, "LAUDOS_LOG_ASSINCRONO", False)
+
+
+def _escrever(entradas: list[LogAtividade]) -> None:
+    try:
+        with metricas.cronometrar("logs.escrita"):
+            LogAtividade.objects.bulk_create(entradas, batch_size=TAMANHO_LOTE)
+    except Exception:
+        metricas.incrementar("logs.falhas", len(entradas))
+        logger.exception("Falha ao gravar %d entradas de LogAtividade.", len(entradas))
+        return
+    metricas.incrementar("logs.gravados", len(entradas))
+    metricas.registrar_valor("logs.lote", len(entradas))
+    # Latência entre o registro mais antigo do lote e a gravação.
+    mais_antigo = min(entrada.timestamp for entrada in entradas)
+    metricas.registrar_tempo("logs.latencia", (timezone.now() - mais_antigo).total_seconds())
+
+
+class GravadorAssincrono:
+    """Thread única que grava os lotes recebidos, juntando os que chegam enquanto escreve."""
+
+    def __init__(self):
+        self._fila: queue.Queue[list[LogAtividade]] = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def enviar(self, entradas: list[LogAtividade]) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._executar, name="laudos-log-atividade", daemon=True)
+                self._thread.start()
+        self._fila.put(entradas)
+
+    def _executar(self) -> None:
+        while True:
+            lote = list(self._fila.get())
+            recebidos = 1
+            while len(lote) < TAMANHO_LOTE:
+                try:
+                    lote.extend(self._fila.get_nowait())
+                except queue.Empty:
+                    break
+                recebidos += 1
+            try:
+                _escrever(lote)
+            finally:
+                connections.close_all()
+                for _ in range(recebidos):
+                    self._fila.task_done()
+
+    def aguardar(self) -> None:
+        """Bloqueia até que todos os lotes enviados tenham sido gravados."""
+        self._fila.join()
+
+    @property
+    def pendentes(self) -> int:
+        return self._fila.qsize()
+
+
+gravador = GravadorAssincrono()
+
+
+def _gravar(entradas: list[LogAtividade], assincrono: Optional[bool] = None) -> None:
+    if assincrono is None:
+        assincrono = _assincrono_padrao()
+    if assincrono:
+        gravador.enviar(entradas)
+    else:
+        _escrever(entradas)
+
+
+def _confirmar(entradas: list[LogAtividade]) -> None:
+    coletor = _coletor.get()
+    if coletor is None:
+        _gravar(entradas)
+    else:
+        coletor.extend(entradas)
+
+
+def registrar_entradas(entradas: Iterable[LogAtividade]) -> None:
+    """Agenda ``entradas`` para depois do commit da transação corrente."""
+    entradas = list(entradas)
+    if entradas:
+        metricas.incrementar("logs.registrados", len(entradas))
+        transaction.on_commit(partial(_confirmar, entradas))
+
+
+def entrada(
+    usuario: Optional[UsuarioCustomizado],
+    acao: str,
+    detalhes: str = "",
+    caso: Union[Caso, str, None] = None,
+    timestamp=None,
+) -> LogAtividade:
+    """Monta a entrada de log; ``caso`` aceita a instância ou só o ``id_laboratorio``."""
+    return LogAtividade(
+        usuario=usuario,
+        caso_id=caso.pk if isinstance(caso, Caso) else caso,
+        etapa=ETAPA_POR_ACAO.get(acao, ""),
+        acao=acao,
+        detalhes=detalhes or "",
+        timestamp=timestamp or timezone.now(),
+    )
+
+
+def registrar(
+    usuario: Optional[UsuarioCustomizado],
+    acao: str,
+    detalhes: str = "",
+    caso: Optional[Caso] = None,
+) -> None:
+    registrar_entradas([entrada(usuario, acao, detalhes, caso)])
+
+
+@contextmanager
+def coletar(assincrono: Optional[bool] = None) -> Iterator[None]:
+    """Acumula as entradas confirmadas no bloco e as grava num só lote na saída.
+
+    Blocos aninhados se juntam ao mais externo.
+    """
+    if _coletor.get() is not None:
+        yield
+        return
+    coletor: list[LogAtividade] = []
+    token = _coletor.set(coletor)
+    try:
+        yield
+    finally:
+        _coletor.reset(token)
+        # As entradas já pertencem a transações confirmadas, mesmo que o bloco tenha falhado.
+        if coletor:
+            _gravar(coletor, assincrono)
+
+
+class ColetorLogsMiddleware:
+    """Grava os logs de cada requisição com um único ``bulk_create``."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with coletar():
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        if _coletor.get() is not None:
+            return await self.get_response(request)
+        coletor: list[LogAtividade] = []
+        token = _coletor.set(coletor)
+        try:
+            return await self.get_response(request)
+        finally:
+            _coletor.reset(token)
+            if coletor:
+                await sync_to_async(_gravar)(coletor)
+
+
+__all__ = [
+    "ColetorLogsMiddleware",
+    "GravadorAssincrono",
+    "ETAPA_POR_ACAO",
+    "coletar",
+    "entrada",
+    "gravador",
+    "registrar",
+    "registrar_entradas",
+]
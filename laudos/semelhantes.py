@@ -0,0 +1,324 @@
+"""Casos finalizados semelhantes a um laudo, por similaridade de cosseno entre vetores TF-IDF.
+
+Cada caso finalizado vira um vetor esparso com as palavras do texto microscópico, as da
+conclusão (com peso maior) e as tags selecionadas. Os termos são mapeados para
+``DIMENSAO`` posições por um hash estável (crc32), então não há vocabulário a manter.
+Os vetores ficam em segmentos no formato CSR (``indptr``, ``indices``, ``dados`` e os
+``ids`` de cada linha), gravados como ``.npy`` em ``LAUDOS_SEMELHANTES_DIR`` e abertos
+com ``mmap_mode="r"``.
+
+A aprovação final grava um segmento pequeno com os casos aprovados. Quando há segmentos
+demais, os menores são fundidos num só. ``indexar_semelhantes`` reconstrói tudo num
+segmento único. Um caso presente em mais de um segmento vale pela versão do segmento
+mais novo. Os pesos IDF e as normas das linhas são recalculados quando o conjunto de
+segmentos muda, e a consulta é um produto esparso vetorizado (gather + ``reduceat``)
+sobre todas as linhas.
+"""
+
+from __future__ import annotations
+
+import math
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Optional
+
+import numpy as np
+from django.conf import settings
+
+from . import metricas
+from .models import Caso
+from .textos import normalizar
+
+DIMENSAO = 1 << 18
+PESO_CONCLUSAO = 2.0
+PESO_TAG = 3.0
+LIMITE_PADRAO = 5
+# Acima disso ``adicionar`` funde os segmentos menores que o maior num só.
+MAXIMO_SEGMENTOS = 16
+PARTES = ("indptr", "indices", "dados", "ids")
+_PALAVRA = re.compile(r"[a-z0-9]{3,}")
+
+
+def diretorio() -> Path:
+    return Path(getattr(settings, "LAUDOS_SEMELHANTES_DIR", Path(settings.BASE_DIR) / "var" / "semelhantes"))
+
+
+def _posicao(termo: str) -> int:
+    return zlib.crc32(termo.encode("utf-8")) & (DIMENSAO - 1)
+
+
+def vetor(texto_final: str, conclusao: str, tags_selecionadas: Iterable[str]) -> dict[int, float]:
+    """Pesos de frequência sublinear (1 + log tf) por posição do hash; sem o IDF."""
+    contagem: Counter = Counter()
+    for palavra in _PALAVRA.findall(normalizar(texto_final)):
+        contagem[_posicao(palavra)] += 1
+    for palavra in _PALAVRA.findall(normalizar(conclusao)):
+        contagem[_posicao(palavra)] += PESO_CONCLUSAO
+    for nome in tags_selecionadas or ():
+        contagem[_posicao("#" + normalizar(nome))] += PESO_TAG
+    return {posicao: 1.0 + math.log(frequencia) for posicao, frequencia in contagem.items()}
+
+
+def _documentos(ids: Iterable[str]) -> tuple[list[str], list[dict[int, float]]]:
+    linhas = (
+        Caso.objects.filter(pk__in=list(ids), status="FINALIZADO")
+        .order_by("pk")
+        .values_list(
+            "pk",
+            "laudo_microscopico__texto_final",
+            "laudo_microscopico__conclusao",
+            "laudo_microscopico__tags_selecionadas",
+        )
+    )
+    encontrados, vetores = [], []
+    for pk, texto_final, conclusao, tags_selecionadas in linhas:
+        pesos = vetor(texto_final or "", conclusao or "", tags_selecionadas or [])
+        if pesos:
+            encontrados.append(pk)
+            vetores.append(pesos)
+    return encontrados, vetores
+
+
+def _matriz(ids: list[str], vetores: list[dict[int, float]]) -> dict[str, np.ndarray]:
+    indptr = np.zeros(len(vetores) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(pesos) for pesos in vetores])
+    indices = np.fromiter((posicao for pesos in vetores for posicao in pesos), dtype=np.int32, count=indptr[-1])
+    dados = np.fromiter((peso for pesos in vetores for peso in pesos.values()), dtype=np.float32, count=indptr[-1])
+    return {"indptr": indptr, "indices": indices, "dados": dados, "ids": np.array(ids, dtype="U20")}
+
+
+def _gravar(nome: str, matriz: dict[str, np.ndarray]) -> None:
+    """Grava as partes com rename atômico; ``ids`` por último, pois marca o segmento pronto."""
+    pasta = diretorio()
+    pasta.mkdir(parents=True, exist_ok=True)
+    for parte in PARTES:
+        descritor, temporario = tempfile.mkstemp(dir=pasta, suffix=".tmp")
+        try:
+            with os.fdopen(descritor, "wb") as arquivo:
+                np.save(arquivo, matriz[parte])
+            os.replace(temporario, pasta / f"{nome}.{parte}.npy")
+        except BaseException:
+            os.unlink(temporario)
+            raise
+
+
+def _apagar(nomes: Iterable[str]) -> None:
+    for nome in nomes:
+        # "ids" primeiro: o segmento deixa de existir para os leitores antes das demais partes.
+        for parte in reversed(PARTES):
+            try:
+                (diretorio() / f"{nome}.{parte}.npy").unlink()
+            except FileNotFoundError:
+                pass
+
+
+def _nomes() -> list[str]:
+    try:
+        arquivos = os.listdir(diretorio())
+    except FileNotFoundError:
+        return []
+    return sorted(arquivo[: -len(".ids.npy")] for arquivo in arquivos if arquivo.endswith(".ids.npy"))
+
+
+def _novo_nome() -> str:
+    return f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}"
+
+
+def _abrir(nome: str) -> dict[str, np.ndarray]:
+    return {parte: np.load(diretorio() / f"{nome}.{parte}.npy", mmap_mode="r") for parte in PARTES}
+
+
+@dataclass
+class _Segmento:
+    nome: str
+    ids: np.ndarray
+    indptr: np.ndarray
+    indices: np.ndarray
+    dados: np.ndarray
+    valido: np.ndarray
+    normas: np.ndarray
+
+
+@dataclass
+class _Indice:
+    nomes: tuple[str, ...]
+    segmentos: list[_Segmento]
+    idf: np.ndarray
+    documentos: int
+
+
+_indice: Optional[_Indice] = None
+_trava = threading.Lock()
+
+
+def _montar(nomes: list[str]) -> _Indice:
+    abertos = [(nome, _abrir(nome)) for nome in nomes]
+    # O segmento mais novo vence quando o mesmo caso aparece em mais de um.
+    vistos: set = set()
+    validos = []
+    for _, partes in reversed(abertos):
+        ids = partes["ids"].tolist()
+        valido = np.fromiter((caso_id not in vistos for caso_id in ids), dtype=bool, count=len(ids))
+        vistos.update(ids)
+        validos.append(valido)
+    validos.reverse()
+
+    frequencia_documentos = np.zeros(DIMENSAO, dtype=np.float64)
+    for (_, partes), valido in zip(abertos, validos):
+        pesos_linha = np.repeat(valido, np.diff(partes["indptr"]))
+        frequencia_documentos += np.bincount(partes["indices"], weights=pesos_linha, minlength=DIMENSAO)
+    documentos = len(vistos)
+    idf = (np.log((1.0 + documentos) / (1.0 + frequencia_documentos)) + 1.0).astype(np.float32)
+
+    segmentos = []
+    for (nome, partes), valido in zip(abertos, validos):
+        if len(valido):
+            ponderados = partes["dados"] * idf[partes["indices"]]
+            normas = np.sqrt(np.add.reduceat(ponderados * ponderados, partes["indptr"][:-1]))
+        else:
+            normas = np.zeros(0, dtype=np.float32)
+        segmentos.append(_Segmento(nome=nome, valido=valido, normas=normas, **partes))
+    return _Indice(nomes=tuple(nomes), segmentos=segmentos, idf=idf, documentos=documentos)
+
+
+def _carregar() -> _Indice:
+    """Índice do processo, remontado quando a lista de segmentos no disco muda."""
+    global _indice
+    for _ in range(3):
+        nomes = _nomes()
+        indice = _indice
+        if indice is not None and indice.nomes == tuple(nomes):
+            return indice
+        with _trava:
+            if _indice is not None and _indice.nomes == tuple(nomes):
+                return _indice
+            try:
+                with metricas.cronometrar("semelhantes.carga"):
+                    _indice = _montar(nomes)
+            except FileNotFoundError:
+                # Um segmento foi fundido ou apagado durante a leitura; lista de novo.
+                continue
+            return _indice
+    raise RuntimeError("Não foi possível ler os segmentos do índice de casos semelhantes.")
+
+
+def pesquisar(pesos: dict[int, float], limite: int = LIMITE_PADRAO, excluir: str = "") -> list[tuple[str, float]]:
+    """Os ``limite`` casos mais próximos de ``pesos``, com a similaridade de cosseno."""
+    if not pesos:
+        return []
+    indice = _carregar()
+    with metricas.cronometrar("semelhantes.consulta"):
+        posicoes = np.fromiter(pesos, dtype=np.int64, count=len(pesos))
+        valores = np.fromiter(pesos.values(), dtype=np.float32, count=len(pesos)) * indice.idf[posicoes]
+        norma = float(np.linalg.norm(valores))
+        if not norma:
+            return []
+        # Consulta densa já multiplicada pelo IDF: cada linha d vale sum(d * idf * q) / |d|.
+        consulta = np.zeros(DIMENSAO, dtype=np.float32)
+        consulta[posicoes] = valores * indice.idf[posicoes] / norma
+
+        candidatos: list[tuple[float, str]] = []
+        for segmento in indice.segmentos:
+            if not len(segmento.ids):
+                continue
+            produto = np.add.reduceat(segmento.dados * consulta[segmento.indices], segmento.indptr[:-1])
+            notas = np.where(segmento.valido, produto / segmento.normas, 0.0)
+            quantidade = min(limite + 1, len(notas))
+            melhores = np.argpartition(notas, -quantidade)[-quantidade:]
+            candidatos.extend((float(notas[linha]), str(segmento.ids[linha])) for linha in melhores)
+
+    candidatos.sort(key=lambda item: (-item[0], item[1]))
+    return [(caso_id, nota) for nota, caso_id in candidatos if nota > 0 and caso_id != excluir][:limite]
+
+
+def semelhantes(caso: Caso, limite: int = LIMITE_PADRAO, pesos: Optional[dict[int, float]] = None) -> list[dict]:
+    """Casos finalizados mais próximos do laudo microscópico de ``caso``, mais próximo primeiro."""
+    if pesos is None:
+        micro = getattr(caso, "laudo_microscopico", None)
+        if micro is None:
+            return []
+        pesos = vetor(micro.texto_final, micro.conclusao, micro.tags_selecionadas or [])
+    encontrados = pesquisar(pesos, limite, excluir=caso.pk)
+    linhas = {
+        linha["pk"]: linha
+        for linha in Caso.objects.filter(pk__in=[caso_id for caso_id, _ in encontrados]).values(
+            "pk", "data_finalizacao", "diagnostico_sugerido", "laudo_microscopico__conclusao"
+        )
+    }
+    # Casos arquivados desde a indexação não estão mais na tabela e ficam de fora.
+    return [
+        {
+            "id_laboratorio": caso_id,
+            "similaridade": round(nota, 4),
+            "conclusao": linhas[caso_id]["laudo_microscopico__conclusao"] or "",
+            "diagnostico_sugerido": linhas[caso_id]["diagnostico_sugerido"],
+            "data_finalizacao": linhas[caso_id]["data_finalizacao"],
+        }
+        for caso_id, nota in encontrados
+        if caso_id in linhas
+    ]
+
+
+def _concatenar(partes: list[dict[str, np.ndarray]]) -> dict[str, np.ndarray]:
+    deslocamentos = np.cumsum([0] + [len(parte["indices"]) for parte in partes[:-1]])
+    return {
+        "indptr": np.concatenate(
+            [np.zeros(1, dtype=np.int64)]
+            + [parte["indptr"][1:] + inicio for parte, inicio in zip(partes, deslocamentos)]
+        ),
+        "indices": np.concatenate([parte["indices"] for parte in partes]),
+        "dados": np.concatenate([parte["dados"] for parte in partes]),
+        "ids": np.concatenate([parte["ids"] for parte in partes]),
+    }
+
+
+def _fundir(nomes: list[str]) -> None:
+    # O nome fica logo depois do último segmento fundido, preservando a ordem de precedência.
+    _gravar(f"{nomes[-1]}m", _concatenar([_abrir(nome) for nome in nomes]))
+    _apagar(nomes)
+
+
+def adicionar(ids: Iterable[str]) -> int:
+    """Indexa os casos finalizados de ``ids`` num segmento novo; devolve quantos entraram."""
+    encontrados, vetores = _documentos(ids)
+    if not encontrados:
+        return 0
+    _gravar(_novo_nome(), _matriz(encontrados, vetores))
+    metricas.incrementar("semelhantes.indexados", len(encontrados))
+
+    nomes = _nomes()
+    if len(nomes) > MAXIMO_SEGMENTOS:
+        tamanhos = {nome: (diretorio() / f"{nome}.indices.npy").stat().st_size for nome in nomes}
+        maior = max(nomes, key=tamanhos.__getitem__)
+        menores = [nome for nome in nomes if nome > maior]
+        if len(menores) > 1:
+            try:
+                _fundir(menores)
+            except FileNotFoundError:
+                pass  # Outro processo fundiu os mesmos segmentos antes.
+    return len(encontrados)
+
+
+def reconstruir(lotes: Iterable[list[str]]) -> int:
+    """Grava um segmento único com os casos de ``lotes`` e apaga os segmentos anteriores."""
+    anteriores = _nomes()
+    partes = [_matriz(*_documentos(ids)) for ids in lotes]
+    matriz = _concatenar(partes) if partes else _matriz([], [])
+    _gravar(_novo_nome(), matriz)
+    _apagar(anteriores)
+    return len(matriz["ids"])
+
+
+def total() -> int:
+    return _carregar().documentos
+
+
+__all__ = ["adicionar", "diretorio", "pesquisar", "reconstruir", "semelhantes", "total", "vetor"]
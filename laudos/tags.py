@@ -0,0 +1,157 @@
+"""Vocabulário de características microscópicas e o índice invertido tag -> laudo.
+
+O vocabulário (``TagMicroscopica``) muda raramente e é lido em toda tela de microscopia,
+então fica num cache do processo, conferido a cada leitura contra uma versão no cache do
+Django que ``invalidar`` avança. As seleções continuam em ``tags_selecionadas`` (com os
+nomes canônicos) e são espelhadas em ``LaudoTag``, que responde às buscas por tag sem
+desserializar o JSON de cada laudo.
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import Counter
+from typing import Iterable, Literal
+
+from django.db.models import Count, QuerySet
+
+from . import metricas, versoes
+from .models import LaudoMicroscopico, LaudoTag, TagMicroscopica
+from .textos import normalizar
+
+CHAVE_VERSAO = "laudos:tags:versao"
+MODOS = ("todas", "alguma")
+
+_trava = threading.Lock()
+_cache: dict = {"versao": None, "tags": (), "por_chave": {}}
+
+
+def chave(nome: str) -> str:
+    """``"Infiltrado Inflamatório"`` e ``"infiltrado inflamatorio"`` viram ``"infiltrado-inflamatorio"``."""
+    return normalizar(nome).replace(" ", "-")
+
+
+def invalidar() -> None:
+    versoes.avancar(CHAVE_VERSAO)
+
+
+def _carregar() -> dict:
+    versao = versoes.atual(CHAVE_VERSAO)
+    if _cache["versao"] != versao:
+        with _trava:
+            if _cache["versao"] != versao:
+                metricas.incrementar("tags.carregamentos")
+                todas = tuple(TagMicroscopica.objects.all())
+                _cache.update(
+                    versao=versao,
+                    tags=todas,
+                    por_chave={tag.chave: tag for tag in todas},
+                )
+    return _cache
+
+
+def vocabulario(incluir_inativas: bool = False) -> tuple[TagMicroscopica, ...]:
+    """Tags na ordem de exibição."""
+    tags = _carregar()["tags"]
+    return tags if incluir_inativas else tuple(tag for tag in tags if tag.ativa)
+
+
+def textos(incluir_inativas: bool = False) -> dict[str, str]:
+    """Nome -> texto na ordem de exibição, o vocabulário de ``textos.texto_micro``."""
+    return {tag.nome: tag.texto for tag in vocabulario(incluir_inativas)}
+
+
+def resolver(nomes: Iterable[str]) -> tuple[list[TagMicroscopica], list[str]]:
+    """Tags conhecidas (na ordem do vocabulário, sem repetição) e os nomes não reconhecidos.
+
+    Aceita nomes com ou sem acentos e as próprias chaves.
+    """
+    carregado = _carregar()
+    por_chave = carregado["por_chave"]
+    encontradas: dict[int, TagMicroscopica] = {}
+    desconhecidas = []
+    for nome in nomes:
+        nome = (nome or "").strip()
+        if not nome:
+            continue
+        tag = por_chave.get(chave(nome))
+        if tag is None:
+            if nome not in desconhecidas:
+                desconhecidas.append(nome)
+        else:
+            encontradas[tag.pk] = tag
+    ordem = {tag.pk: posicao for posicao, tag in enumerate(carregado["tags"])}
+    return sorted(encontradas.values(), key=lambda tag: ordem[tag.pk]), desconhecidas
+
+
+def normalizar_nomes(nomes: Iterable[str]) -> list[str]:
+    """Nomes canônicos das tags conhecidas, seguidos dos não reconhecidos (preservados)."""
+    encontradas, desconhecidas = resolver(nomes)
+    return [tag.nome for tag in encontradas] + desconhecidas
+
+
+def sincronizar(laudos: list[LaudoMicroscopico]) -> tuple[int, int, Counter]:
+    """Ajusta ``LaudoTag`` às ``tags_selecionadas`` dos laudos já gravados.
+
+    Devolve ``(criados, removidos, desconhecidas)``.
+    """
+    desejados = set()
+    desconhecidas: Counter = Counter()
+    for laudo in laudos:
+        encontradas, ignoradas = resolver(laudo.tags_selecionadas or [])
+        desejados.update((laudo.pk, tag.pk) for tag in encontradas)
+        desconhecidas.update(ignoradas)
+
+    existentes = {
+        (laudo_id, tag_id): pk
+        for pk, laudo_id, tag_id in LaudoTag.objects.filter(laudo__in=laudos).values_list("pk", "laudo_id", "tag_id")
+    }
+    remover = [pk for par, pk in existentes.items() if par not in desejados]
+    criar = [LaudoTag(laudo_id=laudo_id, tag_id=tag_id) for laudo_id, tag_id in desejados - existentes.keys()]
+    if remover:
+        LaudoTag.objects.filter(pk__in=remover).delete()
+    if criar:
+        LaudoTag.objects.bulk_create(criar)
+    return len(criar), len(remover), desconhecidas
+
+
+def filtrar_casos(
+    queryset: QuerySet,
+    nomes: Iterable[str],
+    modo: Literal["todas", "alguma"] = "todas",
+) -> QuerySet:
+    """Casos com todas (``"todas"``) ou ao menos uma (``"alguma"``) das tags, pelo índice."""
+    if modo not in MODOS:
+        raise ValueError(f"Modo de busca por tags inválido: {modo!r}")
+    nomes = [nome for nome in nomes if (nome or "").strip()]
+    if not nomes:
+        return queryset
+    encontradas, desconhecidas = resolver(nomes)
+    if not encontradas or (modo == "todas" and desconhecidas):
+        return queryset.none()
+
+    vinculos = LaudoTag.objects.filter(tag__in=[tag.pk for tag in encontradas])
+    if modo == "todas" and len(encontradas) > 1:
+        vinculos = vinculos.values("laudo_id").annotate(quantidade=Count("tag_id")).filter(
+            quantidade=len(encontradas)
+        )
+    return queryset.filter(laudo_microscopico__in=vinculos.values("laudo_id"))
+
+
+def opcoes() -> list[tuple[str, str]]:
+    """Escolhas para formulários, avaliadas a cada instância do formulário."""
+    return [(tag.chave, tag.nome) for tag in vocabulario()]
+
+
+__all__ = [
+    "MODOS",
+    "chave",
+    "filtrar_casos",
+    "invalidar",
+    "normalizar_nomes",
+    "opcoes",
+    "resolver",
+    "sincronizar",
+    "textos",
+    "vocabulario",
+]
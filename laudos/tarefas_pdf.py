@@ -0,0 +1,145 @@
+"""Fila de pré-renderização de PDFs em tabela do banco, sem broker externo.
+
+``enfileirar`` é chamado depois do commit da aprovação final; os trabalhadores do
+comando ``processar_pdfs`` reservam tarefas com um UPDATE condicional (PENDENTE ->
+EXECUTANDO), o mesmo compare-and-swap usado nas transições, e gravam o PDF no cache de
+``pdf``. Assim o primeiro download de um laudo finalizado normalmente já encontra o
+arquivo pronto.
+"""
+
+from __future__ import annotations
+
+import datetime
+import time
+from typing import Iterable, Optional
+
+from django.db import IntegrityError, transaction
+from django.db.models import Avg, Count, F, Max, Min
+from django.http import Http404
+from django.utils import timezone
+
+from . import arquivo, metricas, pdf
+from .models import TarefaPdf
+
+MAX_TENTATIVAS = 3
+# Candidatas lidas por reserva; se outro trabalhador levar uma, tenta a seguinte.
+JANELA_RESERVA = 10
+TIMEOUT_EXECUCAO = datetime.timedelta(minutes=5)
+
+
+def enfileirar(casos: Iterable[str]) -> None:
+    """Cria uma tarefa pendente por caso; casos que já têm uma são ignorados."""
+    tarefas = [TarefaPdf(id_laboratorio=caso_id) for caso_id in dict.fromkeys(casos)]
+    if tarefas:
+        TarefaPdf.objects.bulk_create(tarefas, ignore_conflicts=True)
+        metricas.incrementar("pdf_tarefas.enfileiradas", len(tarefas))
+
+
+def reservar(trabalhador: str) -> Optional[TarefaPdf]:
+    """Marca a próxima tarefa disponível como EXECUTANDO para ``trabalhador``."""
+    agora = timezone.now()
+    candidatas = list(
+        TarefaPdf.objects.filter(status="PENDENTE", disponivel_em__lte=agora)
+        .order_by("disponivel_em")
+        .values_list("pk", flat=True)[:JANELA_RESERVA]
+    )
+    for pk in candidatas:
+        reservada = TarefaPdf.objects.filter(pk=pk, status="PENDENTE").update(
+            status="EXECUTANDO",
+            iniciada_em=agora,
+            trabalhador=trabalhador,
+            tentativas=F("tentativas") + 1,
+        )
+        if reservada:
+            return TarefaPdf.objects.get(pk=pk)
+    return None
+
+
+def _devolver(tarefa: TarefaPdf, **campos) -> None:
+    """Volta a tarefa para PENDENTE; se o caso já tem outra pendente, esta é descartada."""
+    try:
+        with transaction.atomic():
+            TarefaPdf.objects.filter(pk=tarefa.pk).update(status="PENDENTE", **campos)
+    except IntegrityError:
+        TarefaPdf.objects.filter(pk=tarefa.pk).delete()
+
+
+def _falhar(tarefa: TarefaPdf, erro: Exception, definitiva: bool) -> None:
+    metricas.incrementar("pdf_tarefas.falhas")
+    mensagem = f"{type(erro).__name__}: {erro}"
+    if definitiva or tarefa.tentativas >= MAX_TENTATIVAS:
+        TarefaPdf.objects.filter(pk=tarefa.pk).update(status="FALHA", concluida_em=timezone.now(), erro=mensagem)
+        return
+    # Espera exponencial: 10 s, 20 s, 40 s...
+    espera = datetime.timedelta(seconds=10 * 2 ** (tarefa.tentativas - 1))
+    _devolver(tarefa, disponivel_em=timezone.now() + espera, erro=mensagem)
+
+
+def executar(tarefa: TarefaPdf) -> Optional[float]:
+    """Renderiza o PDF da tarefa; devolve a duração em ms, ou ``None`` se falhou."""
+    inicio = time.perf_counter()
+    try:
+        dados = pdf.dados_laudo(arquivo.obter_caso_ou_404(tarefa.id_laboratorio))
+        pdf.obter(dados)
+    except Http404 as erro:
+        _falhar(tarefa, erro, definitiva=True)
+        return None
+    except Exception as erro:
+        _falhar(tarefa, erro, definitiva=False)
+        return None
+    duracao_ms = (time.perf_counter() - inicio) * 1000
+    TarefaPdf.objects.filter(pk=tarefa.pk).update(
+        status="CONCLUIDA", concluida_em=timezone.now(), duracao_ms=duracao_ms, erro=""
+    )
+    metricas.registrar_tempo("pdf_tarefas.execucao", duracao_ms / 1000)
+    return duracao_ms
+
+
+def recuperar_travadas(timeout: datetime.timedelta = TIMEOUT_EXECUCAO) -> int:
+    """Devolve à fila as tarefas cujo trabalhador morreu no meio da execução."""
+    travadas = list(
+        TarefaPdf.objects.filter(status="EXECUTANDO", iniciada_em__lt=timezone.now() - timeout)
+    )
+    for tarefa in travadas:
+        _devolver(tarefa, disponivel_em=timezone.now())
+    return len(travadas)
+
+
+def limpar(dias: int) -> int:
+    """Apaga tarefas concluídas há mais de ``dias`` dias."""
+    removidas, _ = TarefaPdf.objects.filter(
+        status="CONCLUIDA", concluida_em__lt=timezone.now() - datetime.timedelta(days=dias)
+    ).delete()
+    return removidas
+
+
+def profundidade() -> int:
+    return TarefaPdf.objects.filter(status="PENDENTE").count()
+
+
+def estatisticas(janela: datetime.timedelta = datetime.timedelta(hours=1)) -> dict:
+    """Tamanho da fila e duração das renderizações concluídas na ``janela``."""
+    agora = timezone.now()
+    por_status = dict(TarefaPdf.objects.values_list("status").annotate(total=Count("pk")).order_by())
+    mais_antiga = TarefaPdf.objects.filter(status="PENDENTE").aggregate(criada=Min("criada_em"))["criada"]
+    duracoes = TarefaPdf.objects.filter(status="CONCLUIDA", concluida_em__gte=agora - janela).aggregate(
+        quantidade=Count("pk"), media_ms=Avg("duracao_ms"), max_ms=Max("duracao_ms")
+    )
+    return {
+        "profundidade": por_status.get("PENDENTE", 0),
+        "por_status": por_status,
+        "espera_max_s": (agora - mais_antiga).total_seconds() if mais_antiga else 0.0,
+        "duracao_ultima_hora": duracoes,
+    }
+
+
+__all__ = [
+    "MAX_TENTATIVAS",
+    "enfileirar",
+    "estatisticas",
+    "executar",
+    "limpar",
+    "profundidade",
+    "recuperar_travadas",
+    "reservar",
+]
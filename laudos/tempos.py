@@ -0,0 +1,232 @@
+"""Tempos de cada etapa dos casos finalizados, consolidados por dia em ``TempoEtapaDiario``.
+
+Cada métrica de ``METRICAS`` é a diferença entre dois carimbos de ``Caso``. O caso entra no
+dia da sua ``data_finalizacao``, quando todos os carimbos já existem e não mudam mais.
+``consolidar_dia`` refaz as linhas de um dia por inteiro (também a partir dos casos
+arquivados), então rodar de novo é inofensivo. O painel só lê as linhas diárias do
+período, junta os vetores float32 e calcula os percentis de todos os grupos de uma vez
+(``percentis``), sem agregar as linhas de ``Caso`` a cada requisição.
+"""
+
+from __future__ import annotations
+
+import datetime
+import json
+from collections import defaultdict
+from typing import Iterable, Literal, Optional
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import metricas
+from .models import Caso, CasoArquivado, TempoEtapaDiario, UsuarioCustomizado
+
+# nome -> (rótulo, carimbo inicial, carimbo final, quem responde pelo intervalo)
+METRICAS = {
+    "macro": ("Macroscopia", "data_criacao", "macro_preenchido_em", "macro_preenchido_por"),
+    "espera_macro": ("Aprovação da macroscopia", "macro_preenchido_em", "macro_aprovado_em", "macro_aprovado_por"),
+    "preparo": ("Preparo", "macro_aprovado_em", "preparo_preenchido_em", "preparo_preenchido_por"),
+    "espera_preparo": ("Aprovação do preparo", "preparo_preenchido_em", "preparo_aprovado_em", "preparo_aprovado_por"),
+    "micro": ("Microscopia", "preparo_aprovado_em", "micro_preenchido_em", "micro_preenchido_por"),
+    "espera_micro": ("Aprovação da microscopia", "micro_preenchido_em", "micro_aprovado_em", "micro_aprovado_por"),
+    "espera_final": ("Aprovação final", "micro_aprovado_em", "data_finalizacao", "responsavel_final"),
+    "total": ("Total", "data_criacao", "data_finalizacao", "criado_por"),
+}
+QUANTIS = (0.5, 0.9, 0.99)
+AGRUPAMENTOS = ("semana", "solicitante", "usuario")
+_CAMPOS_DATA = sorted({campo for _, inicio, fim, _ in METRICAS.values() for campo in (inicio, fim)})
+_CAMPOS_USUARIO = sorted({usuario for *_, usuario in METRICAS.values()})
+
+
+def _limites(dia: datetime.date) -> tuple[datetime.datetime, datetime.datetime]:
+    inicio = timezone.make_aware(datetime.datetime.combine(dia, datetime.time.min))
+    return inicio, inicio + datetime.timedelta(days=1)
+
+
+def _casos_do_dia(dia: datetime.date) -> list[dict]:
+    inicio, fim = _limites(dia)
+    casos = list(
+        Caso.objects.filter(status="FINALIZADO", data_finalizacao__gte=inicio, data_finalizacao__lt=fim).values(
+            "solicitante", *_CAMPOS_DATA, *_CAMPOS_USUARIO
+        )
+    )
+    # Casos arquivados: os carimbos estão no JSON serializado do grafo.
+    for dados in CasoArquivado.objects.filter(data_finalizacao__gte=inicio, data_finalizacao__lt=fim).values_list(
+        "dados", flat=True
+    ):
+        for objeto in json.loads(dados):
+            if objeto["model"] == "laudos.caso":
+                campos = objeto["fields"]
+                casos.append(
+                    {
+                        "solicitante": campos["solicitante"],
+                        **{campo: parse_datetime(campos[campo]) if campos[campo] else None for campo in _CAMPOS_DATA},
+                        **{campo: campos[campo] for campo in _CAMPOS_USUARIO},
+                    }
+                )
+    return casos
+
+
+def consolidar_dia(dia: datetime.date) -> int:
+    """Refaz as linhas de ``dia``; devolve quantos casos entraram."""
+    casos = _casos_do_dia(dia)
+    usuarios = dict(
+        UsuarioCustomizado.objects.filter(
+            pk__in={caso[campo] for caso in casos for campo in _CAMPOS_USUARIO if caso[campo]}
+        ).values_list("pk", "username")
+    )
+    duracoes: dict[tuple[str, str, str], list[float]] = defaultdict(list)
+    for caso in casos:
+        for metrica, (_, inicio, fim, usuario) in METRICAS.items():
+            if caso[inicio] is None or caso[fim] is None:
+                continue
+            horas = (caso[fim] - caso[inicio]).total_seconds() / 3600
+            # Reedições depois da aprovação podem inverter os carimbos; não são uma duração.
+            if horas < 0:
+                continue
+            duracoes[("geral", metrica, "")].append(horas)
+            duracoes[("solicitante", metrica, caso["solicitante"])].append(horas)
+            if caso[usuario] in usuarios:
+                duracoes[("usuario", metrica, usuarios[caso[usuario]])].append(horas)
+
+    with transaction.atomic():
+        TempoEtapaDiario.objects.filter(
+            dimensao__in=[dimensao for dimensao, _ in TempoEtapaDiario.DIMENSAO_CHOICES], dia=dia
+        ).delete()
+        TempoEtapaDiario.objects.bulk_create(
+            TempoEtapaDiario(
+                dimensao=dimensao,
+                dia=dia,
+                metrica=metrica,
+                valor=valor[:255],
+                quantidade=len(horas),
+                duracoes=np.asarray(horas, dtype="<f4").tobytes(),
+            )
+            for (dimensao, metrica, valor), horas in duracoes.items()
+        )
+    metricas.incrementar("tempos.dias_consolidados")
+    return len(casos)
+
+
+def dias_pendentes(desde: Optional[datetime.date] = None) -> list[datetime.date]:
+    """Dias a consolidar até hoje: a partir de ``desde`` ou do último dia já consolidado.
+
+    O último dia consolidado é refeito, pois pode ter sido lido antes de terminar.
+    """
+    if desde is None:
+        desde = TempoEtapaDiario.objects.filter(dimensao="geral").aggregate(ultimo=Max("dia"))["ultimo"]
+    if desde is None:
+        primeiros = [
+            Caso.objects.filter(status="FINALIZADO").aggregate(primeira=Min("data_finalizacao"))["primeira"],
+            CasoArquivado.objects.aggregate(primeira=Min("data_finalizacao"))["primeira"],
+        ]
+        primeiros = [timezone.localtime(momento).date() for momento in primeiros if momento]
+        if not primeiros:
+            return []
+        desde = min(primeiros)
+    hoje = timezone.localdate()
+    return [desde + datetime.timedelta(days=deslocamento) for deslocamento in range((hoje - desde).days + 1)]
+
+
+def percentis(valores: np.ndarray, grupos: np.ndarray, quantis: Iterable[float] = QUANTIS) -> tuple[np.ndarray, np.ndarray]:
+    """Percentis (interpolação linear, como ``np.percentile``) de cada grupo, numa ordenação só.
+
+    Devolve ``(quantidade, matriz)``: quantas durações cada grupo tem e uma linha de
+    percentis por grupo (NaN nos grupos vazios). ``grupos`` são inteiros de 0 a n-1.
+    """
+    quantis = np.asarray(list(quantis), dtype=np.float64)
+    total_grupos = int(grupos.max()) + 1 if len(grupos) else 0
+    quantidade = np.bincount(grupos, minlength=total_grupos)
+    resultado = np.full((total_grupos, len(quantis)), np.nan)
+    presentes = np.flatnonzero(quantidade)
+    if not len(presentes):
+        return quantidade, resultado
+
+    # Uma ordenação só por chave float64 "grupo * faixa + valor": com a faixa potência de dois
+    # acima do maior valor, a chave separa os grupos e o erro ao tirar o grupo de volta fica
+    # abaixo de 1e-6 h. É bem mais rápido que np.lexsort com duas chaves.
+    valores = valores.astype(np.float64)
+    faixa = 2.0 ** np.ceil(np.log2(max(float(valores.max()), 0.0) + 1))
+    deslocamentos = np.repeat(np.arange(total_grupos, dtype=np.float64) * faixa, quantidade)
+    ordenados = np.sort(grupos * faixa + valores) - deslocamentos
+    inicios = np.concatenate(([0], np.cumsum(quantidade)[:-1]))
+    posicoes = inicios[presentes, None] + quantis[None, :] * (quantidade[presentes, None] - 1)
+    abaixo = np.floor(posicoes).astype(np.int64)
+    acima = np.ceil(posicoes).astype(np.int64)
+    resultado[presentes] = ordenados[abaixo] + (ordenados[acima] - ordenados[abaixo]) * (posicoes - abaixo)
+    return quantidade, resultado
+
+
+def resumo(
+    agrupamento: Literal["semana", "solicitante", "usuario"],
+    inicio: datetime.date,
+    fim: datetime.date,
+) -> list[dict]:
+    """Quantidade e percentis de cada métrica por grupo, entre ``inicio`` e ``fim`` inclusive."""
+    if agrupamento not in AGRUPAMENTOS:
+        raise ValueError(f"Agrupamento inválido: {agrupamento!r}")
+    linhas = TempoEtapaDiario.objects.filter(
+        dimensao="geral" if agrupamento == "semana" else agrupamento,
+        dia__gte=inicio,
+        dia__lte=fim,
+    ).values_list("dia", "metrica", "valor", "quantidade", "duracoes")
+
+    nomes_metricas = list(METRICAS)
+    indice_metrica = {metrica: posicao for posicao, metrica in enumerate(nomes_metricas)}
+    chaves: dict = {}
+    blocos, grupos_linhas, tamanhos = [], [], []
+    with metricas.cronometrar("tempos.resumo"):
+        for dia, metrica, valor, quantidade, duracoes in linhas:
+            if metrica not in indice_metrica:
+                continue
+            chave = dia - datetime.timedelta(days=dia.weekday()) if agrupamento == "semana" else valor
+            grupo = chaves.setdefault(chave, len(chaves))
+            blocos.append(np.frombuffer(bytes(duracoes), dtype="<f4"))
+            grupos_linhas.append(grupo * len(nomes_metricas) + indice_metrica[metrica])
+            tamanhos.append(quantidade)
+        if not blocos:
+            return []
+        valores = np.concatenate(blocos)
+        grupos = np.repeat(np.asarray(grupos_linhas, dtype=np.int64), tamanhos)
+        quantidade, matriz = percentis(valores, grupos)
+
+    total = len(chaves) * len(nomes_metricas)
+    quantidade = np.pad(quantidade, (0, total - len(quantidade)))
+    matriz = np.pad(matriz, ((0, total - len(matriz)), (0, 0)), constant_values=np.nan)
+    resultado = []
+    for chave, grupo in chaves.items():
+        por_metrica = {}
+        for posicao, metrica in enumerate(nomes_metricas):
+            linha = grupo * len(nomes_metricas) + posicao
+            por_metrica[metrica] = {
+                "quantidade": int(quantidade[linha]),
+                **{
+                    f"p{round(quantil * 100)}": None if np.isnan(valor) else round(float(valor), 2)
+                    for quantil, valor in zip(QUANTIS, matriz[linha])
+                },
+            }
+        resultado.append({"grupo": chave, "metricas": por_metrica})
+    if agrupamento == "semana":
+        resultado.sort(key=lambda item: item["grupo"])
+    else:
+        resultado.sort(key=lambda item: (-item["metricas"]["total"]["quantidade"], item["grupo"]))
+    return resultado
+
+
+def ultimo_dia() -> Optional[datetime.date]:
+    return TempoEtapaDiario.objects.filter(dimensao="geral").aggregate(ultimo=Max("dia"))["ultimo"]
+
+
+__all__ = [
+    "AGRUPAMENTOS",
+    "METRICAS",
+    "QUANTIS",
+    "consolidar_dia",
+    "dias_pendentes",
+    "percentis",
+    "resumo",
+    "ultimo_dia",
+]
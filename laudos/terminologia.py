@@ -0,0 +1,124 @@
+"""Codificação dos laudos microscópicos pela terminologia local (``Termo``).
+
+O nome e os sinônimos dos termos ativos viram um autômato de Aho-Corasick
+(``automato.Automato``), e cada campo de ``CAMPOS`` do laudo é lido uma única vez. Os termos
+encontrados ficam em ``CodigoLaudo``, cuja restrição única começa pelo termo e responde às
+consultas por código sem reler os textos. O autômato é montado uma vez por processo e
+conferido a cada uso contra uma versão no cache do Django, que ``invalidar`` avança quando
+um termo é salvo; os laudos já codificados só mudam com ``codificar_laudos``.
+"""
+
+from __future__ import annotations
+
+import threading
+from typing import Iterable
+
+from django.db.models import Count, QuerySet
+
+from . import metricas, versoes
+from .automato import Automato, codificar_lote
+from .models import CodigoLaudo, LaudoMicroscopico, Termo
+
+CHAVE_VERSAO = "laudos:terminologia:versao"
+CAMPOS = ("conclusao", "texto_final")
+
+_trava = threading.Lock()
+_cache: dict = {"versao": None, "automato": None, "padroes": []}
+
+
+def invalidar() -> None:
+    versoes.avancar(CHAVE_VERSAO)
+
+
+def padroes() -> list[tuple[str, int]]:
+    """``(texto, termo)`` do nome e de cada sinônimo dos termos ativos."""
+    return [
+        (texto, pk)
+        for pk, nome, sinonimos in Termo.objects.filter(ativo=True).values_list("pk", "nome", "sinonimos")
+        for texto in [nome, *(sinonimos or [])]
+    ]
+
+
+def _carregar() -> dict:
+    versao = versoes.atual(CHAVE_VERSAO)
+    if _cache["versao"] != versao:
+        with _trava:
+            if _cache["versao"] != versao:
+                metricas.incrementar("terminologia.carregamentos")
+                lidos = padroes()
+                _cache.update(versao=versao, padroes=lidos, automato=Automato(lidos))
+    return _cache
+
+
+def automato() -> Automato:
+    return _carregar()["automato"]
+
+
+def codificar(texto: str) -> list[Termo]:
+    """Termos afirmados em ``texto``, na ordem em que aparecem."""
+    ids = automato().codificar(texto)
+    por_id = Termo.objects.in_bulk(ids)
+    return [por_id[termo_id] for termo_id in ids]
+
+
+def linhas(laudos: Iterable[LaudoMicroscopico]) -> list[tuple[int, dict[str, str]]]:
+    """Entrada de ``automato.codificar_lote``: os campos codificados de cada laudo."""
+    return [(laudo.pk, {campo: getattr(laudo, campo) or "" for campo in CAMPOS}) for laudo in laudos]
+
+
+def gravar(laudo_ids: list[int], encontrados: Iterable[tuple[int, int, str]]) -> tuple[int, int]:
+    """Ajusta ``CodigoLaudo`` dos laudos de ``laudo_ids`` a ``encontrados``; devolve ``(criados, removidos)``."""
+    desejados = set(encontrados)
+    existentes = {
+        (laudo_id, termo_id, campo): pk
+        for pk, laudo_id, termo_id, campo in CodigoLaudo.objects.filter(laudo_id__in=laudo_ids).values_list(
+            "pk", "laudo_id", "termo_id", "campo"
+        )
+    }
+    remover = [pk for chave, pk in existentes.items() if chave not in desejados]
+    criar = [
+        CodigoLaudo(laudo_id=laudo_id, termo_id=termo_id, campo=campo)
+        for laudo_id, termo_id, campo in desejados - existentes.keys()
+    ]
+    if remover:
+        CodigoLaudo.objects.filter(pk__in=remover).delete()
+    if criar:
+        CodigoLaudo.objects.bulk_create(criar)
+    return len(criar), len(remover)
+
+
+def sincronizar(laudos: list[LaudoMicroscopico]) -> tuple[int, int]:
+    """Recodifica os laudos já gravados com a terminologia atual."""
+    return gravar([laudo.pk for laudo in laudos], codificar_lote(linhas(laudos), automato()))
+
+
+def filtrar_casos(queryset: QuerySet, codigos: Iterable[str], campo: str = "") -> QuerySet:
+    """Casos cujo laudo tem algum dos ``codigos``, opcionalmente só em ``campo``."""
+    vinculos = CodigoLaudo.objects.filter(termo__codigo__in=list(codigos))
+    if campo:
+        vinculos = vinculos.filter(campo=campo)
+    return queryset.filter(laudo_microscopico__in=vinculos.values("laudo_id"))
+
+
+def contagem(campo: str = "conclusao") -> list[dict]:
+    """Laudos por termo em ``campo``, do mais frequente para o menos."""
+    return list(
+        CodigoLaudo.objects.filter(campo=campo)
+        .values("termo__codigo", "termo__nome")
+        .annotate(laudos=Count("laudo_id"))
+        .order_by("-laudos", "termo__codigo")
+    )
+
+
+__all__ = [
+    "CAMPOS",
+    "automato",
+    "codificar",
+    "contagem",
+    "filtrar_casos",
+    "gravar",
+    "invalidar",
+    "linhas",
+    "padroes",
+    "sincronizar",
+]
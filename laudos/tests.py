@@ -1,3 +1,1760 @@
-from django.test import TestCase
+import asyncio
+import copy
+import datetime
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import zipfile
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+
+from django.contrib.admin.sites import site
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections, transaction
+from django.db.models import Count, F
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import (
+    aprovacoes,
+    arquivo,
+    automato,
+    autocompletar,
+    busca,
+    cache_worklist,
+    contadores,
+    eventos,
+    exportacao,
+    metricas,
+    pdf,
+    registro_atividade,
+    semelhantes,
+    tags,
+    tarefas_pdf,
+    terminologia,
+    tempos,
+    textos,
+    transicoes,
+    workflow,
+    worklist,
+)
+from .models import (
+    Caso,
+    CasoArquivado,
+    CodigoLaudo,
+    ContadorCaso,
+    LaudoMacroscopico,
+    LaudoMicroscopico,
+    LaudoTag,
+    LogAtividade,
+    LogAtividadeArquivado,
+    Paciente,
+    TarefaPdf,
+    TempoEtapaDiario,
+    Termo,
+    UsuarioCustomizado,
+)
+
+
+DADOS_MACRO = {
+    "num_fragmentos": 1,
+    "dim_comprimento_mm": Decimal("1"),
+    "dim_largura_mm": Decimal("1"),
+    "dim_altura_mm": Decimal("1"),
+    "cor": "Castanho",
+    "consistencia": "Firme",
+    "forma": "Irregular",
+}
+
+# Transições do workflow na ordem do fluxo completo de um caso.
+PASSOS_WORKFLOW = {
+    "registrar_macro": lambda caso, usuario: workflow.registrar_macroscopia(caso, usuario, DADOS_MACRO),
+    "solicitar_macro": workflow.solicitar_macroscopia_aprovacao,
+    "aprovar_macro": workflow.aprovar_macroscopia,
+    "registrar_preparo": lambda caso, usuario: workflow.registrar_preparo(caso, usuario, {"metodo_padrao_he": True}),
+    "solicitar_preparo": workflow.solicitar_preparo_aprovacao,
+    "aprovar_preparo": workflow.aprovar_preparo,
+    "registrar_micro": lambda caso, usuario: workflow.registrar_microscopia(
+        caso, usuario, {"texto_final": "Texto", "conclusao": "Benigno"}
+    ),
+    "solicitar_micro": workflow.solicitar_microscopia_aprovacao,
+    "aprovar_micro": workflow.aprovar_microscopia,
+    "aprovar_final": workflow.aprovar_laudo_final,
+}
+
+
+def _avancar(caso: Caso, usuario: UsuarioCustomizado, ate: str) -> Caso:
+    """Executa as transições do fluxo até ``ate``, inclusive."""
+    for nome, transicao in PASSOS_WORKFLOW.items():
+        transicao(caso, usuario)
+        if nome == ate:
+            return caso
+    raise ValueError(ate)
+
+
+def _plano(queryset) -> list[str]:
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+        return [linha[-1] for linha in cursor.fetchall()]
+
+
+class PlanoDeConsultaCasoTests(TestCase):
+    """Garante que as listas de casos usam os índices compostos em vez de varrer a tabela."""
+
+    TABELA_SCAN = re.compile(r"^SCAN laudos_caso\b(?! USING (COVERING )?INDEX)")
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = UsuarioCustomizado.objects.create_user("aluno", password="x", role="ALUNO")
+        cls.professor = UsuarioCustomizado.objects.create_user("prof", password="x", role="PROFESSOR")
+        paciente = Paciente.objects.create(
+            numero_prontuario="P001", data_nascimento=datetime.date(1980, 1, 1), sexo="F"
+        )
+        Caso.objects.create(
+            id_laboratorio="LAB001",
+            paciente=paciente,
+            data_recebimento=datetime.date(2024, 1, 1),
+            solicitante="Dr. Teste",
+            criado_por=cls.usuario,
+        )
+
+    def assertUsaIndice(self, queryset):
+        plano = _plano(queryset)
+        for linha in plano:
+            self.assertIsNone(
+                self.TABELA_SCAN.search(linha),
+                f"Varredura completa de laudos_caso: {plano}",
+            )
+
+    def assertSemOrdenacaoTemporaria(self, queryset):
+        plano = _plano(queryset)
+        self.assertFalse(
+            any("TEMP B-TREE" in linha for linha in plano),
+            f"Ordenação sem índice: {plano}",
+        )
+
+    def _consultas_worklist(self):
+        """As mesmas consultas do dashboard: filtros, projeção por papel e página por cursor."""
+        cursor = worklist.codificar_cursor(datetime.date(2024, 6, 1), "LAB500")
+        tags_vocabulario = list(tags.textos())[:2]
+        filtros = [
+            {},
+            {"status": "EM_MACROSCOPIA"},
+            {"macro_status": "AGUARDANDO_APROVACAO"},
+            {"preparo_status": "AGUARDANDO_APROVACAO"},
+            {"micro_status": "AGUARDANDO_APROVACAO"},
+            {"criado_por": self.usuario},
+            {"data_inicio": datetime.date(2024, 1, 1), "data_fim": datetime.date(2024, 12, 31)},
+            {"tags": tags_vocabulario[:1], "tags_modo": "todas"},
+            {"tags": tags_vocabulario, "tags_modo": "todas"},
+            {"tags": tags_vocabulario, "tags_modo": "alguma"},
+        ]
+        for usuario in (self.usuario, self.professor):
+            for filtro in filtros:
+                casos = worklist.projetar(worklist.aplicar_filtros(Caso.objects.all(), filtro), usuario)
+                for paginacao in ({}, {"apos": cursor}, {"antes": cursor}):
+                    consulta, _ = worklist.consulta_pagina(casos, **paginacao)
+                    yield (usuario.role, filtro), paginacao, consulta
+
+    def test_worklist_do_dashboard_usa_indices(self):
+        for (papel, filtro), paginacao, consulta in self._consultas_worklist():
+            with self.subTest(papel=papel, filtro=filtro, paginacao=paginacao):
+                self.assertUsaIndice(consulta)
+                if not filtro.get("tags"):
+                    self.assertSemOrdenacaoTemporaria(consulta)
+                    continue
+                # Com tags o plano parte dos vínculos da tag pelo índice e ordena só os casos
+                # encontrados, em vez de percorrer a lista inteira por data.
+                plano = _plano(consulta)
+                self.assertTrue(any("laudos_laudotag" in linha and "INDEX" in linha for linha in plano), plano)
+
+    def test_lista_do_admin_usa_indices(self):
+        ordenacao = site._registry[Caso].ordering
+        self.assertUsaIndice(Caso.objects.order_by(*ordenacao)[:100])
+        for status, _ in Caso.STATUS_CHOICES:
+            with self.subTest(status=status):
+                self.assertUsaIndice(Caso.objects.filter(status=status).order_by(*ordenacao)[:100])
+
+    def test_filas_de_aprovacao_usam_indices_compostos(self):
+        for fila in aprovacoes.FILAS:
+            with self.subTest(fila=fila.slug):
+                consulta = fila.consulta()
+                self.assertUsaIndice(consulta)
+                self.assertSemOrdenacaoTemporaria(consulta)
+                self.assertTrue(
+                    any(f"caso_fila_{fila.slug}_idx" in linha for linha in _plano(consulta)),
+                    _plano(consulta),
+                )
+
+    def test_linha_do_tempo_do_caso_usa_indice(self):
+        caso = Caso.objects.get(pk="LAB001")
+        consulta = caso.logs.select_related("usuario").order_by("-timestamp")[:100]
+        plano = _plano(consulta)
+        self.assertTrue(any("log_caso_timestamp_idx" in linha for linha in plano), plano)
+        self.assertFalse(any("TEMP B-TREE" in linha for linha in plano), plano)
+
+
+class PaginacaoWorklistTests(TestCase):
+    """Cursores por (data_recebimento, id_laboratorio) com muitas datas repetidas."""
+
+    @classmethod
+    def setUpTestData(cls):
+        paciente = Paciente.objects.create(
+            numero_prontuario="P001", data_nascimento=datetime.date(1980, 1, 1), sexo="F"
+        )
+        # 22 casos no mesmo dia e 3 num dia posterior: as páginas de 10 cortam o empate.
+        Caso.objects.bulk_create(
+            Caso(
+                id_laboratorio=f"LAB{numero:03d}",
+                paciente=paciente,
+                data_recebimento=datetime.date(2024, 3, 1) if numero < 22 else datetime.date(2024, 3, 2),
+                solicitante="Dr. Teste",
+            )
+            for numero in range(25)
+        )
+        cls.ordem = list(Caso.objects.order_by(*worklist.ORDENACAO).values_list("pk", flat=True))
+
+    def paginar(self, **cursores):
+        pagina = worklist.paginar(Caso.objects.all(), page_size=10, **cursores)
+        return pagina, [caso.pk for caso in pagina.itens]
+
+    def test_cursores_vao_e_voltam_sem_pular_nem_repetir(self):
+        paginas = []
+        pagina, ids = self.paginar()
+        self.assertIsNone(pagina.anterior_cursor)
+        paginas.append(ids)
+        while pagina.proximo_cursor:
+            pagina, ids = self.paginar(apos=pagina.proximo_cursor)
+            paginas.append(ids)
+        self.assertEqual([len(ids) for ids in paginas], [10, 10, 5])
+        self.assertEqual([caso_id for ids in paginas for caso_id in ids], self.ordem)
+
+        voltando = [ids]
+        while pagina.anterior_cursor:
+            pagina, ids = self.paginar(antes=pagina.anterior_cursor)
+            voltando.append(ids)
+        self.assertEqual(voltando[::-1], paginas)
+        self.assertIsNotNone(pagina.proximo_cursor)
+
+    def test_cursor_invalido_volta_a_primeira_pagina(self):
+        _, primeira = self.paginar()
+        for cursores in ({"apos": "lixo"}, {"antes": "bGl4bw"}, {"apos": ""}):
+            pagina, ids = self.paginar(**cursores)
+            self.assertEqual(ids, primeira, cursores)
+            self.assertIsNone(pagina.anterior_cursor)
+
+
+class ContadoresTests(TestCase):
+    """As transições mantêm ``ContadorCaso`` igual à contagem real, e ``recontar_casos`` conserta divergências."""
+
+    def setUp(self):
+        self.professor = UsuarioCustomizado.objects.create_user("prof", password="x", role="PROFESSOR")
+        paciente = Paciente.objects.create(
+            numero_prontuario="P001", data_nascimento=datetime.date(1980, 1, 1), sexo="F"
+        )
+        for numero, ate in enumerate([None, *PASSOS_WORKFLOW, "registrar_macro"]):
+            caso = workflow.criar_caso(
+                Caso(
+                    id_laboratorio=f"LAB{numero:03d}",
+                    paciente=paciente,
+                    data_recebimento=datetime.date(2024, 1, 1),
+                    solicitante="Dr. Teste",
+                ),
+                self.professor,
+            )
+            if ate:
+                _avancar(caso, self.professor, ate)
+
+    def contadores_gravados(self):
+        return {
+            (contador.status, contador.etapa, contador.etapa_status): contador.total
+            for contador in ContadorCaso.objects.exclude(total=0)
+        }
+
+    def test_transicoes_mantem_os_contadores(self):
+        por_status = {
+            linha["status"]: linha["total"]
+            for linha in Caso.objects.values("status").annotate(total=Count("pk")).order_by()
+        }
+        self.assertEqual(contadores.resumo()["por_status"], por_status)
+        self.assertEqual(contadores.resumo()["total"], Caso.objects.count())
+        self.assertEqual(self.contadores_gravados(), dict(+contadores.contar_casos()))
+
+        # Reedição de um estado já contado não conta o caso duas vezes.
+        workflow.registrar_macroscopia(Caso.objects.get(pk="LAB001"), self.professor, DADOS_MACRO)
+        self.assertEqual(self.contadores_gravados(), dict(+contadores.contar_casos()))
+
+    def test_recontar_casos_conserta_contador_corrompido(self):
+        ContadorCaso.objects.filter(status="FINALIZADO", etapa="MACRO").update(total=F("total") + 5)
+        ContadorCaso.objects.filter(status="RECEBIDO").delete()
+        corretos = dict(+contadores.contar_casos())
+        self.assertNotEqual(self.contadores_gravados(), corretos)
+
+        saida = io.StringIO()
+        call_command("recontar_casos", "--verificar", stdout=saida)
+        self.assertIn("FINALIZADO / MACRO / APROVADO: contador=6 real=1 (diferenca -5)", saida.getvalue())
+        self.assertIn("4 contador(es) divergente(s)", saida.getvalue())
+        self.assertNotEqual(self.contadores_gravados(), corretos)
+
+        saida = io.StringIO()
+        call_command("recontar_casos", stdout=saida)
+        self.assertIn("4 contador(es) corrigido(s)", saida.getvalue())
+        self.assertEqual(self.contadores_gravados(), corretos)
+
+        saida = io.StringIO()
+        call_command("recontar_casos", "--verificar", stdout=saida)
+        self.assertIn("Contadores consistentes.", saida.getvalue())
+
+
+class AnonimizacaoWorklistTests(TestCase):
+    """Alunos só veem os dados do paciente nos casos que criaram; professores veem todos."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.aluno = UsuarioCustomizado.objects.create_user("aluno", password="x", role="ALUNO")
+        cls.outro_aluno = UsuarioCustomizado.objects.create_user("outro", password="x", role="ALUNO")
+        cls.professor = UsuarioCustomizado.objects.create_user("prof", password="x", role="PROFESSOR")
+        for numero, criador in enumerate([cls.aluno, cls.outro_aluno, None]):
+            Caso.objects.create(
+                id_laboratorio=f"LAB{numero:03d}",
+                paciente=Paciente.objects.create(
+                    numero_prontuario=f"P{numero:03d}", data_nascimento=datetime.date(1980, 1, 1 + numero), sexo="F"
+                ),
+                data_recebimento=datetime.date(2024, 1, 1),
+                solicitante="Dr. Teste",
+                criado_por=criador,
+            )
+
+    def linhas(self, usuario):
+        return {linha["id_laboratorio"]: linha for linha in worklist.projetar(Caso.objects.all(), usuario)}
+
+    def paciente(self, linha):
+        return (linha["restrito"], linha["numero_prontuario"], linha["data_nascimento"], linha["sexo"])
+
+    def test_aluno_ve_mascara_nos_casos_de_outros(self):
+        linhas = self.linhas(self.aluno)
+        for caso_id in ("LAB001", "LAB002"):
+            self.assertEqual(self.paciente(linhas[caso_id]), (True, worklist.MASCARA, None, worklist.MASCARA))
+            # Só os dados do paciente são ocultados; o restante da linha continua visível.
+            self.assertEqual(linhas[caso_id]["solicitante"], "Dr. Teste")
+
+    def test_aluno_ve_os_proprios_casos(self):
+        self.assertEqual(
+            self.paciente(self.linhas(self.aluno)["LAB000"]),
+            (False, "P000", datetime.date(1980, 1, 1), "Feminino"),
+        )
+        self.assertEqual(self.paciente(self.linhas(self.outro_aluno)["LAB000"])[0], True)
+
+    def test_professor_ve_todos_os_pacientes(self):
+        linhas = self.linhas(self.professor)
+        self.assertEqual(
+            [self.paciente(linhas[caso_id]) for caso_id in sorted(linhas)],
+            [(False, f"P{numero:03d}", datetime.date(1980, 1, 1 + numero), "Feminino") for numero in range(3)],
+        )
+
+
+class CacheWorklistTests(TestCase):
+    """O HTML da lista é compartilhado só entre quem vê os mesmos dados e cai a cada transição."""
+
+    def setUp(self):
+        cache.clear()
+        metricas.limpar()
+        self.professor = UsuarioCustomizado.objects.create_user("prof", password="x", role="PROFESSOR")
+        self.aluno = UsuarioCustomizado.objects.create_user("aluno", password="x", role="ALUNO")
+        paciente = Paciente.objects.create(
+            numero_prontuario="P001", data_nascimento=datetime.date(1980, 1, 1), sexo="F"
+        )
+        self.caso = workflow.criar_caso(
+            Caso(
+                id_laboratorio="LAB001",
+                paciente=paciente,
+                data_recebimento=datetime.date(2024, 1, 1),
+                solicitante="Dr. Teste",
+            ),
+            self.professor,
+        )
+
+    def worklist_html(self, usuario):
+        self.client.force_login(usuario)
+        return str(self.client.get("/", {"status": ""}).context["worklist_html"])
+
+    def contagem(self):
+        estatisticas = cache_worklist.estatisticas()
+        return estatisticas["acertos"], estatisticas["falhas"]
+
+    def test_aluno_nao_recebe_a_lista_do_professor(self):
+        html_professor = self.worklist_html(self.professor)
+        self.assertIn("P001", html_professor)
+        self.assertEqual(self.contagem(), (0, 1))
+
+        html_aluno = self.worklist_html(self.aluno)
+        self.assertNotIn("P001", html_aluno)
+        self.assertIn("Acesso Restrito", html_aluno)
+        self.assertEqual(self.contagem(), (0, 2))
+
+        self.assertEqual(self.worklist_html(self.aluno), html_aluno)
+        self.assertIn("P001", self.worklist_html(self.professor))
+        self.assertEqual(self.contagem(), (2, 2))
+
+    def test_transicao_invalida_a_entrada(self):
+        self.assertIn("Recebido", self.worklist_html(self.professor))
+        with self.captureOnCommitCallbacks(execute=True):
+            workflow.registrar_macroscopia(self.caso, self.professor, DADOS_MACRO)
+        html = self.worklist_html(self.professor)
+        self.assertEqual(self.contagem(), (0, 2))
+        self.assertIn("Em Macroscopia", html)
+        self.assertIn("Em Macroscopia", self.worklist_html(self.professor))
+        self.assertEqual(self.contagem(), (1, 2))
+
+
+class RequisicaoCondicionalTests(TestCase):
+    """As páginas do caso e o PDF respondem 304 enquanto o caso não muda."""
+
+    URLS = (
+        "/laudos/editar-laudo/LAB001/",
+        "/laudos/laudo-macro/LAB001/",
+        "/laudos/laudo-micro/LAB001/",
+        "/laudos/pdf/LAB001/",
+    )
+
+    def setUp(self):
+        cache.clear()
+        self.diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(self.diretorio.cleanup)
+        configuracao = override_settings(LAUDOS_PDF_CACHE_DIR=self.diretorio.name)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+        self.professor = UsuarioCustomizado.objects.create_user("prof", password="x", role="PROFESSOR")
+        paciente = Paciente.objects.create(
+            numero_prontuario="P001", data_nascimento=datetime.date(1980, 1, 1), sexo="F"
+        )
+        caso = workflow.criar_caso(
+            Caso(
+                id_laboratorio="LAB001",
+                paciente=paciente,
+                data_recebimento=datetime.date(2024, 1, 1),
+                solicitante="Dr. Teste",
+            ),
+            self.professor,
+        )
+        _avancar(caso, self.professor, "registrar_micro")
+        self.client.force_login(self.professor)
+        # A primeira resposta cria o cookie CSRF, que faz parte do ETag das páginas com formulário.
+        self.client.get("/laudos/editar-laudo/LAB001/")
+
+    def get(self, url, etag=None):
+        resposta = self.client.get(url, HTTP_IF_NONE_MATCH=etag) if etag else self.client.get(url)
+        if resposta.streaming:
+            b"".join(resposta.streaming_content)
+        return resposta
+
+    def etags(self):
+        return {url: self.get(url)["ETag"] for url in self.URLS}
+
+    def test_etag_repetido_recebe_304(self):
+        for url, etag in self.etags().items():
+            with self.subTest(url=url):
+                resposta = self.get(url, etag)
+                self.assertEqual(resposta.status_code, 304)
+                self.assertEqual(resposta.content, b"")
+
+    def test_transicao_muda_o_etag(self):
+        anteriores = self.etags()
+        workflow.registrar_microscopia(Caso.objects.get(pk="LAB001"), self.professor, {"conclusao": "Maligno"})
+        for url, etag in anteriores.items():
+            with self.subTest(url=url):
+                resposta = self.get(url, etag)
+                self.assertEqual(resposta.status_code, 200)
+                self.assertNotEqual(resposta["ETag"], etag)
+
+    def test_edicao_fora_do_workflow_muda_o_etag(self):
+        anteriores = self.etags()
+        laudo = LaudoMicroscopico.objects.get(caso="LAB001")
+        laudo.conclusao = "Maligno"
+        laudo.save()
+        for url, etag in anteriores.items():
+            with self.subTest(url=url):
+                self.assertEqual(self.get(url, etag).status_code, 200)
+
+    def test_mensagens_pendentes_impedem_o_304(self):
+        for url, etag in self.etags().items():
+            with self.subTest(url=url):
+                # A view de solicitação recusa GET com uma mensagem e redireciona.
+                self.client.get("/laudos/caso/LAB001/macro/solicitar/")
+                self.assertEqual(self.get(url, etag).status_code, 200)
+                # Exibidas as mensagens, o mesmo ETag volta a valer.
+                self.client.get("/laudos/editar-laudo/LAB001/")
+                self.assertEqual(self.get(url, etag).status_code, 304)
+
+
+class EventosTests(TestCase):
+    """Reconexão por ``Last-Event-ID``, fila cheia e publicação só depois do commit."""
+
+    def assinar(self, transmissor, ultimo_id=None):
+        async def assinar():
+            assinatura = transmissor.assinar(ultimo_id)
+            transmissor.cancelar(assinatura)
+            return assinatura
+
+        return asyncio.run(assinar())
+
+    def publicar(self, transmissor, quantidade):
+        return [transmissor.publicar({"caso": f"LAB{numero:03d}"}).id for numero in range(quantidade)]
+
+    def test_reconexao_recebe_o_que_perdeu(self):
+        transmissor = eventos.Transmissor(tamanho_historico=4, primeiro_id=100)
+        self.assertEqual(self.publicar(transmissor, 3), [100, 101, 102])
+
+        assinatura = self.assinar(transmissor, "100")
+        self.assertFalse(assinatura.atrasada)
+        self.assertEqual([evento.id for evento in assinatura.pendentes], [101, 102])
+        self.assertEqual([evento.id for evento in self.assinar(transmissor, "99").pendentes], [100, 101, 102])
+        self.assertEqual(self.assinar(transmissor, "102").pendentes, [])
+        self.assertEqual(self.assinar(transmissor).pendentes, [])
+
+        # Eventos que já saíram do histórico não podem ser repetidos.
+        self.publicar(transmissor, 3)
+        self.assertTrue(self.assinar(transmissor, "100").atrasada)
+        self.assertFalse(self.assinar(transmissor, "101").atrasada)
+
+    def test_id_desconhecido_pede_recarga(self):
+        anterior = eventos.Transmissor()
+        ids_anteriores = self.publicar(anterior, 3)
+        time.sleep(0.001)
+        # Um processo reiniciado continua a partir do relógio, sem repetir ids.
+        reiniciado = eventos.Transmissor()
+        self.assertGreater(self.publicar(reiniciado, 1)[0], ids_anteriores[-1])
+
+        for ultimo_id in (str(ids_anteriores[-1]), "1", str(10**18), "abc"):
+            with self.subTest(ultimo_id=ultimo_id):
+                assinatura = self.assinar(reiniciado, ultimo_id)
+                self.assertTrue(assinatura.atrasada)
+                self.assertEqual(assinatura.pendentes, [])
+
+    def test_fila_cheia_marca_a_conexao_como_atrasada(self):
+        transmissor = eventos.Transmissor(tamanho_fila=2)
+
+        async def receber():
+            assinatura = transmissor.assinar()
+            self.publicar(transmissor, 3)
+            await asyncio.sleep(0)
+            transmissor.cancelar(assinatura)
+            return assinatura
+
+        assinatura = asyncio.run(receber())
+        self.assertTrue(assinatura.atrasada)
+        self.assertEqual(assinatura.fila.qsize(), 2)
+        self.assertEqual(transmissor.conexoes_ativas, 0)
+
+    def test_publica_o_caso_somente_apos_o_commit(self):
+        transmissor = eventos.Transmissor(primeiro_id=1)
+        professor = UsuarioCustomizado.objects.create_user("prof", password="x", role="PROFESSOR")
+        paciente = Paciente.objects.create(
+            numero_prontuario="P001", data_nascimento=datetime.date(1980, 1, 1), sexo="F"
+        )
+        with mock.patch.object(eventos, "transmissor", transmissor):
+            with self.captureOnCommitCallbacks() as callbacks:
+                caso = workflow.criar_caso(
+                    Caso(
+                        id_laboratorio="LAB001",
+                        paciente=paciente,
+                        data_recebimento=datetime.date(2024, 1, 1),
+                        solicitante="Dr. Teste",
+                    ),
+                    professor,
+                )
+            self.assertEqual(self.assinar(transmissor, "0").pendentes, [])
+            for callback in callbacks:
+                callback()
+
+            # Uma transição desfeita não publica nada.
+            with self.captureOnCommitCallbacks(execute=True), self.assertRaises(ValidationError):
+                with transaction.atomic():
+                    workflow.registrar_macroscopia(caso, professor, DADOS_MACRO)
+                    raise ValidationError("desfazer")
+
+        pendentes = self.assinar(transmissor, "0").pendentes
+        self.assertEqual(len(pendentes), 1)
+        self.assertEqual(
+            json.loads(pendentes[0].dados),
+            {
+                "tipo": "criado",
+                "caso": "LAB001",
+                "status": "RECEBIDO",
+                "macro_status": "PENDENTE",
+                "preparo_status": "PENDENTE",
+                "micro_status": "PENDENTE",
+                "versao": 1,
+            },
+        )
+
+    async def test_view_envia_recarregar_para_id_desconhecido(self):
+        usuario = await UsuarioCustomizado.objects.acreate_user("prof", password="x", role="PROFESSOR")
+        await self.async_client.aforce_login(usuario)
+        resposta = await self.async_client.get("/laudos/eventos/", headers={"Last-Event-ID": "1"})
+        conteudo = b"".join([parte async for parte in resposta.streaming_content])
+        self.assertEqual(conteudo, b"retry: 5000\n\nevent: recarregar\ndata: {}\n\n")
+
+
+class TransicaoConcorrenteTests(TransactionTestCase):
+    """Várias threads aprovam o mesmo caso a partir da mesma leitura; só uma pode vencer."""
+
+    THREADS = 8
+
+    def setUp(self):
+        self.professor = UsuarioCustomizado.objects.create_user("prof", password="x", role="PROFESSOR")
+        paciente = Paciente.objects.create(
+            numero_prontuario="P001", data_nascimento=datetime.date(1980, 1, 1), sexo="F"
+        )
+        caso = workflow.criar_caso(
+            Caso(
+                id_laboratorio="LAB001",
+                paciente=paciente,
+                data_recebimento=datetime.date(2024, 1, 1),
+                solicitante="Dr. Teste",
+            ),
+            self.professor,
+        )
+        workflow.registrar_macroscopia(
+            caso,
+            self.professor,
+            {
+                "num_fragmentos": 1,
+                "dim_comprimento_mm": Decimal("1"),
+                "dim_largura_mm": Decimal("1"),
+                "dim_altura_mm": Decimal("1"),
+                "cor": "Castanho",
+                "consistencia": "Firme",
+                "forma": "Irregular",
+            },
+        )
+        workflow.solicitar_macroscopia_aprovacao(caso, self.professor)
+
+    def _disputar(self, transicao):
+        barreira = threading.Barrier(self.THREADS)
+        resultados = []
+        trava = threading.Lock()
+
+        def executar():
+            try:
+                caso = Caso.objects.get(pk="LAB001")
+                barreira.wait()
+                for _ in range(200):
+                    try:
+                        # Cada tentativa parte de uma cópia da leitura original, pois a transição altera o objeto.
+                        transicao(copy.copy(caso))
+                        resultado = "ok"
+                    except OperationalError:
+                        # O SQLite recusa escritores simultâneos; tenta de novo com a mesma leitura.
+                        continue
+                    except workflow.ConflitoTransicao:
+                        resultado = "conflito"
+                    except Exception as exc:
+                        resultado = exc
+                    break
+                else:
+                    resultado = "bloqueado"
+                with trava:
+                    resultados.append(resultado)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=executar) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return resultados
+
+    def test_apenas_uma_aprovacao_concorrente_vence(self):
+        versao = Caso.objects.get(pk="LAB001").versao
+        resultados = self._disputar(lambda caso: workflow.aprovar_macroscopia(caso, self.professor))
+
+        self.assertEqual(resultados.count("ok"), 1, resultados)
+        self.assertEqual(resultados.count("conflito"), self.THREADS - 1, resultados)
+        caso = Caso.objects.get(pk="LAB001")
+        self.assertEqual(caso.versao, versao + 1)
+        self.assertEqual(caso.macro_status, "APROVADO")
+        self.assertEqual(caso.preparo_status, "EM_PROGRESSO")
+        self.assertEqual(LogAtividade.objects.filter(acao="MACRO_APROVADO").count(), 1)
+        gravados = {
+            (contador.status, contador.etapa, contador.etapa_status): contador.total
+            for contador in ContadorCaso.objects.exclude(total=0)
+        }
+        self.assertEqual(dict(+contadores.contar_casos()), gravados)
+
+    def test_leitura_desatualizada_gera_conflito(self):
+        obsoleto = Caso.objects.get(pk="LAB001")
+        workflow.aprovar_macroscopia(Caso.objects.get(pk="LAB001"), self.professor)
+
+        with self.assertRaises(workflow.ConflitoTransicao):
+            workflow.aprovar_macroscopia(obsoleto, self.professor)
+        self.assertEqual(LogAtividade.objects.filter(acao="MACRO_APROVADO").count(), 1)
+
+
+class RegistroAtividadeTests(TransactionTestCase):
+    """Logs confirmados só com o commit e gravados em lote, no fim do bloco ou numa thread."""
+
+    def setUp(self):
+        self.usuario = UsuarioCustomizado.objects.create_user("prof", password="x", role="PROFESSOR")
+
+    def registrar(self, quantidade, acao="MACRO_SALVO"):
+        for numero in range(quantidade):
+            with transaction.atomic():
+                registro_atividade.registrar(self.usuario, acao, f"Entrada {numero}")
+
+    def inserts(self, consultas):
+        return [consulta for consulta in consultas if consulta["sql"].startswith('INSERT INTO "laudos_logatividade"')]
+
+    def test_coletar_grava_um_lote_e_descarta_savepoint_revertido(self):
+        with CaptureQueriesContext(connection) as consultas:
+            with registro_atividade.coletar():
+                self.registrar(3)
+                with transaction.atomic():
+                    registro_atividade.registrar(self.usuario, "MACRO_APROVADO")
+                    try:
+                        with transaction.atomic():
+                            registro_atividade.registrar(self.usuario, "MACRO_SUBMETIDO")
+                            raise ValueError
+                    except ValueError:
+                        pass
+                self.assertFalse(LogAtividade.objects.exists())
+        self.assertEqual(len(self.inserts(consultas.captured_queries)), 1)
+        self.assertEqual(
+            sorted(LogAtividade.objects.values_list("acao", flat=True)),
+            ["MACRO_APROVADO", "MACRO_SALVO", "MACRO_SALVO", "MACRO_SALVO"],
+        )
+        self.assertEqual(LogAtividade.objects.filter(acao="MACRO_APROVADO").get().etapa, "MACRO")
+
+    def test_middleware_grava_uma_vez_por_requisicao(self):
+        def view(request):
+            antes = LogAtividade.objects.count()
+            self.registrar(2)
+            self.assertEqual(LogAtividade.objects.count(), antes)
+            return HttpResponse("ok")
+
+        middleware = registro_atividade.ColetorLogsMiddleware(view)
+        with CaptureQueriesContext(connection) as consultas:
+            middleware(RequestFactory().get("/"))
+            middleware(RequestFactory().get("/"))
+        self.assertEqual(len(self.inserts(consultas.captured_queries)), 2)
+        self.assertEqual(LogAtividade.objects.count(), 4)
+
+    def test_modo_assincrono_grava_tudo_ao_aguardar(self):
+        for _ in range(3):
+            with registro_atividade.coletar(assincrono=True):
+                self.registrar(50)
+        registro_atividade.gravador.aguardar()
+        self.assertEqual(registro_atividade.gravador.pendentes, 0)
+        self.assertEqual(LogAtividade.objects.count(), 150)
+
+
+class VincularLogsCasosTests(TestCase):
+    """``vincular_logs_casos`` acha o caso nos detalhes dos logs antigos, inclusive ids com espaço."""
+
+    def setUp(self):
+        paciente = Paciente.objects.create(
+            numero_prontuario="P001", data_nascimento=datetime.date(1980, 1, 1), sexo="F"
+        )
+        for caso_id in ("LAB001", "LAB 002", "LAB 002 B"):
+            Caso.objects.create(
+                id_laboratorio=caso_id,
+                paciente=paciente,
+                data_recebimento=datetime.date(2024, 1, 1),
+                solicitante="Dr. Teste",
+            )
+        # Formato anterior a ``caso``/``etapa``: só o texto de detalhes identifica o caso.
+        antigos = [
+            ("CASO_CRIADO", "Caso LAB001 criado."),
+            ("MACRO_SALVO", "Caso LAB 002 macroscopia registrada."),
+            ("PREPARO_APROVADO", "Caso LAB 002 B preparo aprovado."),
+            ("MICRO_SUBMETIDO", "Caso LAB 002 microscopia enviada para aprovação."),
+            ("LAUDO_FINAL_APROVADO", "Caso LAB001 laudo final aprovado."),
+            ("MACRO_APROVADO", "Caso LAB999 macroscopia aprovada."),
+            ("OUTRA", "Caso LAB001 aberto pelo administrador."),
+        ]
+        LogAtividade.objects.bulk_create(
+            LogAtividade(acao=acao, detalhes=detalhes, timestamp=timezone.now()) for acao, detalhes in antigos
+        )
+
+    def test_vincula_caso_e_etapa(self):
+        saida = io.StringIO()
+        call_command("vincular_logs_casos", "--lote", "2", stdout=saida)
+        self.assertIn("5 de 7 registros vinculados a casos; 2 sem caso identificavel.", saida.getvalue())
+        self.assertEqual(
+            list(LogAtividade.objects.order_by("pk").values_list("detalhes", "caso", "etapa")),
+            [
+                ("Caso LAB001 criado.", "LAB001", ""),
+                ("Caso LAB 002 macroscopia registrada.", "LAB 002", "MACRO"),
+                ("Caso LAB 002 B preparo aprovado.", "LAB 002 B", "PREPARO"),
+                ("Caso LAB 002 microscopia enviada para aprovação.", "LAB 002", "MICRO"),
+                ("Caso LAB001 laudo final aprovado.", "LAB001", "FINAL"),
+                ("Caso LAB999 macroscopia aprovada.", None, "MACRO"),
+                ("Caso LAB001 aberto pelo administrador.", None, ""),
+            ],
+        )
+
+        # Rodar de novo só relê os que continuam sem caso.
+        saida = io.StringIO()
+        call_command("vincular_logs_casos", stdout=saida)
+        self.assertIn("0 de 2 registros vinculados", saida.getvalue())
+
+
+class AprovacaoEmLoteTests(TestCase):
+    """Aprovação de vários casos com um UPDATE condicional, desfeita inteira em conflito."""
+
+    def setUp(self):
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        configuracao = override_settings(LAUDOS_SEMELHANTES_DIR=diretorio.name)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+        self.professor = UsuarioCustomizado.objects.create_user("prof", password="x", role="PROFESSOR")
+        paciente = Paciente.objects.create(
+            numero_prontuario="P001", data_nascimento=datetime.date(1980, 1, 1), sexo="F"
+        )
+        for id_laboratorio, status in (
+            ("LAB001", "AGUARDANDO_APROVACAO_FINAL"),
+            ("LAB002", "AGUARDANDO_APROVACAO_FINAL"),
+            ("LAB003", "FINALIZADO"),
+        ):
+            caso = Caso.objects.create(
+                id_laboratorio=id_laboratorio,
+                paciente=paciente,
+                data_recebimento=datetime.date(2024, 1, 1),
+                solicitante="Dr. Teste",
+                status=status,
+                macro_status="APROVADO",
+                preparo_status="APROVADO",
+                micro_status="APROVADO",
+            )
+            LaudoMicroscopico.objects.create(caso=caso, texto_final="Texto", conclusao="Conclusão")
+        call_command("recontar_casos", stdout=io.StringIO())
+        self.versoes = dict(Caso.objects.values_list("pk", "versao"))
+
+    def contadores_gravados(self):
+        return {
+            (contador.status, contador.etapa, contador.etapa_status): contador.total
+            for contador in ContadorCaso.objects.exclude(total=0)
+        }
+
+    def test_aprova_validos_e_informa_os_demais(self):
+        self.client.force_login(self.professor)
+        with self.captureOnCommitCallbacks(execute=True):
+            resposta = self.client.post(
+                "/laudos/aprovar-em-lote/",
+                {"etapa": "final", "casos": ["LAB001", "LAB003", "NAOEXISTE", "LAB002"]},
+                content_type="application/json",
+            )
+        corpo = resposta.json()
+        self.assertEqual(corpo["aprovados"], 2)
+        self.assertEqual(
+            {caso_id: (linha["ok"], linha["mensagem"]) for caso_id, linha in corpo["resultados"].items()},
+            {
+                "LAB001": (True, "Aprovado."),
+                "LAB002": (True, "Aprovado."),
+                "LAB003": (False, "Laudo já está finalizado."),
+                "NAOEXISTE": (False, "Caso não encontrado."),
+            },
+        )
+
+        for caso in Caso.objects.filter(pk__in=["LAB001", "LAB002"]):
+            self.assertEqual(caso.status, "FINALIZADO")
+            self.assertEqual(caso.responsavel_final, self.professor)
+            self.assertIsNotNone(caso.data_finalizacao)
+            self.assertEqual(caso.versao, self.versoes[caso.pk] + 1)
+        self.assertEqual(Caso.objects.get(pk="LAB003").versao, self.versoes["LAB003"])
+        self.assertEqual(dict(+contadores.contar_casos()), self.contadores_gravados())
+        self.assertEqual(
+            sorted(LogAtividade.objects.filter(acao="LAUDO_FINAL_APROVADO").values_list("caso_id", flat=True)),
+            ["LAB001", "LAB002"],
+        )
+        self.assertEqual(
+            sorted(TarefaPdf.objects.values_list("id_laboratorio", flat=True)), ["LAB001", "LAB002"]
+        )
+        self.assertEqual(semelhantes.total(), 2)
+
+    def test_versao_alterada_desfaz_o_lote_inteiro(self):
+        contadores_antes = self.contadores_gravados()
+        permissoes = transicoes.permissoes
+
+        def permissoes_com_edicao_concorrente(linha, papel):
+            # Outra pessoa grava o LAB002 entre a leitura do lote e o UPDATE.
+            if linha["id_laboratorio"] == "LAB002":
+                Caso.objects.filter(pk="LAB002").update(versao=F("versao") + 1)
+            return permissoes(linha, papel)
+
+        transicoes.permissoes = permissoes_com_edicao_concorrente
+        self.addCleanup(setattr, transicoes, "permissoes", permissoes)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(workflow.ConflitoTransicao):
+                workflow.aprovar_em_lote("final", ["LAB001", "LAB002"], self.professor)
+        self.assertEqual(callbacks, [])
+
+        self.assertEqual(
+            dict(Caso.objects.values_list("pk", "status")),
+            {"LAB001": "AGUARDANDO_APROVACAO_FINAL", "LAB002": "AGUARDANDO_APROVACAO_FINAL", "LAB003": "FINALIZADO"},
+        )
+        self.assertEqual(Caso.objects.get(pk="LAB001").versao, self.versoes["LAB001"])
+        self.assertEqual(self.contadores_gravados(), contadores_antes)
+        self.assertFalse(LogAtividade.objects.exists())
+
+
+class TabelaTransicoesTests(TestCase):
+    """A tabela compilada libera ou bloqueia cada ação com a exceção e a mensagem do workflow."""
+
+    # (macro, preparo, micro, status), papel, ação, None se permitida ou (exceção, mensagem)
+    CASOS = [
+        (("PENDENTE", "PENDENTE", "PENDENTE", "RECEBIDO"), "ALUNO", "registrar_macro", None),
+        (
+            ("PENDENTE", "PENDENTE", "PENDENTE", "RECEBIDO"),
+            "ALUNO",
+            "solicitar_macro",
+            (ValidationError, "Macroscopia precisa estar em progresso para ser submetida."),
+        ),
+        (("EM_PROGRESSO", "PENDENTE", "PENDENTE", "EM_MACROSCOPIA"), "ALUNO_N2", "solicitar_macro", None),
+        (
+            ("AGUARDANDO_APROVACAO", "PENDENTE", "PENDENTE", "PENDENTE_MACRO_APROVACAO"),
+            "ALUNO",
+            "registrar_macro",
+            (ValidationError, "Macroscopia já foi submetida para aprovação e não pode ser editada."),
+        ),
+        (
+            ("AGUARDANDO_APROVACAO", "PENDENTE", "PENDENTE", "PENDENTE_MACRO_APROVACAO"),
+            "ALUNO",
+            "aprovar_macro",
+            (PermissionDenied, transicoes.MENSAGEM_PAPEL),
+        ),
+        (
+            ("AGUARDANDO_APROVACAO", "PENDENTE", "PENDENTE", "PENDENTE_MACRO_APROVACAO"),
+            "PROFESSOR",
+            "aprovar_macro",
+            None,
+        ),
+        (
+            ("EM_PROGRESSO", "PENDENTE", "PENDENTE", "EM_MACROSCOPIA"),
+            "PROFESSOR",
+            "aprovar_macro",
+            (ValidationError, "Macroscopia não está aguardando aprovação."),
+        ),
+        (
+            ("EM_PROGRESSO", "PENDENTE", "PENDENTE", "EM_MACROSCOPIA"),
+            "PROFESSOR",
+            "registrar_preparo",
+            (ValidationError, "Macroscopia precisa ser aprovada antes do registro do preparo."),
+        ),
+        (("APROVADO", "REPROVADO", "PENDENTE", "EM_PREPARO"), "FUNCIONARIO_LAB", "registrar_preparo", None),
+        (
+            ("APROVADO", "AGUARDANDO_APROVACAO", "PENDENTE", "PENDENTE_PREPARO_APROVACAO"),
+            "FUNCIONARIO_LAB",
+            "aprovar_preparo",
+            (PermissionDenied, transicoes.MENSAGEM_PAPEL),
+        ),
+        (
+            ("APROVADO", "EM_PROGRESSO", "PENDENTE", "EM_PREPARO"),
+            "ALUNO",
+            "registrar_micro",
+            (ValidationError, "A microscopia só pode ser registrada após macroscopia e preparo aprovados."),
+        ),
+        (("APROVADO", "APROVADO", "AGUARDANDO_APROVACAO", "PENDENTE_MICRO_APROVACAO"), "ADMIN", "aprovar_micro", None),
+        # Aprovação final: só professores, só com todas as etapas aprovadas e uma única vez.
+        (("APROVADO", "APROVADO", "APROVADO", "AGUARDANDO_APROVACAO_FINAL"), "PROFESSOR", "aprovar_final", None),
+        (("APROVADO", "APROVADO", "APROVADO", "AGUARDANDO_APROVACAO_FINAL"), "ADMIN", "aprovar_final", None),
+        (
+            ("APROVADO", "APROVADO", "APROVADO", "AGUARDANDO_APROVACAO_FINAL"),
+            "ALUNO_N2",
+            "aprovar_final",
+            (PermissionDenied, transicoes.MENSAGEM_PAPEL),
+        ),
+        (
+            ("APROVADO", "APROVADO", "APROVADO", "AGUARDANDO_APROVACAO_FINAL"),
+            "PAPEL_DESCONHECIDO",
+            "aprovar_final",
+            (PermissionDenied, transicoes.MENSAGEM_PAPEL),
+        ),
+        (
+            ("APROVADO", "APROVADO", "AGUARDANDO_APROVACAO", "PENDENTE_MICRO_APROVACAO"),
+            "PROFESSOR",
+            "aprovar_final",
+            (ValidationError, "Todas as etapas precisam estar aprovadas antes da aprovação final."),
+        ),
+        (
+            ("APROVADO", "APROVADO", "APROVADO", "FINALIZADO"),
+            "PROFESSOR",
+            "aprovar_final",
+            (ValidationError, "Laudo já está finalizado."),
+        ),
+        # O estado é conferido antes do papel: um aluno recebe o motivo do bloqueio, não a falta de permissão.
+        (
+            ("APROVADO", "APROVADO", "APROVADO", "FINALIZADO"),
+            "ALUNO",
+            "aprovar_final",
+            (ValidationError, "Laudo já está finalizado."),
+        ),
+    ]
+
+    def test_tabela_compilada(self):
+        for (macro, preparo, micro, status), papel, acao, esperado in self.CASOS:
+            linha = {"macro_status": macro, "preparo_status": preparo, "micro_status": micro, "status": status}
+            with self.subTest(estado=(macro, preparo, micro, status), papel=papel, acao=acao):
+                permissoes = transicoes.permissoes(linha, papel)
+                caso = Caso(**linha)
+                self.assertIs(transicoes.permissoes(caso, papel), permissoes)
+                if esperado is None:
+                    self.assertTrue(permissoes.permite(acao))
+                    self.assertIsNone(permissoes.erro(acao))
+                    self.assertIsNone(permissoes.motivo(acao))
+                    transicoes.exigir(caso, UsuarioCustomizado(role=papel), acao)
+                    continue
+                excecao, mensagem = esperado
+                self.assertFalse(permissoes.permite(acao))
+                self.assertEqual(permissoes.erro(acao), mensagem)
+                with self.assertRaises(excecao) as contexto:
+                    transicoes.exigir(caso, UsuarioCustomizado(role=papel), acao)
+                erro = contexto.exception
+                self.assertEqual(erro.message if excecao is ValidationError else str(erro), mensagem)
+
+    def test_avisos_curtos_dependem_do_valor_atual(self):
+        linha = {
+            "macro_status": "APROVADO",
+            "preparo_status": "AGUARDANDO_APROVACAO",
+            "micro_status": "PENDENTE",
+            "status": "PENDENTE_PREPARO_APROVACAO",
+        }
+        permissoes = transicoes.permissoes(linha, "ALUNO")
+        self.assertEqual(permissoes.motivo("registrar_macro"), "Macroscopia aprovada.")
+        self.assertEqual(permissoes.motivo("registrar_preparo"), "Preparo aguardando aprovacao.")
+        self.assertEqual(permissoes.motivo("registrar_micro"), "Aguarde a aprovacao do preparo.")
+        self.assertEqual(permissoes.motivo("aprovar_preparo"), transicoes.MENSAGEM_PAPEL)
+
+
+class ArquivamentoTests(TestCase):
+    """Casos finalizados antigos saem das tabelas de trabalho, mas continuam legíveis."""
+
+    def setUp(self):
+        self.usuario = UsuarioCustomizado.objects.create_user("prof", password="x", role="PROFESSOR")
+        paciente = Paciente.objects.create(
+            numero_prontuario="P001", data_nascimento=datetime.date(1980, 1, 1), sexo="F"
+        )
+        for id_laboratorio, dias in (("LAB001", 400), ("LAB002", 10)):
+            caso = Caso.objects.create(
+                id_laboratorio=id_laboratorio,
+                paciente=paciente,
+                data_recebimento=datetime.date(2024, 1, 1),
+                solicitante="Dr. Teste",
+                criado_por=self.usuario,
+                status="FINALIZADO",
+                macro_status="APROVADO",
+                preparo_status="APROVADO",
+                micro_status="APROVADO",
+                data_finalizacao=timezone.now() - datetime.timedelta(days=dias),
+            )
+            LaudoMicroscopico.objects.create(caso=caso, texto_final="Texto", conclusao="Conclusão")
+            LogAtividade.objects.create(
+                usuario=self.usuario, caso=caso, etapa="FINAL", acao="LAUDO_FINAL_APROVADO"
+            )
+        call_command("recontar_casos", stdout=io.StringIO())
+
+    def test_arquiva_casos_antigos_com_laudos_e_logs(self):
+        arquivados = list(arquivo.arquivar(arquivo.limite_para(365), lote=1))
+
+        self.assertEqual(arquivados, [("casos", 1)])
+        self.assertEqual(list(Caso.objects.values_list("pk", flat=True)), ["LAB002"])
+        self.assertTrue(CasoArquivado.objects.filter(pk="LAB001").exists())
+        self.assertFalse(LogAtividade.objects.filter(caso_id="LAB001").exists())
+        self.assertEqual(LogAtividadeArquivado.objects.filter(id_laboratorio="LAB001").count(), 1)
+        gravados = {
+            (contador.status, contador.etapa, contador.etapa_status): contador.total
+            for contador in ContadorCaso.objects.exclude(total=0)
+        }
+        self.assertEqual(dict(+contadores.contar_casos()), gravados)
+
+        caso = arquivo.obter_caso_ou_404("LAB001")
+        self.assertTrue(caso.arquivado)
+        with self.assertNumQueries(0):
+            self.assertEqual(caso.paciente.numero_prontuario, "P001")
+            self.assertEqual(caso.laudo_microscopico.conclusao, "Conclusão")
+            self.assertIsNone(getattr(caso, "laudo_macroscopico", None))
+        self.assertEqual([log.acao for log in arquivo.linha_do_tempo(caso, 10)], ["LAUDO_FINAL_APROVADO"])
+
+    def test_caso_arquivado_sobrevive_a_usuario_excluido_e_coluna_removida(self):
+        Caso.objects.filter(pk="LAB001").update(responsavel_final=self.usuario)
+        list(arquivo.arquivar(arquivo.limite_para(365), lote=1, tipos=("casos",)))
+        registro = CasoArquivado.objects.get(pk="LAB001")
+        # Simula um snapshot gravado quando o modelo ainda tinha outra coluna.
+        registro.dados = registro.dados.replace('"solicitante":', '"coluna_removida": 1, "solicitante":', 1)
+        registro.save()
+        self.usuario.delete()
+
+        caso = arquivo.obter_caso_ou_404("LAB001")
+        with self.assertNumQueries(0):
+            self.assertIsNone(caso.responsavel_final)
+            self.assertIsNone(caso.criado_por)
+        self.assertEqual(pdf.dados_laudo(caso)["responsavel"], "Responsável")
+
+
+class CachePdfTests(TestCase):
+    """O PDF é reaproveitado enquanto o conteúdo não muda e descartado quando muda."""
+
+    def setUp(self):
+        self.diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(self.diretorio.cleanup)
+        configuracao = override_settings(LAUDOS_PDF_CACHE_DIR=self.diretorio.name)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+        paciente = Paciente.objects.create(
+            numero_prontuario="P001", data_nascimento=datetime.date(1980, 1, 1), sexo="F"
+        )
+        self.caso = Caso.objects.create(
+            id_laboratorio="LAB001",
+            paciente=paciente,
+            data_recebimento=datetime.date(2024, 1, 1),
+            solicitante="Dr. Teste",
+        )
+        self.micro = LaudoMicroscopico.objects.create(caso=self.caso, texto_final="Texto", conclusao="Benigno")
+
+    def test_reaproveita_e_invalida_pelo_conteudo(self):
+        dados = pdf.dados_laudo(self.caso)
+        primeiro = pdf.obter(dados)
+        self.assertTrue(primeiro.read_bytes().startswith(b"%PDF"))
+        with self.assertNumQueries(0):
+            self.assertEqual(pdf.obter(pdf.dados_laudo(self.caso)), primeiro)
+
+        self.micro.conclusao = "Maligno"
+        self.micro.save()
+        segundo = pdf.obter(pdf.dados_laudo(Caso.objects.get(pk="LAB001")))
+        self.assertNotEqual(segundo, primeiro)
+        self.assertFalse(primeiro.exists())
+
+        pdf.invalidar(["LAB001"])
+        self.assertFalse(segundo.exists())
+
+    def test_etag_do_pdf_responde_304_sem_carregar_o_laudo(self):
+        cache.clear()
+        self.client.force_login(UsuarioCustomizado.objects.create_user("prof", password="x", role="PROFESSOR"))
+        primeira = self.client.get("/laudos/pdf/LAB001/")
+        self.assertEqual(primeira.status_code, 200)
+        b"".join(primeira.streaming_content)
+        etag = primeira["ETag"]
+
+        # Sessão, usuário e a versão do caso: nada de laudos nem de hash do conteúdo.
+        with self.assertNumQueries(3):
+            resposta = self.client.get("/laudos/pdf/LAB001/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 304)
+
+        self.micro.conclusao = "Maligno"
+        self.micro.save()
+        resposta = self.client.get("/laudos/pdf/LAB001/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertNotEqual(resposta["ETag"], etag)
+        b"".join(resposta.streaming_content)
+
+    def test_ids_com_o_mesmo_nome_higienizado_nao_colidem(self):
+        dados = pdf.dados_laudo(self.caso)
+        barra = pdf.obter({**dados, "id_laboratorio": "A/1"})
+        sublinhado = pdf.obter({**dados, "id_laboratorio": "A_1"})
+        self.assertNotEqual(barra.name.rsplit("-", 1)[0], sublinhado.name.rsplit("-", 1)[0])
+
+        pdf.invalidar(["A/1"])
+        self.assertFalse(barra.exists())
+        self.assertTrue(sublinhado.exists())
+
+    def test_limite_descarta_os_menos_usados(self):
+        dados = pdf.dados_laudo(self.caso)
+        antigo = pdf.obter({**dados, "id_laboratorio": "LAB000"})
+        os.utime(antigo, (0, 0))
+        with override_settings(LAUDOS_PDF_CACHE_MAX_BYTES=antigo.stat().st_size + 1):
+            recente = pdf.obter(dados)
+        self.assertFalse(antigo.exists())
+        self.assertTrue(recente.exists())
+
+    def test_texto_longo_quebra_linhas_e_paginas(self):
+        self.micro.texto_final = "\n\n".join(["Epitélio pavimentoso estratificado com acantose. " * 40] * 12)
+        self.micro.save()
+        dados = pdf.dados_laudo(Caso.objects.get(pk="LAB001"))
+        saida = io.BytesIO()
+        paginas = pdf.renderizar(dados, saida)
+        self.assertGreater(paginas, 1)
+        # O cabeçalho é um único form XObject reaproveitado em todas as páginas.
+        self.assertEqual(saida.getvalue().count(b"/Subtype /Form"), 1)
+
+    def test_fila_renderiza_cada_caso_uma_vez(self):
+        tarefas_pdf.enfileirar(["LAB001", "LAB001", "NAOEXISTE"])
+        tarefas_pdf.enfileirar(["LAB001"])
+        self.assertEqual(tarefas_pdf.profundidade(), 2)
+
+        while (tarefa := tarefas_pdf.reservar("teste")) is not None:
+            tarefas_pdf.executar(tarefa)
+
+        self.assertEqual(
+            dict(TarefaPdf.objects.values_list("id_laboratorio", "status")),
+            {"LAB001": "CONCLUIDA", "NAOEXISTE": "FALHA"},
+        )
+        self.assertTrue(pdf.caminho(pdf.dados_laudo(self.caso), pdf.chave(pdf.dados_laudo(self.caso))).exists())
+        self.assertEqual(tarefas_pdf.estatisticas()["profundidade"], 0)
+
+    def test_exportacao_gera_zip_valido_e_preenche_o_cache(self):
+        Caso.objects.filter(pk="LAB001").update(status="FINALIZADO", data_finalizacao=timezone.now())
+        ids = exportacao.selecionar(ids=["LAB001", "LAB999"])
+        self.assertEqual(ids, ["LAB001"])
+
+        # Pedir mais processos que o limite do servidor não passa dele; a vaga volta no fim.
+        with override_settings(LAUDOS_EXPORTACAO_PROCESSOS=1):
+            conteudo = b"".join(exportacao.gerar_zip(ids, workers=4))
+        self.assertEqual(exportacao._processos_em_uso, 0)
+        with zipfile.ZipFile(io.BytesIO(conteudo)) as zf:
+            self.assertEqual(zf.namelist(), ["laudo_LAB001.pdf"])
+            self.assertTrue(zf.read("laudo_LAB001.pdf").startswith(b"%PDF"))
+        dados = pdf.dados_laudo(Caso.objects.get(pk="LAB001"))
+        self.assertIsNotNone(pdf.em_cache(dados, pdf.chave(dados)))
+
+
+class TextosTests(TestCase):
+    """Os textos compostos no servidor acompanham os modelos e podem ser regenerados em lote."""
+
+    def setUp(self):
+        paciente = Paciente.objects.create(
+            numero_prontuario="P001", data_nascimento=datetime.date(1980, 1, 1), sexo="F"
+        )
+        self.caso = Caso.objects.create(
+            id_laboratorio="LAB001",
+            paciente=paciente,
+            data_recebimento=datetime.date(2024, 1, 1),
+            solicitante="Dr. Teste",
+        )
+
+    def test_compoe_macro_e_micro(self):
+        dados = {
+            "num_fragmentos": 2,
+            "dim_comprimento_mm": Decimal("10.50"),
+            "dim_largura_mm": Decimal("5.00"),
+            "dim_altura_mm": Decimal("3"),
+            "tipo_tecido": "mole",
+            "cor": "acinzentada",
+            "consistencia": "firme",
+            "forma": "",
+        }
+        texto = textos.texto_macro(dados)
+        self.assertEqual(
+            texto,
+            "O material recebido para exame consta de 2 fragmentos de tecido mole medindo "
+            "10.5 x 5 x 3 mm de cor acinzentada e consistência firme.",
+        )
+        self.assertTrue(textos.equivalentes(texto.replace("10.5", "10.50").replace("firme.", "firme ."), texto))
+        self.assertEqual(
+            textos.texto_micro(["Edema", "Acantose"], tags.textos()),
+            tags.textos()["Acantose"] + textos.SEPARADOR_TAGS + tags.textos()["Edema"],
+        )
+        with self.assertRaises(textos.ErroModelo):
+            textos.compilar("consta de [{fragmentos}")
+
+    def test_regenerar_textos_preserva_edicoes(self):
+        macro = LaudoMacroscopico.objects.create(
+            caso=self.caso,
+            num_fragmentos=1,
+            dim_comprimento_mm=Decimal("4"),
+            dim_largura_mm=Decimal("2"),
+            dim_altura_mm=Decimal("1"),
+            tipo_tecido="osseo",
+            cor="marrom",
+            consistencia="rígida",
+            forma="irregular",
+            texto_gerado="texto antigo",
+            texto_editado="texto do residente",
+        )
+        micro = LaudoMicroscopico.objects.create(
+            caso=self.caso,
+            tags_selecionadas=["Fibrose"],
+            texto_base_gerado="texto antigo",
+            texto_final="Texto",
+            conclusao="Benigno",
+        )
+
+        call_command("regenerar_textos", "--verificar", stdout=io.StringIO())
+        macro.refresh_from_db()
+        self.assertEqual(macro.texto_gerado, "texto antigo")
+
+        call_command("regenerar_textos", "--lote", "1", stdout=io.StringIO())
+        macro.refresh_from_db()
+        micro.refresh_from_db()
+        self.assertEqual(macro.texto_gerado, textos.texto_macro(macro))
+        self.assertIn("fragmento de tecido ósseo medindo 4 x 2 x 1 mm", macro.texto_gerado)
+        self.assertEqual(macro.texto_editado, "texto do residente")
+        self.assertEqual(micro.texto_base_gerado, tags.textos()["Fibrose"])
+        self.assertEqual(micro.texto_final, "Texto")
+
+    def test_regenerar_textos_versiona_reindexa_e_poupa_finalizados(self):
+        professor = UsuarioCustomizado.objects.create_user("prof", password="x", role="PROFESSOR")
+        assinado = Caso.objects.create(
+            id_laboratorio="LAB002",
+            paciente=self.caso.paciente,
+            data_recebimento=datetime.date(2024, 1, 1),
+            solicitante="Dr. Teste",
+            status="FINALIZADO",
+        )
+        for caso in (self.caso, assinado):
+            LaudoMacroscopico.objects.create(
+                caso=caso,
+                num_fragmentos=1,
+                dim_comprimento_mm=Decimal("4"),
+                dim_largura_mm=Decimal("2"),
+                dim_altura_mm=Decimal("1"),
+                tipo_tecido="osseo",
+                cor="marrom",
+                consistencia="rígida",
+                texto_gerado="texto antigo",
+            )
+        busca.limpar()
+        busca.indexar(["LAB001", "LAB002"])
+        versoes = dict(Caso.objects.values_list("pk", "versao"))
+
+        call_command("regenerar_textos", "--somente", "macro", stdout=io.StringIO())
+        self.assertEqual(Caso.objects.get(pk="LAB001").versao, versoes["LAB001"] + 1)
+        self.assertEqual(Caso.objects.get(pk="LAB002").versao, versoes["LAB002"])
+        self.assertEqual(LaudoMacroscopico.objects.get(caso_id="LAB002").texto_gerado, "texto antigo")
+        self.assertEqual([linha["id_laboratorio"] for linha in busca.pesquisar("ósseo", professor)], ["LAB001"])
+
+        call_command("regenerar_textos", "--somente", "macro", "--incluir-finalizados", stdout=io.StringIO())
+        self.assertEqual(Caso.objects.get(pk="LAB002").versao, versoes["LAB002"] + 1)
+        self.assertEqual(
+            sorted(linha["id_laboratorio"] for linha in busca.pesquisar("ósseo", professor)), ["LAB001", "LAB002"]
+        )
+
+
+class TagsTests(TestCase):
+    """Seleções de tags indexadas em LaudoTag e consultadas pelo índice."""
+
+    def setUp(self):
+        paciente = Paciente.objects.create(
+            numero_prontuario="P001", data_nascimento=datetime.date(1980, 1, 1), sexo="F"
+        )
+        selecoes = {
+            "LAB001": ["Displasia", "Atipia Citologica"],
+            "LAB002": ["displasia"],
+            "LAB003": ["Fibrose", "Tag antiga"],
+        }
+        for id_laboratorio, selecionadas in selecoes.items():
+            caso = Caso.objects.create(
+                id_laboratorio=id_laboratorio,
+                paciente=paciente,
+                data_recebimento=datetime.date(2024, 1, 1),
+                solicitante="Dr. Teste",
+            )
+            LaudoMicroscopico.objects.create(
+                caso=caso, tags_selecionadas=selecionadas, texto_final="Texto", conclusao="Benigno"
+            )
+
+    def test_indexa_e_consulta_por_tags(self):
+        versoes = dict(Caso.objects.values_list("pk", "versao"))
+        saida = io.StringIO()
+        call_command("indexar_tags", "--lote", "2", stdout=saida)
+        self.assertIn("'Tag antiga' em 1", saida.getvalue())
+        renomeados = {pk for pk, versao in Caso.objects.values_list("pk", "versao") if versao != versoes[pk]}
+        self.assertEqual(renomeados, {"LAB001", "LAB002"})
+        self.assertEqual(
+            LaudoMicroscopico.objects.get(caso_id="LAB001").tags_selecionadas,
+            ["Atipia Citológica", "Displasia"],
+        )
+        self.assertEqual(LaudoTag.objects.count(), 4)
+
+        def casos(nomes, modo):
+            return sorted(tags.filtrar_casos(Caso.objects.all(), nomes, modo).values_list("pk", flat=True))
+
+        self.assertEqual(casos(["Displasia", "atipia-citologica"], "todas"), ["LAB001"])
+        self.assertEqual(casos(["Displasia", "Fibrose"], "alguma"), ["LAB001", "LAB002", "LAB003"])
+        self.assertEqual(casos(["Displasia", "Inexistente"], "todas"), [])
+
+        consulta = tags.filtrar_casos(Caso.objects.all(), ["Displasia", "Fibrose"], "todas")
+        plano = _plano(consulta)
+        self.assertTrue(any(re.search(r"INDEX \S*laudotag\S* \(tag_id=\?", linha) for linha in plano), plano)
+
+        laudo = LaudoMicroscopico.objects.get(caso_id="LAB002")
+        laudo.tags_selecionadas = ["Fibrose"]
+        laudo.save()
+        self.assertEqual(tags.sincronizar([laudo])[:2], (1, 1))
+        self.assertEqual(casos(["Fibrose"], "todas"), ["LAB002", "LAB003"])
+
+
+class BuscaTests(TestCase):
+    """Busca textual pelo índice FTS5, sem acentos, com frases e restrita por papel."""
+
+    def setUp(self):
+        self.professor = UsuarioCustomizado.objects.create_user("prof", password="x", role="PROFESSOR")
+        self.aluno = UsuarioCustomizado.objects.create_user("aluno", password="x", role="ALUNO")
+        paciente = Paciente.objects.create(
+            numero_prontuario="P001", data_nascimento=datetime.date(1980, 1, 1), sexo="F"
+        )
+        laudos = {
+            "LAB001": (self.aluno, "Carcinoma espinocelular", "Infiltrado inflamatório crônico."),
+            "LAB002": (self.professor, "Lesão reacional", "Hiperplasia fibrosa inflamatória."),
+            "LAB003": (self.professor, "", "Carcinoma espinocelular bem diferenciado."),
+        }
+        for id_laboratorio, (autor, diagnostico, conclusao) in laudos.items():
+            caso = workflow.criar_caso(
+                Caso(
+                    id_laboratorio=id_laboratorio,
+                    paciente=paciente,
+                    data_recebimento=datetime.date(2024, 1, 1),
+                    solicitante="Dr. Teste",
+                    diagnostico_sugerido=diagnostico,
+                ),
+                autor,
+            )
+            LaudoMicroscopico.objects.create(caso=caso, texto_final="Texto", conclusao=conclusao)
+        busca.limpar()
+        call_command("reindexar_busca", "--lote", "2", stdout=io.StringIO())
+
+    def ids(self, texto, usuario=None):
+        return [linha["id_laboratorio"] for linha in busca.pesquisar(texto, usuario or self.professor)]
+
+    def test_busca_sem_acentos_frases_e_relevancia(self):
+        self.assertEqual(busca.total(), 3)
+        self.assertEqual(self.ids("INFLAMATORIO"), ["LAB001"])
+        self.assertEqual(sorted(self.ids("Inflamatór")), ["LAB001", "LAB002"])
+        self.assertEqual(self.ids('"espinocelular bem"'), ["LAB003"])
+        self.assertEqual(self.ids('"bem espinocelular"'), [])
+        # A conclusão pesa mais do que o diagnóstico sugerido.
+        self.assertEqual(self.ids("carcinoma"), ["LAB003", "LAB001"])
+        self.assertEqual(self.ids('carcin OR ) "'), [])
+        self.assertEqual(busca.traduzir_consulta('carcin "bem dif" -espino'), '"carcin" "bem dif" "espino"*')
+
+        linha = busca.pesquisar("crônico", self.aluno)[0]
+        self.assertIn("<mark>crônico</mark>", linha["trecho_html"])
+        self.assertEqual(self.ids("carcinoma", self.aluno), ["LAB001"])
+
+    def test_indice_acompanha_o_workflow_e_o_json(self):
+        caso = Caso.objects.get(pk="LAB002")
+        Caso.objects.filter(pk="LAB002").update(
+            status="EM_MICROSCOPIA", macro_status="APROVADO", preparo_status="APROVADO", micro_status="EM_PROGRESSO"
+        )
+        caso.refresh_from_db()
+        workflow.registrar_microscopia(
+            caso, self.professor, {"texto_final": "Texto", "conclusao": "Sialoadenite crônica", "notas": ""}
+        )
+        self.assertEqual(self.ids("sialoadenite"), ["LAB002"])
+        self.assertEqual(self.ids("hiperplasia"), [])
+
+        self.client.force_login(self.aluno)
+        resposta = self.client.get("/laudos/busca.json", {"q": "cronic"})
+        self.assertEqual([linha["id_laboratorio"] for linha in resposta.json()["resultados"]], ["LAB001"])
+        self.assertEqual(self.client.get("/laudos/busca.json").status_code, 400)
+        self.assertContains(self.client.get("/laudos/busca/", {"q": "carcinoma"}), "LAB001")
+
+
+class AutocompletarTests(TestCase):
+    """Sugestões de conclusão servidas da memória, atualizadas após a aprovação final."""
+
+    def setUp(self):
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        configuracao = override_settings(LAUDOS_SEMELHANTES_DIR=diretorio.name)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+        self.professor = UsuarioCustomizado.objects.create_user("prof", password="x", role="PROFESSOR")
+        paciente = Paciente.objects.create(
+            numero_prontuario="P001", data_nascimento=datetime.date(1980, 1, 1), sexo="F"
+        )
+        conclusoes = [
+            ("LAB001", "FINALIZADO", "Carcinoma espinocelular."),
+            ("LAB002", "FINALIZADO", "carcinoma  espinocelular."),
+            ("LAB003", "FINALIZADO", "Carcinoma basocelular."),
+            ("LAB004", "FINALIZADO", "Cisto radicular."),
+            ("LAB005", "AGUARDANDO_APROVACAO_FINAL", "Cisto dentígero."),
+        ]
+        for id_laboratorio, status, conclusao in conclusoes:
+            caso = Caso.objects.create(
+                id_laboratorio=id_laboratorio,
+                paciente=paciente,
+                data_recebimento=datetime.date(2024, 1, 1),
+                solicitante="Dr. Teste",
+                criado_por=self.professor,
+                status=status,
+                macro_status="APROVADO",
+                preparo_status="APROVADO",
+                micro_status="APROVADO",
+                data_finalizacao=timezone.now() if status == "FINALIZADO" else None,
+            )
+            LaudoMicroscopico.objects.create(caso=caso, texto_final="Texto", conclusao=conclusao)
+        autocompletar.reiniciar()
+        self.addCleanup(autocompletar.reiniciar)
+        self.assertEqual(autocompletar.atualizar(), 4)
+
+    def textos(self, prefixo):
+        return [sugestao["texto"] for sugestao in autocompletar.sugerir(prefixo)]
+
+    def test_sugestoes_sem_banco_por_frequencia(self):
+        with self.assertNumQueries(0):
+            sugestoes = autocompletar.sugerir("CARCINOMA")
+        self.assertEqual(
+            sugestoes,
+            [
+                {"texto": "Carcinoma espinocelular.", "frequencia": 2},
+                {"texto": "Carcinoma basocelular.", "frequencia": 1},
+            ],
+        )
+        self.assertEqual(self.textos("cisto"), ["Cisto radicular."])
+        self.assertEqual(self.textos("c"), [])
+        self.assertEqual(autocompletar.atualizar(), 0)
+
+    def test_aprovacao_final_atualiza_o_indice(self):
+        caso = Caso.objects.get(pk="LAB005")
+        with self.captureOnCommitCallbacks(execute=True):
+            workflow.aprovar_laudo_final(caso, self.professor)
+        self.assertEqual(self.textos("cisto d"), ["Cisto dentígero."])
+        self.assertEqual(self.textos("cisto dentigero"), ["Cisto dentígero."])
+
+        self.client.force_login(self.professor)
+        resposta = self.client.get("/laudos/conclusoes/sugestoes.json", {"q": "carc", "limite": "1"})
+        self.assertEqual(resposta.json(), {"sugestoes": [{"texto": "Carcinoma espinocelular.", "frequencia": 2}]})
+
+    def test_processo_novo_monta_na_hora_e_confere_versao_por_intervalo(self):
+        autocompletar.reiniciar()
+        self.assertEqual(self.textos("cisto"), ["Cisto radicular."])
+
+        # Outro processo aprova um caso: dentro do intervalo, nem o cache é consultado.
+        Caso.objects.filter(pk="LAB005").update(status="FINALIZADO", data_finalizacao=timezone.now())
+        cache.incr(autocompletar.CHAVE_VERSAO)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.textos("cisto"), ["Cisto radicular."])
+        self.assertNotIn("laudos-autocompletar", [thread.name for thread in threading.enumerate()])
+        self.assertEqual(autocompletar.atualizar(), 1)
+        self.assertEqual(self.textos("cisto d"), ["Cisto dentígero."])
+
+
+class SemelhantesTests(TestCase):
+    """Casos finalizados semelhantes por cosseno TF-IDF, com segmentos .npy incrementais."""
+
+    def setUp(self):
+        self.diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(self.diretorio.cleanup)
+        configuracao = override_settings(LAUDOS_SEMELHANTES_DIR=self.diretorio.name)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+        self.professor = UsuarioCustomizado.objects.create_user("prof", password="x", role="PROFESSOR")
+        self.aluno = UsuarioCustomizado.objects.create_user("aluno", password="x", role="ALUNO")
+        paciente = Paciente.objects.create(
+            numero_prontuario="P001", data_nascimento=datetime.date(1980, 1, 1), sexo="F"
+        )
+        laudos = [
+            ("LAB001", "FINALIZADO", "Epitélio com displasia e infiltrado inflamatório.", "Displasia epitelial leve.", ["Displasia"]),
+            ("LAB002", "FINALIZADO", "Cápsula fibrosa com epitélio odontogênico.", "Cisto radicular.", []),
+            ("LAB003", "FINALIZADO", "Ilhas de epitélio atípico invadindo o conjuntivo.", "Carcinoma espinocelular.", []),
+            ("LAB004", "AGUARDANDO_APROVACAO_FINAL", "Cápsula fibrosa revestida por epitélio odontogênico.", "Cisto dentígero.", []),
+            ("LAB005", "EM_MICROSCOPIA", "Cápsula fibrosa e epitélio odontogênico com inflamação.", "Cisto.", []),
+        ]
+        for id_laboratorio, status, texto_final, conclusao, selecionadas in laudos:
+            caso = Caso.objects.create(
+                id_laboratorio=id_laboratorio,
+                paciente=paciente,
+                data_recebimento=datetime.date(2024, 1, 1),
+                solicitante="Dr. Teste",
+                criado_por=self.aluno,
+                status=status,
+                macro_status="APROVADO",
+                preparo_status="APROVADO",
+                micro_status="APROVADO" if status != "EM_MICROSCOPIA" else "EM_PROGRESSO",
+                data_finalizacao=timezone.now() if status == "FINALIZADO" else None,
+            )
+            LaudoMicroscopico.objects.create(
+                caso=caso, texto_final=texto_final, conclusao=conclusao, tags_selecionadas=selecionadas
+            )
+        call_command("indexar_semelhantes", "--lote", "2", stdout=io.StringIO())
+
+    def ids(self, caso_id):
+        return [linha["id_laboratorio"] for linha in semelhantes.semelhantes(Caso.objects.get(pk=caso_id))]
+
+    def test_reconstrucao_e_atualizacao_incremental(self):
+        self.assertEqual(semelhantes.total(), 3)
+        self.assertEqual(len(os.listdir(self.diretorio.name)), len(semelhantes.PARTES))
+        self.assertEqual(self.ids("LAB005")[0], "LAB002")
+
+        caso = Caso.objects.get(pk="LAB004")
+        with self.captureOnCommitCallbacks(execute=True):
+            workflow.aprovar_laudo_final(caso, self.professor)
+        self.assertEqual(semelhantes.total(), 4)
+        self.assertEqual(sorted(self.ids("LAB005")[:2]), ["LAB002", "LAB004"])
+        self.assertNotIn("LAB004", self.ids("LAB004"))
+
+        # A reconstrução volta a um segmento só, sem perder o caso novo.
+        call_command("indexar_semelhantes", stdout=io.StringIO())
+        self.assertEqual(len(os.listdir(self.diretorio.name)), len(semelhantes.PARTES))
+        self.assertEqual(semelhantes.total(), 4)
+
+    def test_painel_json_usa_o_texto_do_formulario(self):
+        self.client.force_login(self.aluno)
+        self.assertEqual(self.client.get("/laudos/caso/LAB005/semelhantes.json").status_code, 302)
+
+        self.client.force_login(self.professor)
+        resposta = self.client.get(
+            "/laudos/caso/LAB005/semelhantes.json", {"texto": "epitélio com displasia", "tags": ["displasia"]}
+        )
+        primeiro = resposta.json()["semelhantes"][0]
+        self.assertEqual(primeiro["id_laboratorio"], "LAB001")
+        self.assertEqual(primeiro["conclusao"], "Displasia epitelial leve.")
+        self.assertEqual(primeiro["url"], "/laudos/editar-laudo/LAB001/")
+
+    def test_painel_json_de_caso_arquivado(self):
+        Caso.objects.filter(pk="LAB001").update(data_finalizacao=timezone.now() - datetime.timedelta(days=400))
+        list(arquivo.arquivar(arquivo.limite_para(365), lote=1, tipos=("casos",)))
+        self.assertFalse(Caso.objects.filter(pk="LAB001").exists())
+
+        self.client.force_login(self.professor)
+        resposta = self.client.get("/laudos/caso/LAB001/semelhantes.json")
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.json()["caso"], "LAB001")
+        ids = [linha["id_laboratorio"] for linha in resposta.json()["semelhantes"]]
+        self.assertTrue(ids)
+        self.assertNotIn("LAB001", ids)
+        self.assertEqual(self.client.get("/laudos/caso/LAB999/semelhantes.json").status_code, 404)
+
+
+class TerminologiaTests(TestCase):
+    """Codificação dos laudos pelo autômato da terminologia, no workflow e em lote."""
+
+    def setUp(self):
+        self.professor = UsuarioCustomizado.objects.create_user("prof", password="x", role="PROFESSOR")
+        self.paciente = Paciente.objects.create(
+            numero_prontuario="P001", data_nascimento=datetime.date(1980, 1, 1), sexo="F"
+        )
+
+    def criar_laudo(self, id_laboratorio, texto_final, conclusao):
+        caso = Caso.objects.create(
+            id_laboratorio=id_laboratorio,
+            paciente=self.paciente,
+            data_recebimento=datetime.date(2024, 1, 1),
+            solicitante="Dr. Teste",
+            status="EM_MICROSCOPIA",
+            macro_status="APROVADO",
+            preparo_status="APROVADO",
+        )
+        return workflow.registrar_microscopia(
+            caso, self.professor, {"texto_final": texto_final, "conclusao": conclusao, "notas": ""}
+        )
+
+    def codigos(self, laudo):
+        return sorted(laudo.codigos.values_list("campo", "termo__codigo"))
+
+    def test_automato_limites_sobreposicao_e_negacao(self):
+        maquina = automato.Automato(
+            [("carcinoma", 1), ("Carcinoma espinocelular", 2), ("CEC", 3), ("displasia", 4), ("cisto", 5)]
+        )
+        self.assertEqual(maquina.codificar("CARCINOMA ESPINOCELULAR; compatível com CEC. Região cecal."), [2, 3])
+        self.assertEqual(maquina.codificar("Ausência de displasia epitelial, com carcinoma."), [1])
+        self.assertEqual(maquina.codificar("Sem evidência de cisto. Displasia leve."), [4])
+        self.assertEqual(maquina.codificar("cistos e carcinomas"), [])
+
+    def test_workflow_codifica_e_comando_recodifica(self):
+        laudo = self.criar_laudo("LAB001", "Epitélio sem displasia.", "Carcinoma epidermoide bem diferenciado.")
+        outro = self.criar_laudo("LAB002", "Cápsula fibrosa.", "Cisto folicular.")
+        self.assertEqual(self.codigos(laudo), [("conclusao", "LPB-001")])
+        self.assertEqual(self.codigos(outro), [("conclusao", "LPB-005")])
+        self.assertEqual(
+            list(terminologia.filtrar_casos(Caso.objects.all(), ["LPB-001"]).values_list("pk", flat=True)),
+            ["LAB001"],
+        )
+
+        termo = Termo.objects.get(codigo="LPB-014")
+        termo.sinonimos = ["cápsula fibrosa"]
+        termo.save()
+        saida = io.StringIO()
+        call_command("codificar_laudos", "--processos", "1", "--verificar", stdout=saida)
+        self.assertIn("1 código(s) a criar e 0 a remover", saida.getvalue())
+        self.assertEqual(self.codigos(outro), [("conclusao", "LPB-005")])
+
+        call_command("codificar_laudos", "--processos", "2", "--lote", "1", stdout=io.StringIO())
+        self.assertEqual(self.codigos(outro), [("conclusao", "LPB-005"), ("texto_final", "LPB-014")])
+        self.assertEqual(CodigoLaudo.objects.count(), 3)
+        self.assertEqual(terminologia.contagem()[0]["laudos"], 1)
+
+
+class TempoEtapaTests(TestCase):
+    """Percentis dos tempos por etapa, lidos das linhas diárias consolidadas."""
+
+    def setUp(self):
+        self.professor = UsuarioCustomizado.objects.create_user("prof", password="x", role="PROFESSOR")
+        self.aluno = UsuarioCustomizado.objects.create_user("aluno", password="x", role="ALUNO")
+        paciente = Paciente.objects.create(
+            numero_prontuario="P001", data_nascimento=datetime.date(1980, 1, 1), sexo="F"
+        )
+        self.dia = timezone.localdate() - datetime.timedelta(days=2)
+        base = timezone.make_aware(datetime.datetime.combine(self.dia, datetime.time(0, 30)))
+        self.esperas_finais = [1.0, 2.0, 4.0, 8.0, 30.0]
+        for indice, espera in enumerate(self.esperas_finais):
+            criacao = base + datetime.timedelta(minutes=indice)
+            micro_aprovado = criacao + datetime.timedelta(hours=6)
+            Caso.objects.create(
+                id_laboratorio=f"LAB{indice:03d}",
+                paciente=paciente,
+                data_recebimento=self.dia,
+                solicitante="Dr. A" if indice < 3 else "Dr. B",
+                status="FINALIZADO",
+                criado_por=self.aluno,
+                responsavel_final=self.professor,
+            )
+            # data_criacao é auto_now_add; os carimbos vão por update.
+            Caso.objects.filter(pk=f"LAB{indice:03d}").update(
+                data_criacao=criacao,
+                macro_preenchido_em=criacao + datetime.timedelta(hours=1),
+                micro_aprovado_em=micro_aprovado,
+                data_finalizacao=micro_aprovado + datetime.timedelta(hours=espera),
+            )
+
+    def test_percentis_vetorizados_batem_com_numpy(self):
+        gerador = np.random.default_rng(7)
+        valores = gerador.gamma(2.0, 10.0, 5000).astype(np.float32)
+        grupos = gerador.integers(0, 6, 5000)
+        grupos[grupos == 4] = 5
+        quantidade, matriz = tempos.percentis(valores, grupos)
+        self.assertEqual(quantidade[4], 0)
+        self.assertTrue(np.isnan(matriz[4]).all())
+        for grupo in (0, 1, 2, 3, 5):
+            esperado = np.percentile(valores[grupos == grupo].astype(np.float64), [50, 90, 99])
+            np.testing.assert_allclose(matriz[grupo], esperado, rtol=1e-6)
+
+    def test_comando_consolida_e_painel_le_so_as_linhas_diarias(self):
+        # O primeiro caso é arquivado e entra pelo JSON de CasoArquivado, não por Caso.
+        limite = Caso.objects.order_by("data_finalizacao").values_list("data_finalizacao", flat=True)[1]
+        arquivo.arquivar_casos_lote(limite, lote=1)
+        self.assertEqual(CasoArquivado.objects.count(), 1)
+
+        saida = io.StringIO()
+        call_command("consolidar_tempos", stdout=saida)
+        self.assertIn("5 caso(s)", saida.getvalue())
+        call_command("consolidar_tempos", "--dias", "2", stdout=io.StringIO())
+        geral = TempoEtapaDiario.objects.filter(dimensao="geral", metrica="espera_final")
+        self.assertEqual(sum(linha.quantidade for linha in geral), 5)
+
+        inicio = self.dia - datetime.timedelta(days=7)
+        with self.assertNumQueries(1):
+            por_solicitante = tempos.resumo("solicitante", inicio, timezone.localdate())
+        self.assertEqual([linha["grupo"] for linha in por_solicitante], ["Dr. A", "Dr. B"])
+        self.assertEqual(por_solicitante[1]["metricas"]["espera_final"]["p50"], 19.0)
+
+        semanas = tempos.resumo("semana", inicio, timezone.localdate())
+        espera = sum(linha["metricas"]["espera_final"]["quantidade"] for linha in semanas)
+        self.assertEqual(espera, 5)
+        self.assertEqual(semanas[0]["metricas"]["macro"]["p50"], 1.0)
+        self.assertEqual(semanas[0]["metricas"]["preparo"]["quantidade"], 0)
+
+        self.client.force_login(self.aluno)
+        self.assertEqual(self.client.get("/laudos/analise/tempos.json").status_code, 302)
+        self.client.force_login(self.professor)
+        resposta = self.client.get("/laudos/analise/tempos.json", {"agrupamento": "usuario", "dias": 30})
+        grupos = {linha["grupo"]: linha["metricas"] for linha in resposta.json()["grupos"]}
+        self.assertEqual(grupos["prof"]["espera_final"]["p50"], 4.0)
+        self.assertAlmostEqual(
+            grupos["prof"]["espera_final"]["p90"], float(np.percentile(self.esperas_finais, 90)), places=2
+        )
+        self.assertEqual(grupos["aluno"]["total"]["quantidade"], 5)
+        self.assertContains(self.client.get("/laudos/analise/tempos/"), "Aprovação final")
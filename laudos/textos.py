@@ -0,0 +1,156 @@
+"""Composição no servidor dos textos de macroscopia e da base da microscopia.
+
+Os modelos usam ``{campo}`` para valores e ``[...]`` para trechos opcionais, omitidos
+quando algum campo dentro deles está vazio. Cada modelo é compilado uma única vez numa
+tupla de partes (``compilar`` tem cache), de modo que compor um texto é só uma junção
+de strings; isso mantém o comando ``regenerar_textos`` em milhares de laudos por segundo.
+"""
+
+from __future__ import annotations
+
+import re
+import unicodedata
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+from typing import Iterable, Mapping, Union
+
+MODELO_MACRO = (
+    "O material recebido para exame consta de {fragmentos}[ de {tecido}]"
+    "[ medindo {comprimento} x {largura} x {altura} mm][ de cor {cor}]"
+    "[ e consistência {consistencia}][ com forma {forma}]."
+)
+
+TECIDOS = {
+    "mole": "tecido mole",
+    "osseo": "tecido ósseo",
+    "duro": "tecido duro",
+}
+
+SEPARADOR_TAGS = "\n\n"
+
+_TOKEN = re.compile(r"\[([^\[\]]*)\]|\{(\w+)\}|([^\[\]{}]+)")
+_NUMERO = re.compile(r"\d+(?:\.\d+)?")
+_ANTES_PONTUACAO = re.compile(r"\s+(?=[.,;])")
+
+
+class ErroModelo(ValueError):
+    pass
+
+
+def _pecas(trecho: str) -> tuple:
+    """Literais como ``str`` e campos como ``(nome,)``."""
+    pecas = []
+    for literal, campo in re.findall(r"([^{}]*)(?:\{(\w+)\})?", trecho):
+        if literal:
+            pecas.append(literal)
+        if campo:
+            pecas.append((campo,))
+    return tuple(pecas)
+
+
+@lru_cache(maxsize=None)
+def compilar(modelo: str) -> tuple:
+    """Converte o modelo em ``(pecas, opcional)`` por trecho."""
+    partes = []
+    posicao = 0
+    for encontrado in _TOKEN.finditer(modelo):
+        if encontrado.start() != posicao:
+            break
+        opcional, campo, literal = encontrado.groups()
+        if opcional is not None:
+            partes.append((_pecas(opcional), True))
+        elif campo is not None:
+            partes.append((((campo,),), False))
+        else:
+            partes.append(((literal,), False))
+        posicao = encontrado.end()
+    if posicao != len(modelo):
+        raise ErroModelo(f"Modelo de texto inválido perto da posição {posicao}: {modelo!r}")
+    return tuple(partes)
+
+
+def compor(modelo: str, valores: Mapping[str, object]) -> str:
+    saida = []
+    for pecas, opcional in compilar(modelo):
+        trecho = []
+        for peca in pecas:
+            if isinstance(peca, str):
+                trecho.append(peca)
+                continue
+            valor = valores.get(peca[0])
+            if valor in (None, ""):
+                if opcional:
+                    break
+                valor = ""
+            trecho.append(str(valor))
+        else:
+            saida.extend(trecho)
+    return "".join(saida)
+
+
+def _numero(valor: Union[Decimal, int, float, str, None]) -> str:
+    """Medidas sem zeros à direita: ``Decimal("10.50")`` vira ``"10.5"``."""
+    if valor in (None, ""):
+        return ""
+    try:
+        numero = Decimal(str(valor)).normalize()
+    except InvalidOperation:
+        return str(valor)
+    return format(numero, "f")
+
+
+def valores_macro(dados: Union[Mapping, object]) -> dict:
+    """Valores do modelo a partir de um ``LaudoMacroscopico`` ou do dicionário do formulário."""
+    ler = dados.get if isinstance(dados, Mapping) else lambda campo: getattr(dados, campo, None)
+    fragmentos = ler("num_fragmentos") or 1
+    tecido = (ler("tipo_tecido") or "").strip()
+    return {
+        "fragmentos": "fragmento" if int(fragmentos) == 1 else f"{fragmentos} fragmentos",
+        "tecido": TECIDOS.get(tecido, tecido),
+        "comprimento": _numero(ler("dim_comprimento_mm")),
+        "largura": _numero(ler("dim_largura_mm")),
+        "altura": _numero(ler("dim_altura_mm")),
+        "cor": ler("cor") or "",
+        "consistencia": ler("consistencia") or "",
+        "forma": ler("forma") or "",
+    }
+
+
+def texto_macro(dados: Union[Mapping, object], modelo: str = MODELO_MACRO) -> str:
+    return compor(modelo, valores_macro(dados))
+
+
+def texto_micro(tags: Iterable[str], textos: Mapping[str, str]) -> str:
+    """Textos das ``tags`` selecionadas, na ordem de ``textos`` (o vocabulário, ``tags.textos()``)."""
+    selecionadas = set(tags)
+    return SEPARADOR_TAGS.join(texto for tag, texto in textos.items() if tag in selecionadas)
+
+
+def normalizar(texto: str) -> str:
+    """Forma de comparação e busca: sem acentos, em minúsculas, espaços colapsados."""
+    sem_acentos = unicodedata.normalize("NFKD", texto or "").encode("ascii", "ignore").decode("ascii")
+    return " ".join(sem_acentos.casefold().split())
+
+
+def _normalizar(texto: str) -> str:
+    texto = _ANTES_PONTUACAO.sub("", " ".join((texto or "").split()))
+    return _NUMERO.sub(lambda numero: _numero(numero.group()), texto)
+
+
+def equivalentes(texto: str, outro: str) -> bool:
+    """Compara ignorando espaços (inclusive antes da pontuação) e a grafia das medidas (``10.00`` e ``10``)."""
+    return _normalizar(texto) == _normalizar(outro)
+
+
+__all__ = [
+    "MODELO_MACRO",
+    "TECIDOS",
+    "ErroModelo",
+    "compilar",
+    "compor",
+    "equivalentes",
+    "normalizar",
+    "texto_macro",
+    "texto_micro",
+    "valores_macro",
+]
@@ -0,0 +1,277 @@
+"""Tabela declarativa das transições de etapa, compilada na importação.
+
+Cada ``Transicao`` lista os requisitos sobre o estado do caso e os papéis que podem
+executá-la. ``compilar`` avalia a tabela para todas as combinações de
+(macro_status, preparo_status, micro_status, finalizado, papel), de modo que o workflow,
+as views e o dashboard obtêm as ações permitidas e os motivos de bloqueio com uma
+única consulta a um dicionário.
+"""
+
+from __future__ import annotations
+
+import itertools
+from dataclasses import dataclass, field
+from typing import Mapping, Optional, Union
+
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.db.models import Q
+
+from .models import Caso, UsuarioCustomizado
+
+ETAPA_STATUS = tuple(valor for valor, _ in Caso.ETAPA_STATUS_CHOICES)
+# ``None`` cobre papéis fora de ROLE_CHOICES, que recebem só as permissões comuns.
+PAPEIS = (*(valor for valor, _ in UsuarioCustomizado.ROLE_CHOICES), None)
+PAPEIS_PROFESSOR = frozenset({"PROFESSOR", "ADMIN"})
+TODOS_PAPEIS = frozenset(PAPEIS)
+
+EDITAVEL = frozenset({"PENDENTE", "EM_PROGRESSO", "REPROVADO"})
+SUBMETIVEL = frozenset({"EM_PROGRESSO", "REPROVADO"})
+AGUARDANDO = frozenset({"AGUARDANDO_APROVACAO"})
+APROVADO = frozenset({"APROVADO"})
+
+MENSAGEM_PAPEL = "Somente professores ou administradores podem executar esta operação."
+
+
+@dataclass(frozen=True)
+class Requisito:
+    campo: str
+    valores: frozenset
+    # Mensagem da ValidationError levantada pelo workflow.
+    mensagem: str
+    # Texto curto exibido na tela; pode variar conforme o valor atual do campo.
+    aviso: Union[str, Mapping[object, str], None] = None
+
+    def aviso_para(self, valor) -> str:
+        if isinstance(self.aviso, Mapping):
+            return self.aviso.get(valor, self.mensagem)
+        return self.aviso or self.mensagem
+
+    def condicao(self) -> Q:
+        if self.campo == "finalizado":
+            return ~Q(status="FINALIZADO") if self.valores == {False} else Q(status="FINALIZADO")
+        return Q(**{f"{self.campo}__in": sorted(self.valores)})
+
+
+@dataclass(frozen=True)
+class Transicao:
+    acao: str
+    etapa: str
+    requisitos: tuple[Requisito, ...]
+    papeis: frozenset = TODOS_PAPEIS
+
+    def condicao(self) -> Q:
+        """Os requisitos como filtro SQL, para guardar UPDATEs em lote."""
+        condicao = Q()
+        for requisito in self.requisitos:
+            condicao &= requisito.condicao()
+        return condicao
+
+
+def _macro_aprovada(mensagem: str, aviso: Optional[str] = None) -> Requisito:
+    return Requisito("macro_status", APROVADO, mensagem, aviso)
+
+
+def _preparo_aprovado(mensagem: str, aviso: Optional[str] = None) -> Requisito:
+    return Requisito("preparo_status", APROVADO, mensagem, aviso)
+
+
+TABELA = (
+    Transicao(
+        "registrar_macro",
+        "macro",
+        (
+            Requisito(
+                "macro_status",
+                EDITAVEL,
+                "Macroscopia já foi submetida para aprovação e não pode ser editada.",
+                {"AGUARDANDO_APROVACAO": "Macroscopia aguardando aprovacao.", "APROVADO": "Macroscopia aprovada."},
+            ),
+        ),
+    ),
+    Transicao(
+        "solicitar_macro",
+        "macro",
+        (Requisito("macro_status", SUBMETIVEL, "Macroscopia precisa estar em progresso para ser submetida."),),
+    ),
+    Transicao(
+        "aprovar_macro",
+        "macro",
+        (Requisito("macro_status", AGUARDANDO, "Macroscopia não está aguardando aprovação."),),
+        PAPEIS_PROFESSOR,
+    ),
+    Transicao(
+        "registrar_preparo",
+        "preparo",
+        (
+            _macro_aprovada(
+                "Macroscopia precisa ser aprovada antes do registro do preparo.",
+                "Aguarde a aprovacao da macroscopia.",
+            ),
+            Requisito(
+                "preparo_status",
+                EDITAVEL,
+                "Preparo já foi submetido para aprovação e não pode ser editado.",
+                {"AGUARDANDO_APROVACAO": "Preparo aguardando aprovacao.", "APROVADO": "Preparo aprovado."},
+            ),
+        ),
+    ),
+    Transicao(
+        "solicitar_preparo",
+        "preparo",
+        (
+            _macro_aprovada("Macroscopia precisa estar aprovada antes de solicitar aprovação do preparo."),
+            Requisito("preparo_status", SUBMETIVEL, "Preparo precisa estar em progresso para ser submetido."),
+        ),
+    ),
+    Transicao(
+        "aprovar_preparo",
+        "preparo",
+        (
+            _macro_aprovada("Macroscopia precisa estar aprovada antes de aprovar o preparo."),
+            Requisito("preparo_status", AGUARDANDO, "Preparo não está aguardando aprovação."),
+        ),
+        PAPEIS_PROFESSOR,
+    ),
+    Transicao(
+        "registrar_micro",
+        "micro",
+        (
+            _macro_aprovada(
+                "A microscopia só pode ser registrada após macroscopia e preparo aprovados.",
+                "Aguarde a aprovacao do preparo.",
+            ),
+            _preparo_aprovado(
+                "A microscopia só pode ser registrada após macroscopia e preparo aprovados.",
+                "Aguarde a aprovacao do preparo.",
+            ),
+            Requisito(
+                "micro_status",
+                EDITAVEL,
+                "Microscopia já foi submetida para aprovação e não pode ser editada.",
+                {"AGUARDANDO_APROVACAO": "Microscopia aguardando aprovacao.", "APROVADO": "Microscopia aprovada."},
+            ),
+        ),
+    ),
+    Transicao(
+        "solicitar_micro",
+        "micro",
+        (
+            _macro_aprovada("Macroscopia e preparo precisam estar aprovados antes da aprovação da microscopia."),
+            _preparo_aprovado("Macroscopia e preparo precisam estar aprovados antes da aprovação da microscopia."),
+            Requisito("micro_status", SUBMETIVEL, "Microscopia precisa estar em progresso para ser submetida."),
+        ),
+    ),
+    Transicao(
+        "aprovar_micro",
+        "micro",
+        (
+            _macro_aprovada("Macroscopia e preparo precisam estar aprovados antes de aprovar a microscopia."),
+            _preparo_aprovado("Macroscopia e preparo precisam estar aprovados antes de aprovar a microscopia."),
+            Requisito("micro_status", AGUARDANDO, "Microscopia não está aguardando aprovação."),
+        ),
+        PAPEIS_PROFESSOR,
+    ),
+    Transicao(
+        "aprovar_final",
+        "final",
+        (
+            Requisito("finalizado", frozenset({False}), "Laudo já está finalizado."),
+            *(
+                Requisito(campo, APROVADO, "Todas as etapas precisam estar aprovadas antes da aprovação final.")
+                for campo in ("macro_status", "preparo_status", "micro_status")
+            ),
+        ),
+        PAPEIS_PROFESSOR,
+    ),
+)
+TRANSICOES = {transicao.acao: transicao for transicao in TABELA}
+
+
+@dataclass(frozen=True)
+class Permissoes:
+    """Resultado pré-computado da tabela para um estado e um papel."""
+
+    acoes: frozenset
+    # Por ação bloqueada: mensagem do workflow e aviso curto para a tela.
+    erros: Mapping[str, str] = field(default_factory=dict)
+    avisos: Mapping[str, str] = field(default_factory=dict)
+    # Ações que o estado permitiria, mas o papel não.
+    negadas_ao_papel: frozenset = frozenset()
+
+    def permite(self, acao: str) -> bool:
+        return acao in self.acoes
+
+    def motivo(self, acao: str) -> Optional[str]:
+        return self.avisos.get(acao)
+
+    def erro(self, acao: str) -> Optional[str]:
+        if acao in self.negadas_ao_papel:
+            return MENSAGEM_PAPEL
+        return self.erros.get(acao)
+
+    def exigir(self, acao: str) -> None:
+        if acao in self.negadas_ao_papel:
+            raise PermissionDenied(MENSAGEM_PAPEL)
+        if acao in self.erros:
+            raise ValidationError(self.erros[acao])
+
+
+def _avaliar(estado: dict, papel) -> Permissoes:
+    acoes, erros, avisos, negadas = set(), {}, {}, set()
+    for transicao in TABELA:
+        falha = next((r for r in transicao.requisitos if estado[r.campo] not in r.valores), None)
+        if falha is not None:
+            erros[transicao.acao] = falha.mensagem
+            avisos[transicao.acao] = falha.aviso_para(estado[falha.campo])
+        elif papel not in transicao.papeis:
+            negadas.add(transicao.acao)
+            avisos[transicao.acao] = MENSAGEM_PAPEL
+        else:
+            acoes.add(transicao.acao)
+    return Permissoes(frozenset(acoes), erros, avisos, frozenset(negadas))
+
+
+def compilar() -> dict[tuple, Permissoes]:
+    tabela = {}
+    for macro, preparo, micro, finalizado in itertools.product(
+        ETAPA_STATUS, ETAPA_STATUS, ETAPA_STATUS, (False, True)
+    ):
+        estado = {
+            "macro_status": macro,
+            "preparo_status": preparo,
+            "micro_status": micro,
+            "finalizado": finalizado,
+        }
+        for papel in PAPEIS:
+            tabela[(macro, preparo, micro, finalizado, papel)] = _avaliar(estado, papel)
+    return tabela
+
+
+_COMPILADA = compilar()
+
+
+def permissoes(caso, papel: Optional[str]) -> Permissoes:
+    """Consulta O(1); ``caso`` pode ser uma instância de ``Caso`` ou uma linha de ``values()``."""
+    if isinstance(caso, dict):
+        chave = (caso["macro_status"], caso["preparo_status"], caso["micro_status"], caso["status"] == "FINALIZADO")
+    else:
+        chave = (caso.macro_status, caso.preparo_status, caso.micro_status, caso.status == "FINALIZADO")
+    return _COMPILADA[(*chave, papel if papel in TODOS_PAPEIS else None)]
+
+
+def exigir(caso, usuario: UsuarioCustomizado, acao: str) -> None:
+    """Levanta ``PermissionDenied`` ou ``ValidationError`` se ``acao`` não for permitida."""
+    permissoes(caso, usuario.role).exigir(acao)
+
+
+__all__ = [
+    "PAPEIS_PROFESSOR",
+    "Permissoes",
+    "Requisito",
+    "TABELA",
+    "TRANSICOES",
+    "Transicao",
+    "compilar",
+    "exigir",
+    "permissoes",
+]
@@ -11,7 +11,19 @@ urlpatterns = [
     path('caso/<str:caso_id>/micro/solicitar/', views.solicitar_microscopia_aprovacao_view, name='solicitar_microscopia_aprovacao'),
     path('caso/<str:caso_id>/micro/aprovar/', views.aprovar_microscopia_view, name='aprovar_microscopia'),
     path('aprovar-laudo/<str:caso_id>/', views.aprovar_laudo_view, name='aprovar_laudo'),
+    path('aprovar-em-lote/', views.aprovar_em_lote_view, name='aprovar_em_lote'),
+    path('caso/<str:caso_id>/semelhantes.json', views.casos_semelhantes_json_view, name='casos_semelhantes'),
     path('laudo-macro/<str:caso_id>/', views.laudo_macro_view, name='laudo_macro'),
     path('laudo-micro/<str:caso_id>/', views.laudo_micro_view, name='laudo_micro'),
     path('pdf/<str:caso_id>/', views.gerar_pdf_view, name='gerar_pdf'),
+    path('exportar-laudos/', views.exportar_laudos_view, name='exportar_laudos'),
+    path('aprovacoes/', views.caixa_aprovacao_view, name='caixa_aprovacao'),
+    path('aprovacoes.json', views.caixa_aprovacao_json_view, name='caixa_aprovacao_json'),
+    path('busca/', views.busca_view, name='busca'),
+    path('busca.json', views.busca_json_view, name='busca_json'),
+    path('conclusoes/sugestoes.json', views.sugestoes_conclusao_json_view, name='sugestoes_conclusao'),
+    path('analise/tempos/', views.analise_tempos_view, name='analise_tempos'),
+    path('analise/tempos.json', views.analise_tempos_json_view, name='analise_tempos_json'),
+    path('metricas/', views.metricas_view, name='metricas'),
+    path('eventos/', views.eventos_casos_view, name='eventos_casos'),
 ]
@@ -0,0 +1,30 @@
+"""Versões no cache do Django que invalidam os caches locais de cada processo.
+
+Quem guarda algo em memória confere ``atual(chave)`` e relê quando ela muda; quem altera
+os dados chama ``avancar(chave)``. Uma chave despejada recomeça de ``time.time_ns()``, e
+não de zero, para nunca repetir uma versão que algum processo ainda tenha guardada.
+"""
+
+from __future__ import annotations
+
+import time
+
+from django.core.cache import cache
+
+
+def atual(chave: str) -> int:
+    versao = cache.get(chave)
+    if versao is None:
+        cache.add(chave, time.time_ns(), timeout=None)
+        versao = cache.get(chave)
+    return versao
+
+
+def avancar(chave: str) -> None:
+    try:
+        cache.incr(chave)
+    except ValueError:
+        cache.add(chave, time.time_ns(), timeout=None)
+
+
+__all__ = ["atual", "avancar"]
@@ -1,38 +1,57 @@
-﻿import io
+﻿import asyncio
+import datetime
+import hashlib
+import json
 
 from django.contrib import messages
+from django.conf import settings
 from django.contrib.auth.decorators import login_required, user_passes_test
+from django.core.cache import cache as cache_django
 from django.core.exceptions import PermissionDenied, ValidationError
-from django.http import HttpResponse
+from django.http import FileResponse, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.units import cm
-from reportlab.pdfgen import canvas
-from reportlab.platypus import Table, TableStyle
-
-from . import workflow
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import content_disposition_header, url_has_allowed_host_and_scheme
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+
+from . import (
+    aprovacoes,
+    arquivo,
+    autocompletar,
+    busca,
+    cache_worklist,
+    contadores,
+    eventos,
+    exportacao,
+    metricas,
+    pdf,
+    registro_atividade,
+    semelhantes,
+    tags,
+    tarefas_pdf,
+    tempos,
+    textos,
+    transicoes,
+    workflow,
+    worklist,
+)
 from .forms import (
     CasoForm,
     LaudoMacroscopicoForm,
     LaudoMicroscopicoForm,
     MetodoPreparoForm,
     PacienteForm,
+    WorklistFiltroForm,
 )
-from .models import Caso
-
-
-STAGE_BADGE_CLASSES = {
-    "PENDENTE": "stage-badge stage-pendente",
-    "EM_PROGRESSO": "stage-badge stage-progresso",
-    "AGUARDANDO_APROVACAO": "stage-badge stage-aguardando",
-    "APROVADO": "stage-badge stage-aprovado",
-    "REPROVADO": "stage-badge stage-reprovado",
-}
+from .models import Caso, CasoArquivado
 
 
 def _badge_class(status: str) -> str:
-    return STAGE_BADGE_CLASSES.get(status, "stage-badge stage-pendente")
+    return worklist.STAGE_BADGE_CLASSES.get(status, worklist.BADGE_PADRAO)
 
 
 def _disable_form(form) -> None:
@@ -40,6 +59,38 @@ def _disable_form(form) -> None:
         field.disabled = True
 
 
+def _valor_ou_descricao(dados: dict, campo: str, personalizado: str) -> str:
+    if dados[campo] == "descrever":
+        return dados[personalizado].strip()
+    return dados[campo]
+
+
+def _dados_macro(request, form) -> dict:
+    """Campos da macroscopia e o texto composto no servidor.
+
+    O preview do navegador pode ter sido editado; só quando difere do texto composto
+    ele é guardado como ``texto_editado``.
+    """
+    dados = form.cleaned_data
+    dados_macro = {
+        "num_fragmentos": dados["num_fragmentos"],
+        "dim_comprimento_mm": dados["dim_comprimento_mm"],
+        "dim_largura_mm": dados["dim_largura_mm"],
+        "dim_altura_mm": dados["dim_altura_mm"],
+        "tipo_tecido": _valor_ou_descricao(dados, "tipo_tecido", "tipo_tecido_personalizado"),
+        "cor": _valor_ou_descricao(dados, "cor", "cor_personalizada"),
+        "consistencia": _valor_ou_descricao(dados, "consistencia", "consistencia_personalizada"),
+        "forma": _valor_ou_descricao(dados, "forma", "forma_personalizada"),
+    }
+    dados_macro["texto_gerado"] = textos.texto_macro(dados_macro)
+    enviado = request.POST.get("texto_gerado", "").strip()
+    if enviado and not textos.equivalentes(enviado, dados_macro["texto_gerado"]):
+        dados_macro["texto_editado"] = enviado
+    else:
+        dados_macro["texto_editado"] = None
+    return dados_macro
+
+
 def _format_user(user) -> str:
     if not user:
         return "-"
@@ -52,43 +103,371 @@ def is_professor_or_admin(user):
     return user.role in ["PROFESSOR", "ADMIN"]
 
 
+def pode_exportar(user):
+    """Professores, administradores e a secretaria do laboratório exportam laudos em lote."""
+    return user.role in ["PROFESSOR", "ADMIN", "FUNCIONARIO_LAB"]
+
+
+def _versao_caso(request, caso_id):
+    """(versao, atualizado_em) do caso, consultado uma única vez por requisição."""
+    cache = request.__dict__.setdefault("_laudos_versao_caso", {})
+    if caso_id not in cache:
+        cache[caso_id] = (
+            Caso.objects.filter(id_laboratorio=caso_id).values_list("versao", "atualizado_em").first()
+            or CasoArquivado.objects.filter(pk=caso_id).values_list("versao", "arquivado_em").first()
+        )
+    return cache[caso_id]
+
+
+def _requisicao_condicional(request) -> bool:
+    # Mensagens pendentes precisam ser exibidas, então a página não pode virar um 304.
+    return request.method in ("GET", "HEAD") and not len(messages.get_messages(request))
+
+
+def condicional_por_versao(prefixo: str, por_usuario: bool = True):
+    """Responde If-None-Match/If-Modified-Since com 304 a partir de ``Caso.versao``.
+
+    A verificação custa uma consulta indexada pela chave primária e acontece antes de a
+    view carregar os laudos, renderizar templates ou gerar o PDF. Páginas com formulário
+    dependem do usuário e do token CSRF, que entram no ETag quando ``por_usuario``.
+
+    ``atualizado_em`` também entra no ETag: o workflow avança a versão, mas edições feitas
+    pelo admin no caso, nos laudos ou no paciente só atualizam o carimbo (``apps.ready``).
+    """
+
+    def etag(request, caso_id):
+        if not _requisicao_condicional(request):
+            return None
+        estado = _versao_caso(request, caso_id)
+        if estado is None:
+            return None
+        partes = [prefixo, caso_id, str(estado[0]), estado[1].isoformat() if estado[1] else ""]
+        if por_usuario:
+            partes += [
+                str(request.user.pk),
+                request.user.role,
+                request.COOKIES.get(settings.CSRF_COOKIE_NAME, ""),
+            ]
+        return hashlib.sha1(":".join(partes).encode("utf-8")).hexdigest()
+
+    def ultima_modificacao(request, caso_id):
+        if not _requisicao_condicional(request):
+            return None
+        estado = _versao_caso(request, caso_id)
+        return estado[1] if estado else None
+
+    def decorator(view):
+        return cache_control(private=True, no_cache=True)(
+            condition(etag_func=etag, last_modified_func=ultima_modificacao)(view)
+        )
+
+    return decorator
+
+
+LIMITE_LINHA_DO_TEMPO = 100
+
+
+def _querystring_pagina(request, **cursor) -> str:
+    params = request.GET.copy()
+    params.pop("apos", None)
+    params.pop("antes", None)
+    params.update(cursor)
+    return params.urlencode()
+
+
 @login_required
 def dashboard_view(request):
-    casos = (
-        Caso.objects.select_related("paciente", "criado_por")
-        .order_by("-data_recebimento")
-    )
-    user_role = request.user.role
+    filtro_form = WorklistFiltroForm(request.GET or None)
+    filtros = filtro_form.cleaned_data if filtro_form.is_valid() else {}
 
-    for caso in casos:
-        if user_role in ["ADMIN", "PROFESSOR"] or caso.criado_por == request.user:
-            caso.paciente_anonimizado = {
-                "numero_prontuario": caso.paciente.numero_prontuario,
-                "data_nascimento": caso.paciente.data_nascimento,
-                "sexo": caso.paciente.get_sexo_display(),
-            }
-        else:
-            caso.paciente_anonimizado = {
-                "numero_prontuario": "***",
-                "data_nascimento": "***",
-                "sexo": "***",
-            }
+    user_role = request.user.role
 
-        caso.macro_status_display = caso.get_macro_status_display()
-        caso.preparo_status_display = caso.get_preparo_status_display()
-        caso.micro_status_display = caso.get_micro_status_display()
-        caso.macro_badge_class = _badge_class(caso.macro_status)
-        caso.preparo_badge_class = _badge_class(caso.preparo_status)
-        caso.micro_badge_class = _badge_class(caso.micro_status)
+    def renderizar_worklist() -> str:
+        casos = worklist.projetar(
+            worklist.aplicar_filtros(Caso.objects.all(), filtros),
+            request.user,
+        )
+        pagina = worklist.paginar(
+            casos,
+            apos=request.GET.get("apos"),
+            antes=request.GET.get("antes"),
+        )
+        for item in pagina.itens:
+            item["acoes"] = transicoes.permissoes(item, user_role).acoes
+        worklist_context = {
+            "casos": pagina.itens,
+            "pagina": pagina,
+            "proxima_querystring": (
+                _querystring_pagina(request, apos=pagina.proximo_cursor) if pagina.tem_proxima else ""
+            ),
+            "anterior_querystring": (
+                _querystring_pagina(request, antes=pagina.anterior_cursor) if pagina.tem_anterior else ""
+            ),
+            "user_role": user_role,
+            "pode_aprovar": user_role in workflow.PROFESSOR_ROLES,
+            "etapas_lote": ETAPAS_LOTE,
+            "pagina_atual": request.get_full_path(),
+            "csrf_token": cache_worklist.CSRF_MARCADOR,
+        }
+        return render_to_string("laudos/_worklist.html", worklist_context)
 
     context = {
-        "casos": casos,
+        "worklist_html": mark_safe(cache_worklist.obter_html(request, renderizar_worklist)),
+        "filtro_form": filtro_form,
         "user_role": user_role,
-        "total_casos": casos.count(),
+        "resumo": contadores.resumo(),
+        "rotulos_eventos": {
+            "status": worklist.STATUS_LABELS,
+            "etapa": worklist.ETAPA_STATUS_LABELS,
+            "badges": worklist.STAGE_BADGE_CLASSES,
+            "badge_padrao": worklist.BADGE_PADRAO,
+        },
     }
     return render(request, "laudos/dashboard.html", context)
 
 
+SSE_INTERVALO_KEEPALIVE = 20
+
+
+@login_required
+async def eventos_casos_view(request):
+    """Fluxo Server-Sent Events com as mudanças de status dos casos.
+
+    Os eventos trazem apenas o id do caso e os status, nunca dados de paciente.
+    Cada conexão ociosa fica parada em ``await`` sobre uma fila, sem ocupar thread.
+    """
+    ultimo_id = request.headers.get("Last-Event-ID") or request.GET.get("ultimo_id")
+
+    async def fluxo():
+        assinatura = eventos.transmissor.assinar(ultimo_id)
+        try:
+            yield "retry: 5000\n\n"
+            for evento in assinatura.pendentes:
+                yield evento.formatar()
+            while True:
+                if assinatura.atrasada:
+                    yield "event: recarregar\ndata: {}\n\n"
+                    return
+                try:
+                    evento = await asyncio.wait_for(assinatura.fila.get(), SSE_INTERVALO_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield evento.formatar()
+        finally:
+            eventos.transmissor.cancelar(assinatura)
+
+    response = StreamingHttpResponse(fluxo(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+@login_required
+@user_passes_test(is_professor_or_admin)
+def metricas_view(request):
+    return JsonResponse(
+        {
+            "worklist_cache": cache_worklist.estatisticas(),
+            "eventos_conexoes_ativas": eventos.transmissor.conexoes_ativas,
+            "logs_pendentes": registro_atividade.gravador.pendentes,
+            "fila_pdf": tarefas_pdf.estatisticas(),
+            **metricas.snapshot(),
+        }
+    )
+
+
+def _ler_busca(request) -> tuple[str, int, int]:
+    texto = request.GET.get("q", "").strip()
+    try:
+        pagina = max(int(request.GET.get("pagina", 1)), 1)
+    except ValueError:
+        pagina = 1
+    try:
+        limite = min(max(int(request.GET.get("limite", busca.LIMITE_PADRAO)), 1), busca.LIMITE_MAXIMO)
+    except ValueError:
+        limite = busca.LIMITE_PADRAO
+    return texto, pagina, limite
+
+
+def _pesquisar(request, texto: str, pagina: int, limite: int) -> tuple[list[dict], bool]:
+    # Um resultado a mais indica se existe a próxima página.
+    resultados = busca.pesquisar(texto, request.user, limite=limite + 1, deslocamento=(pagina - 1) * limite)
+    return resultados[:limite], len(resultados) > limite
+
+
+@login_required
+def busca_view(request):
+    texto, pagina, limite = _ler_busca(request)
+    resultados, tem_proxima = _pesquisar(request, texto, pagina, limite) if texto else ([], False)
+
+    def querystring(numero: int) -> str:
+        params = request.GET.copy()
+        params["pagina"] = numero
+        return params.urlencode()
+
+    context = {
+        "q": texto,
+        "resultados": resultados,
+        "pagina": pagina,
+        "tem_proxima": tem_proxima,
+        "anterior_querystring": querystring(pagina - 1) if pagina > 1 else "",
+        "proxima_querystring": querystring(pagina + 1) if tem_proxima else "",
+    }
+    return render(request, "laudos/busca.html", context)
+
+
+@login_required
+def sugestoes_conclusao_json_view(request):
+    """Sugestões de conclusão para o texto digitado, lidas só da memória do processo."""
+    try:
+        limite = min(max(int(request.GET.get("limite", autocompletar.LIMITE_PADRAO)), 1), 20)
+    except ValueError:
+        limite = autocompletar.LIMITE_PADRAO
+    return JsonResponse({"sugestoes": autocompletar.sugerir(request.GET.get("q", ""), limite)})
+
+
+@login_required
+@user_passes_test(is_professor_or_admin)
+def casos_semelhantes_json_view(request, caso_id):
+    """Casos finalizados mais parecidos com a microscopia do caso.
+
+    Com ``texto``, ``conclusao`` ou ``tags`` na query, compara o que está no formulário em vez
+    do que já foi salvo.
+    """
+    caso = arquivo.obter_caso_ou_404(caso_id)
+    try:
+        limite = min(max(int(request.GET.get("limite", semelhantes.LIMITE_PADRAO)), 1), 20)
+    except ValueError:
+        limite = semelhantes.LIMITE_PADRAO
+    pesos = None
+    if {"texto", "conclusao", "tags"} & set(request.GET):
+        pesos = semelhantes.vetor(
+            request.GET.get("texto", ""),
+            request.GET.get("conclusao", ""),
+            tags.normalizar_nomes(request.GET.getlist("tags")),
+        )
+    return JsonResponse(
+        {
+            "caso": caso.id_laboratorio,
+            "semelhantes": [
+                {**linha, "url": reverse("editar_laudo", args=[linha["id_laboratorio"]])}
+                for linha in semelhantes.semelhantes(caso, limite, pesos=pesos)
+            ],
+        }
+    )
+
+
+@login_required
+def busca_json_view(request):
+    texto, pagina, limite = _ler_busca(request)
+    if not texto:
+        return JsonResponse({"erro": "Informe o termo de busca em q."}, status=400)
+    resultados, tem_proxima = _pesquisar(request, texto, pagina, limite)
+    return JsonResponse(
+        {
+            "q": texto,
+            "pagina": pagina,
+            "tem_proxima": tem_proxima,
+            "resultados": [
+                {
+                    "id_laboratorio": linha["id_laboratorio"],
+                    "status": linha["status"],
+                    "status_display": linha["status_display"],
+                    "data_recebimento": linha["data_recebimento"],
+                    "solicitante": linha["solicitante"],
+                    "numero_prontuario": linha["numero_prontuario"],
+                    "restrito": linha["restrito"],
+                    "pontuacao": linha["pontuacao"],
+                    "trecho": linha["trecho"],
+                }
+                for linha in resultados
+            ],
+        }
+    )
+
+
+@login_required
+@user_passes_test(is_professor_or_admin)
+def caixa_aprovacao_view(request):
+    context = {"filas": aprovacoes.caixa_de_entrada(), "pagina_atual": request.get_full_path()}
+    return render(request, "laudos/caixa_aprovacao.html", context)
+
+
+@login_required
+@user_passes_test(is_professor_or_admin)
+def caixa_aprovacao_json_view(request):
+    try:
+        limite = min(int(request.GET.get("limite", aprovacoes.LIMITE_PADRAO)), 500)
+    except ValueError:
+        limite = aprovacoes.LIMITE_PADRAO
+    filas = aprovacoes.caixa_de_entrada(limite=max(limite, 1))
+    return JsonResponse(
+        {
+            "filas": [
+                {
+                    "fila": fila["slug"],
+                    "titulo": fila["titulo"],
+                    "total": fila["total"],
+                    "casos": fila["casos"],
+                }
+                for fila in filas
+            ]
+        }
+    )
+
+
+def _ler_tempos(request) -> tuple[str, datetime.date, datetime.date]:
+    agrupamento = request.GET.get("agrupamento", "semana")
+    if agrupamento not in tempos.AGRUPAMENTOS:
+        agrupamento = "semana"
+    try:
+        dias = min(max(int(request.GET.get("dias", 84)), 1), 730)
+    except ValueError:
+        dias = 84
+    fim = timezone.localdate()
+    return agrupamento, fim - datetime.timedelta(days=dias - 1), fim
+
+
+@login_required
+@user_passes_test(is_professor_or_admin)
+def analise_tempos_view(request):
+    agrupamento, inicio, fim = _ler_tempos(request)
+    context = {
+        "agrupamento": agrupamento,
+        "agrupamentos": tempos.AGRUPAMENTOS,
+        "dias": (fim - inicio).days + 1,
+        "inicio": inicio,
+        "fim": fim,
+        "metricas": [(nome, rotulo) for nome, (rotulo, *_) in tempos.METRICAS.items()],
+        "grupos": [
+            {"grupo": linha["grupo"], "celulas": [linha["metricas"][nome] for nome in tempos.METRICAS]}
+            for linha in tempos.resumo(agrupamento, inicio, fim)
+        ],
+        "ultimo_dia": tempos.ultimo_dia(),
+    }
+    return render(request, "laudos/analise_tempos.html", context)
+
+
+@login_required
+@user_passes_test(is_professor_or_admin)
+def analise_tempos_json_view(request):
+    """Percentis, em horas, dos tempos de cada etapa; lidos só das linhas diárias consolidadas."""
+    agrupamento, inicio, fim = _ler_tempos(request)
+    ultimo = tempos.ultimo_dia()
+    return JsonResponse(
+        {
+            "agrupamento": agrupamento,
+            "inicio": inicio.isoformat(),
+            "fim": fim.isoformat(),
+            "consolidado_ate": ultimo.isoformat() if ultimo else None,
+            "grupos": [
+                {**linha, "grupo": str(linha["grupo"])} for linha in tempos.resumo(agrupamento, inicio, fim)
+            ],
+        }
+    )
+
+
 @login_required
 def criar_caso_view(request):
     if request.method == "POST":
@@ -98,8 +477,7 @@ def criar_caso_view(request):
             paciente = paciente_form.save()
             caso = caso_form.save(commit=False)
             caso.paciente = paciente
-            caso.criado_por = request.user
-            caso.save()
+            workflow.criar_caso(caso, request.user)
             messages.success(request, f"Caso {caso.id_laboratorio} criado com sucesso!")
             return redirect("dashboard")
     else:
@@ -111,6 +489,7 @@ def criar_caso_view(request):
 
 
 @login_required
+@condicional_por_versao("laudo-macro")
 def laudo_macro_view(request, caso_id):
     caso = get_object_or_404(Caso, id_laboratorio=caso_id)
     laudo_macro = getattr(caso, "laudo_macroscopico", None)
@@ -119,47 +498,26 @@ def laudo_macro_view(request, caso_id):
     if request.method == "POST":
         form = LaudoMacroscopicoForm(request.POST, instance=laudo_macro)
         if form.is_valid():
-            cor = (
-                form.cleaned_data["cor_personalizada"].strip()
-                if form.cleaned_data["cor"] == "descrever"
-                else form.cleaned_data["cor"]
-            )
-            consistencia = (
-                form.cleaned_data["consistencia_personalizada"].strip()
-                if form.cleaned_data["consistencia"] == "descrever"
-                else form.cleaned_data["consistencia"]
-            )
-            forma = (
-                form.cleaned_data["forma_personalizada"].strip()
-                if form.cleaned_data["forma"] == "descrever"
-                else form.cleaned_data["forma"]
-            )
-
-            dados_macro = {
-                "num_fragmentos": form.cleaned_data["num_fragmentos"],
-                "dim_comprimento_mm": form.cleaned_data["dim_comprimento_mm"],
-                "dim_largura_mm": form.cleaned_data["dim_largura_mm"],
-                "dim_altura_mm": form.cleaned_data["dim_altura_mm"],
-                "cor": cor,
-                "consistencia": consistencia,
-                "forma": forma,
-            }
-            texto_gerado = request.POST.get("texto_gerado", "")
-            workflow.registrar_macroscopia(
-                caso,
-                request.user,
-                dados_macro,
-                texto_gerado=texto_gerado,
-                laudo_existente=laudo_macro,
-            )
-            messages.success(request, "Laudo macroscópico salvo com sucesso!")
-            return redirect("laudo_micro", caso_id=caso.id_laboratorio)
+            dados_macro = _dados_macro(request, form)
+            try:
+                workflow.registrar_macroscopia(
+                    caso,
+                    request.user,
+                    dados_macro,
+                    laudo_existente=laudo_macro,
+                )
+            except ValidationError as exc:
+                messages.error(request, exc.message)
+            else:
+                messages.success(request, "Laudo macroscópico salvo com sucesso!")
+                return redirect("laudo_micro", caso_id=caso.id_laboratorio)
 
     context = {"caso": caso, "form": form, "laudo_macro": laudo_macro}
     return render(request, "laudos/laudo_macro.html", context)
 
 
 @login_required
+@condicional_por_versao("laudo-micro")
 def laudo_micro_view(request, caso_id):
     caso = get_object_or_404(Caso, id_laboratorio=caso_id)
     laudo_micro = getattr(caso, "laudo_microscopico", None)
@@ -168,61 +526,51 @@ def laudo_micro_view(request, caso_id):
     if request.method == "POST":
         form = LaudoMicroscopicoForm(request.POST, instance=laudo_micro)
         if form.is_valid():
+            selecionadas = tags.normalizar_nomes(request.POST.getlist("tags"))
             dados_micro = {
                 "texto_final": form.cleaned_data["texto_final"],
                 "conclusao": form.cleaned_data["conclusao"],
                 "notas": form.cleaned_data["notas"],
-                "tags_selecionadas": request.POST.getlist("tags"),
-                "texto_base_gerado": request.POST.get("texto_base_gerado", ""),
+                "tags_selecionadas": selecionadas,
+                "texto_base_gerado": textos.texto_micro(selecionadas, tags.textos()),
             }
-            workflow.registrar_microscopia(
-                caso,
-                request.user,
-                dados_micro,
-                laudo_existente=laudo_micro,
-            )
-            messages.success(request, "Laudo microscópico salvo com sucesso!")
-            return redirect("dashboard")
+            try:
+                workflow.registrar_microscopia(
+                    caso,
+                    request.user,
+                    dados_micro,
+                    laudo_existente=laudo_micro,
+                )
+            except ValidationError as exc:
+                messages.error(request, exc.message)
+            else:
+                messages.success(request, "Laudo microscópico salvo com sucesso!")
+                return redirect("dashboard")
 
-    tags_microscopicas = [
-        "Hiperceratose",
-        "Acantose",
-        "Infiltrado Inflamatório",
-        "Atipia Citológica",
-        "Displasia",
-        "Metaplasia",
-        "Necrose",
-        "Fibrose",
-        "Vasodilatação",
-        "Edema",
-        "Hemossiderose",
-        "Pigmentação",
-        "Calcificação",
-        "Cistos",
-        "Pólipos",
-        "Ulceração",
-        "Erosão",
-        "Hiperplasia",
-        "Atrofia",
-    ]
+    textos_tags = tags.textos()
 
     context = {
         "caso": caso,
         "form": form,
         "laudo_micro": laudo_micro,
-        "tags_microscopicas": tags_microscopicas,
+        "tags_microscopicas": list(textos_tags),
+        "textos_tags": textos_tags,
     }
     return render(request, "laudos/laudo_micro.html", context)
 
 
 
 @login_required
+@condicional_por_versao("editar-laudo")
 def editar_laudo_view(request, caso_id):
-    caso = get_object_or_404(Caso, id_laboratorio=caso_id)
+    caso = arquivo.obter_caso_ou_404(caso_id)
     is_professor = is_professor_or_admin(request.user)
     if not is_professor and caso.criado_por != request.user:
         messages.error(request, "Permissao negada. Voce so pode editar casos que criou.")
         return redirect("dashboard")
+    if caso.arquivado and request.method == "POST":
+        messages.error(request, "Caso arquivado: somente leitura.")
+        return redirect("editar_laudo", caso_id=caso_id)
 
     laudo_macro = getattr(caso, "laudo_macroscopico", None)
     laudo_micro = getattr(caso, "laudo_microscopico", None)
@@ -238,36 +586,10 @@ def editar_laudo_view(request, caso_id):
             if aba_ativa == "macro":
                 macro_form = LaudoMacroscopicoForm(request.POST, instance=laudo_macro)
                 if macro_form.is_valid():
-                    cor = (
-                        macro_form.cleaned_data["cor_personalizada"].strip()
-                        if macro_form.cleaned_data["cor"] == "descrever"
-                        else macro_form.cleaned_data["cor"]
-                    )
-                    consistencia = (
-                        macro_form.cleaned_data["consistencia_personalizada"].strip()
-                        if macro_form.cleaned_data["consistencia"] == "descrever"
-                        else macro_form.cleaned_data["consistencia"]
-                    )
-                    forma = (
-                        macro_form.cleaned_data["forma_personalizada"].strip()
-                        if macro_form.cleaned_data["forma"] == "descrever"
-                        else macro_form.cleaned_data["forma"]
-                    )
-                    dados_macro = {
-                        "num_fragmentos": macro_form.cleaned_data["num_fragmentos"],
-                        "dim_comprimento_mm": macro_form.cleaned_data["dim_comprimento_mm"],
-                        "dim_largura_mm": macro_form.cleaned_data["dim_largura_mm"],
-                        "dim_altura_mm": macro_form.cleaned_data["dim_altura_mm"],
-                        "cor": cor,
-                        "consistencia": consistencia,
-                        "forma": forma,
-                    }
-                    texto_gerado = request.POST.get("texto_gerado", "")
                     workflow.registrar_macroscopia(
                         caso,
                         request.user,
-                        dados_macro,
-                        texto_gerado=texto_gerado,
+                        _dados_macro(request, macro_form),
                         laudo_existente=laudo_macro,
                     )
                     messages.success(request, "Dados macroscopicos salvos com sucesso.")
@@ -294,12 +616,13 @@ def editar_laudo_view(request, caso_id):
             elif aba_ativa == "micro":
                 micro_form = LaudoMicroscopicoForm(request.POST, instance=laudo_micro)
                 if micro_form.is_valid():
+                    selecionadas = tags.normalizar_nomes(request.POST.getlist("tags"))
                     dados_micro = {
                         "texto_final": micro_form.cleaned_data["texto_final"],
                         "conclusao": micro_form.cleaned_data["conclusao"],
                         "notas": micro_form.cleaned_data["notas"],
-                        "tags_selecionadas": request.POST.getlist("tags"),
-                        "texto_base_gerado": request.POST.get("texto_base_gerado", ""),
+                        "tags_selecionadas": selecionadas,
+                        "texto_base_gerado": textos.texto_micro(selecionadas, tags.textos()),
                     }
                     workflow.registrar_microscopia(
                         caso,
@@ -321,60 +644,33 @@ def editar_laudo_view(request, caso_id):
 
         return redirect("editar_laudo", caso_id=caso.id_laboratorio)
 
+    permissoes = transicoes.permissoes(caso, request.user.role)
+
     macro_has_data = laudo_macro is not None
-    macro_editable_statuses = {"PENDENTE", "EM_PROGRESSO", "REPROVADO"}
-    macro_editable = caso.macro_status in macro_editable_statuses
-    macro_block_reason = None
-    if not macro_editable:
-        if caso.macro_status == "AGUARDANDO_APROVACAO":
-            macro_block_reason = "Macroscopia aguardando aprovacao."
-        elif caso.macro_status == "APROVADO":
-            macro_block_reason = "Macroscopia aprovada."
-        _disable_form(macro_form)
-    macro_can_submit = macro_has_data and caso.macro_status in {"EM_PROGRESSO", "REPROVADO"}
-    macro_can_approve = is_professor and caso.macro_status == "AGUARDANDO_APROVACAO"
+    macro_editable = permissoes.permite("registrar_macro")
+    macro_block_reason = permissoes.motivo("registrar_macro")
+    macro_can_submit = macro_has_data and permissoes.permite("solicitar_macro")
+    macro_can_approve = permissoes.permite("aprovar_macro")
 
     preparo_has_data = metodo_preparo is not None
-    if caso.macro_status != "APROVADO":
-        preparo_editable = False
-        preparo_block_reason = "Aguarde a aprovacao da macroscopia."
-    else:
-        if caso.preparo_status in {"AGUARDANDO_APROVACAO", "APROVADO"}:
-            preparo_editable = False
-            if caso.preparo_status == "AGUARDANDO_APROVACAO":
-                preparo_block_reason = "Preparo aguardando aprovacao."
-            else:
-                preparo_block_reason = "Preparo aprovado."
-        else:
-            preparo_editable = True
-            preparo_block_reason = None
-    if not preparo_editable:
-        _disable_form(preparo_form)
-    preparo_can_submit = (
-        preparo_has_data and preparo_editable and caso.preparo_status in {"EM_PROGRESSO", "REPROVADO"}
-    )
-    preparo_can_approve = is_professor and caso.preparo_status == "AGUARDANDO_APROVACAO"
+    preparo_editable = permissoes.permite("registrar_preparo")
+    preparo_block_reason = permissoes.motivo("registrar_preparo")
+    preparo_can_submit = preparo_has_data and permissoes.permite("solicitar_preparo")
+    preparo_can_approve = permissoes.permite("aprovar_preparo")
 
     micro_has_data = laudo_micro is not None
-    if caso.preparo_status != "APROVADO":
-        micro_editable = False
-        micro_block_reason = "Aguarde a aprovacao do preparo."
-    else:
-        if caso.micro_status in {"AGUARDANDO_APROVACAO", "APROVADO"}:
-            micro_editable = False
-            if caso.micro_status == "AGUARDANDO_APROVACAO":
-                micro_block_reason = "Microscopia aguardando aprovacao."
-            else:
-                micro_block_reason = "Microscopia aprovada."
-        else:
-            micro_editable = True
-            micro_block_reason = None
-    if not micro_editable:
-        _disable_form(micro_form)
-    micro_can_submit = (
-        micro_has_data and micro_editable and caso.micro_status in {"EM_PROGRESSO", "REPROVADO"}
-    )
-    micro_can_approve = is_professor and caso.micro_status == "AGUARDANDO_APROVACAO"
+    micro_editable = permissoes.permite("registrar_micro")
+    micro_block_reason = permissoes.motivo("registrar_micro")
+    micro_can_submit = micro_has_data and permissoes.permite("solicitar_micro")
+    micro_can_approve = permissoes.permite("aprovar_micro")
+
+    for editable, form in (
+        (macro_editable, macro_form),
+        (preparo_editable, preparo_form),
+        (micro_editable, micro_form),
+    ):
+        if not editable:
+            _disable_form(form)
 
     stage_summary = [
         {
@@ -412,27 +708,10 @@ def editar_laudo_view(request, caso_id):
         },
     ]
 
-    tags_microscopicas = [
-        "Hiperceratose",
-        "Acantose",
-        "Infiltrado Inflamatorio",
-        "Atipia Citologica",
-        "Displasia",
-        "Metaplasia",
-        "Necrose",
-        "Fibrose",
-        "Vasodilatacao",
-        "Edema",
-        "Hemossiderose",
-        "Pigmentacao",
-        "Calcificacao",
-        "Cistos",
-        "Polipos",
-        "Ulceracao",
-        "Erosao",
-        "Hiperplasia",
-        "Atrofia",
-    ]
+    # Uma busca em log_caso_timestamp_idx, do registro mais novo para o mais antigo.
+    linha_do_tempo = arquivo.linha_do_tempo(caso, LIMITE_LINHA_DO_TEMPO)
+
+    textos_tags = tags.textos()
 
     context = {
         "caso": caso,
@@ -442,8 +721,10 @@ def editar_laudo_view(request, caso_id):
         "laudo_macro": laudo_macro,
         "laudo_micro": laudo_micro,
         "metodo_preparo": metodo_preparo,
-        "tags_microscopicas": tags_microscopicas,
+        "tags_microscopicas": list(textos_tags),
+        "textos_tags": textos_tags,
         "stage_summary": stage_summary,
+        "linha_do_tempo": linha_do_tempo,
         "macro_editable": macro_editable,
         "macro_block_reason": macro_block_reason,
         "macro_can_submit": macro_can_submit,
@@ -584,92 +865,152 @@ def aprovar_laudo_view(request, caso_id):
     return redirect("dashboard")
 
 
+ETAPAS_LOTE = {
+    "macro": "Macroscopia",
+    "preparo": "Preparo",
+    "micro": "Microscopia",
+    "final": "Laudo final",
+}
+
+
+def _ler_aprovacao_em_lote(request):
+    if request.content_type == "application/json":
+        try:
+            corpo = json.loads(request.body or b"{}")
+        except ValueError:
+            return None, []
+        casos = corpo.get("casos") or []
+        return corpo.get("etapa"), [str(caso) for caso in casos] if isinstance(casos, list) else []
+    return request.POST.get("etapa"), request.POST.getlist("casos")
+
+
 @login_required
-def gerar_pdf_view(request, caso_id):
-    caso = get_object_or_404(Caso, id_laboratorio=caso_id)
-    buffer = io.BytesIO()
-    p = canvas.Canvas(buffer, pagesize=A4)
-    width, height = A4
-
-    def draw_header():
-        p.setFont("Helvetica-Bold", 14)
-        p.drawCentredString(width / 2.0, height - 2 * cm, "LPB - Laboratório de Patologia Bucal")
-        p.setFont("Helvetica", 12)
-        p.drawCentredString(width / 2.0, height - 2.6 * cm, "Universidade Federal de Santa Catarina")
-        p.setFont("Helvetica-Bold", 12)
-        p.drawCentredString(
-            width / 2.0,
-            height - 3.5 * cm,
-            f"LAUDO ANATOMOPATOLÓGICO - Nº {caso.id_laboratorio}",
-        )
+@user_passes_test(is_professor_or_admin)
+def aprovar_em_lote_view(request):
+    como_json = request.content_type == "application/json"
+    destino = request.POST.get("next") if not como_json else None
+    if not destino or not url_has_allowed_host_and_scheme(destino, allowed_hosts={request.get_host()}):
+        destino = "dashboard"
 
-    def draw_paciente_info(y_start):
-        dados = [
-            ["Paciente", caso.paciente.numero_prontuario, "Solicitante", caso.solicitante],
-            [
-                "Data de nascimento",
-                caso.paciente.data_nascimento.strftime("%d/%m/%Y"),
-                "Data de recebimento",
-                caso.data_recebimento.strftime("%d/%m/%Y"),
-            ],
-        ]
-        tabela = Table(dados, colWidths=[3.5 * cm, 6 * cm, 3.5 * cm, 6 * cm])
-        tabela.setStyle(
-            TableStyle(
-                [
-                    ("BACKGROUND", (0, 0), (-1, 0), colors.lightgrey),
-                    ("BOX", (0, 0), (-1, -1), 0.5, colors.black),
-                    ("INNERGRID", (0, 0), (-1, -1), 0.25, colors.black),
-                    ("FONT", (0, 0), (-1, -1), "Helvetica", 10),
-                ]
-            )
+    if request.method != "POST":
+        if como_json:
+            return JsonResponse({"erro": "Método não permitido."}, status=405)
+        messages.error(request, "Método não permitido.")
+        return redirect(destino)
+
+    etapa, casos = _ler_aprovacao_em_lote(request)
+    if etapa not in ETAPAS_LOTE or not casos:
+        erro = "Informe a etapa e ao menos um caso."
+        if como_json:
+            return JsonResponse({"erro": erro}, status=400)
+        messages.error(request, erro)
+        return redirect(destino)
+
+    try:
+        resultados = workflow.aprovar_em_lote(etapa, casos, request.user)
+    except PermissionDenied as exc:
+        if como_json:
+            return JsonResponse({"erro": str(exc)}, status=403)
+        messages.error(request, str(exc))
+        return redirect(destino)
+    except workflow.ConflitoTransicao as exc:
+        if como_json:
+            return JsonResponse({"erro": exc.message}, status=409)
+        messages.error(request, exc.message)
+        return redirect(destino)
+
+    aprovados = [caso_id for caso_id, erro in resultados.items() if erro is None]
+    if como_json:
+        return JsonResponse(
+            {
+                "etapa": etapa,
+                "aprovados": len(aprovados),
+                "resultados": {
+                    caso_id: {"ok": erro is None, "mensagem": erro or "Aprovado."}
+                    for caso_id, erro in resultados.items()
+                },
+            }
         )
-        tabela.wrapOn(p, width - 4 * cm, height)
-        tabela.drawOn(p, 2 * cm, y_start)
-        return y_start - (tabela._height + 0.5 * cm)
-
-    def draw_section(title, text, y_start):
-        p.setFont("Helvetica-Bold", 12)
-        p.drawString(2 * cm, y_start, title)
-        y = y_start - 0.4 * cm
-        p.setFont("Helvetica", 11)
-        for linha in text.split("\n"):
-            p.drawString(2 * cm, y, linha)
-            y -= 0.4 * cm
-        return y - 0.5 * cm
-
-    draw_header()
-    y_cursor = draw_paciente_info(height - 6 * cm)
-
-    if hasattr(caso, "laudo_macroscopico"):
-        macro_texto = caso.laudo_macroscopico.texto_editado or caso.laudo_macroscopico.texto_gerado
-        y_cursor = draw_section("MACROSCOPIA", macro_texto, y_cursor)
-
-    if hasattr(caso, "metodo_preparo"):
-        preparo = caso.metodo_preparo
-        preparo_texto = "Processamento histológico padrão, microtomia e coloração de H&E" if preparo.metodo_padrao_he else "Método especial de preparo"
-        if preparo.notas_adicionais:
-            preparo_texto += f"\nNotas adicionais: {preparo.notas_adicionais}"
-        y_cursor = draw_section("PREPARO/COLOCAÇÃO", preparo_texto, y_cursor)
-
-    if hasattr(caso, "laudo_microscopico"):
-        micro = caso.laudo_microscopico
-        micro_texto = f"{micro.texto_final}\n\nConclusão: {micro.conclusao}"
-        if micro.notas:
-            micro_texto += f"\nNotas: {micro.notas}"
-        y_cursor = draw_section("MICROSCOPIA", micro_texto, y_cursor)
-
-    p.setFont("Helvetica", 10)
-    p.drawCentredString(width / 2.0, 4 * cm, "____________________________________")
-    responsavel = caso.responsavel_final.get_full_name() if caso.responsavel_final else "Responsável"
-    p.drawCentredString(width / 2.0, 3.5 * cm, responsavel)
-    p.drawCentredString(width / 2.0, 3.1 * cm, "Professor Responsável")
-
-    p.showPage()
-    p.save()
-    buffer.seek(0)
-
-    filename = f"laudo_{caso.id_laboratorio}.pdf"
-    response = HttpResponse(buffer.getvalue(), content_type="application/pdf")
-    response["Content-Disposition"] = f"attachment; filename={filename}"
+
+    if aprovados:
+        messages.success(request, f"{ETAPAS_LOTE[etapa]}: {len(aprovados)} caso(s) aprovado(s).")
+    for caso_id, erro in resultados.items():
+        if erro is not None:
+            messages.error(request, f"Caso {caso_id}: {erro}")
+    return redirect(destino)
+
+
+# Segundos que o hash do PDF de uma versão do caso fica memorizado.
+TEMPO_ETAG_PDF = 24 * 60 * 60
+
+
+def _pdf_do_caso(request, caso_id):
+    """(dados, chave) do PDF, calculados uma única vez por requisição."""
+    cache = request.__dict__.setdefault("_laudos_pdf", {})
+    if caso_id not in cache:
+        dados = pdf.dados_laudo(arquivo.obter_caso_ou_404(caso_id))
+        cache[caso_id] = (dados, pdf.chave(dados))
+    return cache[caso_id]
+
+
+def _etag_pdf(request, caso_id):
+    """Hash do conteúdo (ETag forte), memorizado por versão do caso.
+
+    Com a versão já vista, o 304 custa só a consulta indexada de ``_versao_caso``; o
+    caso e os laudos são carregados apenas quando o PDF vai mesmo ser entregue.
+    """
+    if not _requisicao_condicional(request):
+        return None
+    estado = _versao_caso(request, caso_id)
+    if estado is None:
+        return None
+    partes = ["pdf", str(pdf.VERSAO_LAYOUT), caso_id, str(estado[0]), estado[1].isoformat() if estado[1] else ""]
+    chave_cache = "laudos:pdf:etag:" + hashlib.sha1(":".join(partes).encode("utf-8")).hexdigest()
+    etag = cache_django.get(chave_cache)
+    if etag is None:
+        etag = _pdf_do_caso(request, caso_id)[1]
+        cache_django.set(chave_cache, etag, timeout=TEMPO_ETAG_PDF)
+    return etag
+
+
+@login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_etag_pdf)
+def gerar_pdf_view(request, caso_id):
+    dados, chave = _pdf_do_caso(request, caso_id)
+    filename = f"laudo_{dados['id_laboratorio']}.pdf"
+    cabecalho = getattr(settings, "LAUDOS_PDF_SENDFILE", "")
+    if cabecalho:
+        # O proxy (X-Sendfile no Apache, X-Accel-Redirect no nginx) entrega o arquivo.
+        caminho = pdf.obter(dados, chave)
+        prefixo = getattr(settings, "LAUDOS_PDF_SENDFILE_PREFIXO", "")
+        response = HttpResponse(content_type="application/pdf")
+        response[cabecalho] = f"{prefixo}{caminho.name}" if prefixo else str(caminho)
+        response["Content-Disposition"] = content_disposition_header(True, filename)
+        return response
+    return FileResponse(pdf.abrir(dados, chave), as_attachment=True, filename=filename, content_type="application/pdf")
+
+
+def _ler_data(valor):
+    try:
+        return datetime.date.fromisoformat(valor) if valor else None
+    except ValueError:
+        raise ValueError(f"Data inválida: {valor}.")
+
+
+@login_required
+@user_passes_test(pode_exportar)
+def exportar_laudos_view(request):
+    """ZIP com os PDFs dos laudos finalizados no período e/ou dos casos informados."""
+    casos = [caso for valor in request.GET.getlist("casos") for caso in valor.split(",")]
+    try:
+        inicio = _ler_data(request.GET.get("inicio"))
+        fim = _ler_data(request.GET.get("fim"))
+        ids = exportacao.selecionar(inicio, fim, casos)
+    except ValueError as erro:
+        return JsonResponse({"erro": str(erro)}, status=400)
+
+    nome = f"laudos_{inicio or 'inicio'}_{fim or 'hoje'}.zip" if inicio or fim else "laudos.zip"
+    response = StreamingHttpResponse(exportacao.gerar_zip(ids), content_type="application/zip")
+    response["Content-Disposition"] = content_disposition_header(True, nome)
     return response
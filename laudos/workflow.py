@@ -2,26 +2,110 @@
 
 from __future__ import annotations
 
-from typing import Optional
+import datetime
+from dataclasses import dataclass
+from functools import partial
+from typing import Callable, Iterable, Optional
 
 from django.core.exceptions import PermissionDenied, ValidationError
 from django.db import transaction
+from django.db.models import Case, F, Q, Value, When
 from django.utils import timezone
 
+from . import (
+    autocompletar,
+    busca,
+    cache_worklist,
+    contadores,
+    eventos,
+    pdf,
+    registro_atividade,
+    semelhantes,
+    tags,
+    tarefas_pdf,
+    terminologia,
+    transicoes,
+)
 from .models import (
     Caso,
     LaudoMacroscopico,
     LaudoMicroscopico,
-    LogAtividade,
     MetodoPreparo,
     UsuarioCustomizado,
 )
 
-PROFESSOR_ROLES = {"PROFESSOR", "ADMIN"}
+PROFESSOR_ROLES = transicoes.PAPEIS_PROFESSOR
+
+
+class ConflitoTransicao(ValidationError):
+    """O caso mudou entre a leitura e a gravação da transição."""
+
+    def __init__(self, mensagem: str):
+        super().__init__(mensagem, code="conflito")
+
+
+def _registrar_log(
+    usuario: Optional[UsuarioCustomizado],
+    acao: str,
+    detalhes: str = "",
+    caso: Optional[Caso] = None,
+) -> None:
+    registro_atividade.registrar(usuario, acao, detalhes, caso)
+
+
+def _gravar_transicao(caso: Caso, anterior: contadores.Estado, campos: list[str]) -> None:
+    """Grava só ``campos`` com um UPDATE condicional (compare-and-swap).
+
+    A linha é alterada apenas se ainda tiver a versão e os status lidos; caso contrário
+    levanta ``ConflitoTransicao`` e a transação da transição é desfeita. Nesse caso o
+    objeto em memória fica desatualizado e deve ser relido.
+    """
+    versao_lida = caso.versao
+    status, macro_status, preparo_status, micro_status = anterior
+    caso.versao = versao_lida + 1
+    caso.atualizado_em = timezone.now()
+    alterados = Caso.objects.filter(
+        pk=caso.pk,
+        versao=versao_lida,
+        status=status,
+        macro_status=macro_status,
+        preparo_status=preparo_status,
+        micro_status=micro_status,
+    ).update(**{campo: getattr(caso, campo) for campo in [*campos, "versao", "atualizado_em"]})
+    if not alterados:
+        caso.versao = versao_lida
+        raise ConflitoTransicao(
+            f"Caso {caso.pk} foi alterado por outra pessoa. Recarregue a página e tente novamente."
+        )
+
+
+def _evento_caso(caso: Caso, tipo: str = "atualizado") -> dict:
+    return {
+        "tipo": tipo,
+        "caso": caso.id_laboratorio,
+        "status": caso.status,
+        "macro_status": caso.macro_status,
+        "preparo_status": caso.preparo_status,
+        "micro_status": caso.micro_status,
+        "versao": caso.versao,
+    }
 
 
-def _registrar_log(usuario: Optional[UsuarioCustomizado], acao: str, detalhes: str = "") -> None:
-    LogAtividade.objects.create(usuario=usuario, acao=acao, detalhes=detalhes or "")
+def _notificar(eventos_casos: list[dict]) -> None:
+    """Agenda os efeitos colaterais das transições para depois do commit."""
+    transaction.on_commit(cache_worklist.invalidar)
+    # O hash já impede PDFs desatualizados; apagar os arquivos só libera o espaço.
+    transaction.on_commit(partial(pdf.invalidar, [evento["caso"] for evento in eventos_casos]))
+
+    def publicar() -> None:
+        for evento in eventos_casos:
+            eventos.publicar_caso(evento)
+
+    transaction.on_commit(publicar)
+
+
+def _notificar_alteracao(caso: Caso, tipo: str = "atualizado") -> None:
+    _notificar([_evento_caso(caso, tipo)])
 
 
 def _ensure_professor(usuario: UsuarioCustomizado) -> None:
@@ -29,6 +113,18 @@ def _ensure_professor(usuario: UsuarioCustomizado) -> None:
         raise PermissionDenied("Somente professores ou administradores podem executar esta operação.")
 
 
+@transaction.atomic
+def criar_caso(caso: Caso, usuario: UsuarioCustomizado) -> Caso:
+    caso.criado_por = usuario
+    caso.save()
+    busca.indexar([caso.pk])
+    contadores.ajustar(None, contadores.estado(caso))
+    _notificar_alteracao(caso, "criado")
+
+    _registrar_log(usuario, "CASO_CRIADO", f"Caso {caso.id_laboratorio} criado.", caso)
+    return caso
+
+
 @transaction.atomic
 def registrar_macroscopia(
     caso: Caso,
@@ -37,8 +133,8 @@ def registrar_macroscopia(
     texto_gerado: str = "",
     laudo_existente: Optional[LaudoMacroscopico] = None,
 ) -> LaudoMacroscopico:
-    if caso.macro_status in {"AGUARDANDO_APROVACAO", "APROVADO"}:
-        raise ValidationError("Macroscopia já foi submetida para aprovação e não pode ser editada.")
+    anterior = contadores.estado(caso)
+    transicoes.exigir(caso, usuario, "registrar_macro")
 
     laudo = laudo_existente or getattr(caso, "laudo_macroscopico", None) or LaudoMacroscopico(caso=caso)
 
@@ -47,6 +143,7 @@ def registrar_macroscopia(
         "dim_comprimento_mm",
         "dim_largura_mm",
         "dim_altura_mm",
+        "tipo_tecido",
         "cor",
         "consistencia",
         "forma",
@@ -60,6 +157,7 @@ def registrar_macroscopia(
 
     laudo.texto_gerado = texto_gerado or dados.get("texto_gerado", "")
     laudo.save()
+    busca.indexar([caso.pk])
 
     caso.macro_status = "EM_PROGRESSO"
     caso.macro_preenchido_por = usuario
@@ -70,32 +168,34 @@ def registrar_macroscopia(
     elif caso.status == "PENDENTE_MACRO_APROVACAO":
         caso.macro_status = "AGUARDANDO_APROVACAO"
 
-    caso.save()
+    _gravar_transicao(caso, anterior, ["macro_status", "macro_preenchido_por", "macro_preenchido_em", "status"])
+    contadores.ajustar(anterior, contadores.estado(caso))
+    _notificar_alteracao(caso)
 
-    _registrar_log(usuario, "MACRO_SALVO", f"Caso {caso.id_laboratorio} macroscopia registrada.")
+    _registrar_log(usuario, "MACRO_SALVO", f"Caso {caso.id_laboratorio} macroscopia registrada.", caso)
     return laudo
 
 
 @transaction.atomic
 def solicitar_macroscopia_aprovacao(caso: Caso, usuario: UsuarioCustomizado) -> None:
+    anterior = contadores.estado(caso)
     if not hasattr(caso, "laudo_macroscopico"):
         raise ValidationError("Registre a macroscopia antes de solicitar aprovação.")
-    if caso.macro_status not in {"EM_PROGRESSO", "REPROVADO"}:
-        raise ValidationError("Macroscopia precisa estar em progresso para ser submetida.")
+    transicoes.exigir(caso, usuario, "solicitar_macro")
 
     caso.macro_status = "AGUARDANDO_APROVACAO"
     caso.status = "PENDENTE_MACRO_APROVACAO"
-    caso.save()
+    _gravar_transicao(caso, anterior, ["macro_status", "status"])
+    contadores.ajustar(anterior, contadores.estado(caso))
+    _notificar_alteracao(caso)
 
-    _registrar_log(usuario, "MACRO_SUBMETIDO", f"Caso {caso.id_laboratorio} macroscopia enviada para aprovação.")
+    _registrar_log(usuario, "MACRO_SUBMETIDO", f"Caso {caso.id_laboratorio} macroscopia enviada para aprovação.", caso)
 
 
 @transaction.atomic
 def aprovar_macroscopia(caso: Caso, usuario: UsuarioCustomizado) -> None:
-    _ensure_professor(usuario)
-
-    if caso.macro_status != "AGUARDANDO_APROVACAO":
-        raise ValidationError("Macroscopia não está aguardando aprovação.")
+    anterior = contadores.estado(caso)
+    transicoes.exigir(caso, usuario, "aprovar_macro")
 
     caso.macro_status = "APROVADO"
     caso.macro_aprovado_por = usuario
@@ -103,9 +203,11 @@ def aprovar_macroscopia(caso: Caso, usuario: UsuarioCustomizado) -> None:
     caso.status = "EM_PREPARO"
     if caso.preparo_status == "PENDENTE":
         caso.preparo_status = "EM_PROGRESSO"
-    caso.save()
+    _gravar_transicao(caso, anterior, ["macro_status", "macro_aprovado_por", "macro_aprovado_em", "status", "preparo_status"])
+    contadores.ajustar(anterior, contadores.estado(caso))
+    _notificar_alteracao(caso)
 
-    _registrar_log(usuario, "MACRO_APROVADO", f"Caso {caso.id_laboratorio} macroscopia aprovada.")
+    _registrar_log(usuario, "MACRO_APROVADO", f"Caso {caso.id_laboratorio} macroscopia aprovada.", caso)
 
 
 @transaction.atomic
@@ -115,10 +217,8 @@ def registrar_preparo(
     dados: dict,
     preparo_existente: Optional[MetodoPreparo] = None,
 ) -> MetodoPreparo:
-    if caso.macro_status != "APROVADO":
-        raise ValidationError("Macroscopia precisa ser aprovada antes do registro do preparo.")
-    if caso.preparo_status in {"AGUARDANDO_APROVACAO", "APROVADO"}:
-        raise ValidationError("Preparo já foi submetido para aprovação e não pode ser editado.")
+    anterior = contadores.estado(caso)
+    transicoes.exigir(caso, usuario, "registrar_preparo")
 
     preparo = preparo_existente or getattr(caso, "metodo_preparo", None) or MetodoPreparo(caso=caso)
 
@@ -136,36 +236,34 @@ def registrar_preparo(
     elif caso.status in {"EM_MACROSCOPIA", "PENDENTE_MACRO_APROVACAO"}:
         caso.status = "EM_PREPARO"
 
-    caso.save()
+    _gravar_transicao(caso, anterior, ["preparo_status", "preparo_preenchido_por", "preparo_preenchido_em", "status"])
+    contadores.ajustar(anterior, contadores.estado(caso))
+    _notificar_alteracao(caso)
 
-    _registrar_log(usuario, "PREPARO_SALVO", f"Caso {caso.id_laboratorio} preparo registrado.")
+    _registrar_log(usuario, "PREPARO_SALVO", f"Caso {caso.id_laboratorio} preparo registrado.", caso)
     return preparo
 
 
 @transaction.atomic
 def solicitar_preparo_aprovacao(caso: Caso, usuario: UsuarioCustomizado) -> None:
+    anterior = contadores.estado(caso)
     if not hasattr(caso, "metodo_preparo"):
         raise ValidationError("Registre o preparo antes de solicitar aprovação.")
-    if caso.macro_status != "APROVADO":
-        raise ValidationError("Macroscopia precisa estar aprovada antes de solicitar aprovação do preparo.")
-    if caso.preparo_status not in {"EM_PROGRESSO", "REPROVADO"}:
-        raise ValidationError("Preparo precisa estar em progresso para ser submetido.")
+    transicoes.exigir(caso, usuario, "solicitar_preparo")
 
     caso.preparo_status = "AGUARDANDO_APROVACAO"
     caso.status = "PENDENTE_PREPARO_APROVACAO"
-    caso.save()
+    _gravar_transicao(caso, anterior, ["preparo_status", "status"])
+    contadores.ajustar(anterior, contadores.estado(caso))
+    _notificar_alteracao(caso)
 
-    _registrar_log(usuario, "PREPARO_SUBMETIDO", f"Caso {caso.id_laboratorio} preparo enviado para aprovação.")
+    _registrar_log(usuario, "PREPARO_SUBMETIDO", f"Caso {caso.id_laboratorio} preparo enviado para aprovação.", caso)
 
 
 @transaction.atomic
 def aprovar_preparo(caso: Caso, usuario: UsuarioCustomizado) -> None:
-    _ensure_professor(usuario)
-
-    if caso.macro_status != "APROVADO":
-        raise ValidationError("Macroscopia precisa estar aprovada antes de aprovar o preparo.")
-    if caso.preparo_status != "AGUARDANDO_APROVACAO":
-        raise ValidationError("Preparo não está aguardando aprovação.")
+    anterior = contadores.estado(caso)
+    transicoes.exigir(caso, usuario, "aprovar_preparo")
 
     caso.preparo_status = "APROVADO"
     caso.preparo_aprovado_por = usuario
@@ -173,9 +271,11 @@ def aprovar_preparo(caso: Caso, usuario: UsuarioCustomizado) -> None:
     caso.status = "EM_MICROSCOPIA"
     if caso.micro_status == "PENDENTE":
         caso.micro_status = "EM_PROGRESSO"
-    caso.save()
+    _gravar_transicao(caso, anterior, ["preparo_status", "preparo_aprovado_por", "preparo_aprovado_em", "status", "micro_status"])
+    contadores.ajustar(anterior, contadores.estado(caso))
+    _notificar_alteracao(caso)
 
-    _registrar_log(usuario, "PREPARO_APROVADO", f"Caso {caso.id_laboratorio} preparo aprovado.")
+    _registrar_log(usuario, "PREPARO_APROVADO", f"Caso {caso.id_laboratorio} preparo aprovado.", caso)
 
 
 @transaction.atomic
@@ -185,10 +285,8 @@ def registrar_microscopia(
     dados: dict,
     laudo_existente: Optional[LaudoMicroscopico] = None,
 ) -> LaudoMicroscopico:
-    if caso.macro_status != "APROVADO" or caso.preparo_status != "APROVADO":
-        raise ValidationError("A microscopia só pode ser registrada após macroscopia e preparo aprovados.")
-    if caso.micro_status in {"AGUARDANDO_APROVACAO", "APROVADO"}:
-        raise ValidationError("Microscopia já foi submetida para aprovação e não pode ser editada.")
+    anterior = contadores.estado(caso)
+    transicoes.exigir(caso, usuario, "registrar_micro")
 
     laudo = laudo_existente or getattr(caso, "laudo_microscopico", None) or LaudoMicroscopico(caso=caso)
 
@@ -197,11 +295,14 @@ def registrar_microscopia(
             setattr(laudo, campo, dados[campo])
 
     if "tags_selecionadas" in dados:
-        laudo.tags_selecionadas = list(dados["tags_selecionadas"])
+        laudo.tags_selecionadas = tags.normalizar_nomes(dados["tags_selecionadas"])
     if "texto_base_gerado" in dados:
         laudo.texto_base_gerado = dados["texto_base_gerado"]
 
     laudo.save()
+    tags.sincronizar([laudo])
+    terminologia.sincronizar([laudo])
+    busca.indexar([caso.pk])
 
     caso.micro_status = "EM_PROGRESSO"
     caso.micro_preenchido_por = usuario
@@ -212,62 +313,251 @@ def registrar_microscopia(
     elif caso.status in {"EM_PREPARO", "PENDENTE_PREPARO_APROVACAO"}:
         caso.status = "EM_MICROSCOPIA"
 
-    caso.save()
+    _gravar_transicao(caso, anterior, ["micro_status", "micro_preenchido_por", "micro_preenchido_em", "status"])
+    contadores.ajustar(anterior, contadores.estado(caso))
+    _notificar_alteracao(caso)
 
-    _registrar_log(usuario, "MICRO_SALVO", f"Caso {caso.id_laboratorio} microscopia registrada.")
+    _registrar_log(usuario, "MICRO_SALVO", f"Caso {caso.id_laboratorio} microscopia registrada.", caso)
     return laudo
 
 
 @transaction.atomic
 def solicitar_microscopia_aprovacao(caso: Caso, usuario: UsuarioCustomizado) -> None:
+    anterior = contadores.estado(caso)
     if not hasattr(caso, "laudo_microscopico"):
         raise ValidationError("Registre a microscopia antes de solicitar aprovação.")
-    if caso.macro_status != "APROVADO" or caso.preparo_status != "APROVADO":
-        raise ValidationError("Macroscopia e preparo precisam estar aprovados antes da aprovação da microscopia.")
-    if caso.micro_status not in {"EM_PROGRESSO", "REPROVADO"}:
-        raise ValidationError("Microscopia precisa estar em progresso para ser submetida.")
+    transicoes.exigir(caso, usuario, "solicitar_micro")
 
     caso.micro_status = "AGUARDANDO_APROVACAO"
     caso.status = "PENDENTE_MICRO_APROVACAO"
-    caso.save()
+    _gravar_transicao(caso, anterior, ["micro_status", "status"])
+    contadores.ajustar(anterior, contadores.estado(caso))
+    _notificar_alteracao(caso)
 
-    _registrar_log(usuario, "MICRO_SUBMETIDO", f"Caso {caso.id_laboratorio} microscopia enviada para aprovação.")
+    _registrar_log(usuario, "MICRO_SUBMETIDO", f"Caso {caso.id_laboratorio} microscopia enviada para aprovação.", caso)
 
 
 @transaction.atomic
 def aprovar_microscopia(caso: Caso, usuario: UsuarioCustomizado) -> None:
-    _ensure_professor(usuario)
-
-    if caso.macro_status != "APROVADO" or caso.preparo_status != "APROVADO":
-        raise ValidationError("Macroscopia e preparo precisam estar aprovados antes de aprovar a microscopia.")
-    if caso.micro_status != "AGUARDANDO_APROVACAO":
-        raise ValidationError("Microscopia não está aguardando aprovação.")
+    anterior = contadores.estado(caso)
+    transicoes.exigir(caso, usuario, "aprovar_micro")
 
     caso.micro_status = "APROVADO"
     caso.micro_aprovado_por = usuario
     caso.micro_aprovado_em = timezone.now()
     caso.status = "AGUARDANDO_APROVACAO_FINAL"
-    caso.save()
+    _gravar_transicao(caso, anterior, ["micro_status", "micro_aprovado_por", "micro_aprovado_em", "status"])
+    contadores.ajustar(anterior, contadores.estado(caso))
+    _notificar_alteracao(caso)
 
-    _registrar_log(usuario, "MICRO_APROVADO", f"Caso {caso.id_laboratorio} microscopia aprovada.")
+    _registrar_log(usuario, "MICRO_APROVADO", f"Caso {caso.id_laboratorio} microscopia aprovada.", caso)
 
 
 @transaction.atomic
 def aprovar_laudo_final(caso: Caso, usuario: UsuarioCustomizado) -> None:
-    _ensure_professor(usuario)
-
-    if any(status != "APROVADO" for status in [caso.macro_status, caso.preparo_status, caso.micro_status]):
-        raise ValidationError("Todas as etapas precisam estar aprovadas antes da aprovação final.")
+    anterior = contadores.estado(caso)
+    transicoes.exigir(caso, usuario, "aprovar_final")
 
     caso.status = "FINALIZADO"
     caso.responsavel_final = usuario
     caso.data_finalizacao = timezone.now()
-    caso.save()
+    _gravar_transicao(caso, anterior, ["status", "responsavel_final", "data_finalizacao"])
+    contadores.ajustar(anterior, contadores.estado(caso))
+    _notificar_alteracao(caso)
+    # O PDF final é renderizado em segundo plano, para já estar no cache no primeiro download.
+    transaction.on_commit(partial(tarefas_pdf.enfileirar, [caso.id_laboratorio]))
+    transaction.on_commit(autocompletar.avisar)
+    transaction.on_commit(partial(semelhantes.adicionar, [caso.id_laboratorio]))
+
+    _registrar_log(usuario, "LAUDO_FINAL_APROVADO", f"Caso {caso.id_laboratorio} laudo final aprovado.", caso)
+
+
+@dataclass(frozen=True)
+class _AprovacaoEmLote:
+    """Efeitos de uma aprovação aplicada a vários casos com um único UPDATE.
+
+    Quem pode aprovar e em que estado vem de ``transicoes``; aqui ficam só as colunas
+    gravadas e o estado resultante de cada caso.
+    """
+
+    transicao: str
+    acao: str
+    descricao: str
+    atualizacao: Callable[[UsuarioCustomizado, datetime.datetime], dict]
+    proximo_estado: Callable[[dict], dict]
+
+
+def _iniciar_se_pendente(campo: str) -> Case:
+    return Case(When(**{campo: "PENDENTE"}, then=Value("EM_PROGRESSO")), default=F(campo))
+
+
+APROVACOES_EM_LOTE = {
+    "macro": _AprovacaoEmLote(
+        transicao="aprovar_macro",
+        acao="MACRO_APROVADO",
+        descricao="macroscopia aprovada",
+        atualizacao=lambda usuario, agora: {
+            "macro_status": "APROVADO",
+            "macro_aprovado_por": usuario,
+            "macro_aprovado_em": agora,
+            "status": "EM_PREPARO",
+            "preparo_status": _iniciar_se_pendente("preparo_status"),
+        },
+        proximo_estado=lambda estado: {
+            "macro_status": "APROVADO",
+            "status": "EM_PREPARO",
+            "preparo_status": "EM_PROGRESSO" if estado["preparo_status"] == "PENDENTE" else estado["preparo_status"],
+        },
+    ),
+    "preparo": _AprovacaoEmLote(
+        transicao="aprovar_preparo",
+        acao="PREPARO_APROVADO",
+        descricao="preparo aprovado",
+        atualizacao=lambda usuario, agora: {
+            "preparo_status": "APROVADO",
+            "preparo_aprovado_por": usuario,
+            "preparo_aprovado_em": agora,
+            "status": "EM_MICROSCOPIA",
+            "micro_status": _iniciar_se_pendente("micro_status"),
+        },
+        proximo_estado=lambda estado: {
+            "preparo_status": "APROVADO",
+            "status": "EM_MICROSCOPIA",
+            "micro_status": "EM_PROGRESSO" if estado["micro_status"] == "PENDENTE" else estado["micro_status"],
+        },
+    ),
+    "micro": _AprovacaoEmLote(
+        transicao="aprovar_micro",
+        acao="MICRO_APROVADO",
+        descricao="microscopia aprovada",
+        atualizacao=lambda usuario, agora: {
+            "micro_status": "APROVADO",
+            "micro_aprovado_por": usuario,
+            "micro_aprovado_em": agora,
+            "status": "AGUARDANDO_APROVACAO_FINAL",
+        },
+        proximo_estado=lambda estado: {
+            "micro_status": "APROVADO",
+            "status": "AGUARDANDO_APROVACAO_FINAL",
+        },
+    ),
+    "final": _AprovacaoEmLote(
+        transicao="aprovar_final",
+        acao="LAUDO_FINAL_APROVADO",
+        descricao="laudo final aprovado",
+        atualizacao=lambda usuario, agora: {
+            "status": "FINALIZADO",
+            "responsavel_final": usuario,
+            "data_finalizacao": agora,
+        },
+        proximo_estado=lambda estado: {"status": "FINALIZADO"},
+    ),
+}
+
+_CAMPOS_ESTADO = ("id_laboratorio", "status", "macro_status", "preparo_status", "micro_status", "versao")
+
+
+def _estado_de(linha: dict) -> contadores.Estado:
+    return (linha["status"], linha["macro_status"], linha["preparo_status"], linha["micro_status"])
+
 
-    _registrar_log(usuario, "LAUDO_FINAL_APROVADO", f"Caso {caso.id_laboratorio} laudo final aprovado.")
+@transaction.atomic
+def aprovar_em_lote(etapa: str, ids: Iterable[str], usuario: UsuarioCustomizado) -> dict[str, Optional[str]]:
+    """Aprova ``etapa`` em vários casos numa só transação.
+
+    Bloqueia e valida todas as linhas com uma consulta, grava as transições válidas com
+    um único UPDATE e agenda os logs para um único ``bulk_create`` após o commit. Retorna, por caso, ``None``
+    quando aprovado ou a mensagem que impediu a aprovação.
+    """
+    _ensure_professor(usuario)
+    regra = APROVACOES_EM_LOTE[etapa]
+    transicao = transicoes.TRANSICOES[regra.transicao]
+    ids = list(dict.fromkeys(ids))
+
+    linhas = {
+        linha["id_laboratorio"]: linha
+        for linha in Caso.objects.select_for_update().filter(id_laboratorio__in=ids).values(*_CAMPOS_ESTADO)
+    }
+    resultados: dict[str, Optional[str]] = {}
+    validos = []
+    for caso_id in ids:
+        linha = linhas.get(caso_id)
+        if linha is None:
+            resultados[caso_id] = "Caso não encontrado."
+            continue
+        erro = transicoes.permissoes(linha, usuario.role).erro(regra.transicao)
+        resultados[caso_id] = erro
+        if erro is None:
+            validos.append(linha)
+
+    if not validos:
+        return resultados
+
+    agora = timezone.now()
+    versoes_lidas = Q()
+    for linha in validos:
+        versoes_lidas |= Q(id_laboratorio=linha["id_laboratorio"], versao=linha["versao"])
+    # Os requisitos da tabela viram o WHERE, junto com a versão lida de cada caso.
+    alterados = Caso.objects.filter(transicao.condicao(), versoes_lidas).update(
+        versao=F("versao") + 1,
+        atualizado_em=agora,
+        **regra.atualizacao(usuario, agora),
+    )
+    if alterados != len(validos):
+        # Algum caso mudou desde a leitura; desfaz o lote inteiro em vez de aprovar parte dele às cegas.
+        raise ConflitoTransicao(
+            "Algum dos casos selecionados foi alterado por outra pessoa. Recarregue a página e tente novamente."
+        )
+
+    eventos_casos = []
+    for linha in validos:
+        novo = {**linha, **regra.proximo_estado(linha), "versao": linha["versao"] + 1}
+        contadores.ajustar(_estado_de(linha), _estado_de(novo))
+        eventos_casos.append(
+            {
+                "tipo": "atualizado",
+                "caso": novo["id_laboratorio"],
+                **{campo: novo[campo] for campo in _CAMPOS_ESTADO[1:]},
+            }
+        )
+
+    registro_atividade.registrar_entradas(
+        registro_atividade.entrada(
+            usuario,
+            regra.acao,
+            f"Caso {linha['id_laboratorio']} {regra.descricao}.",
+            linha["id_laboratorio"],
+            timestamp=agora,
+        )
+        for linha in validos
+    )
+    _notificar(eventos_casos)
+    if etapa == "final":
+        transaction.on_commit(partial(tarefas_pdf.enfileirar, [linha["id_laboratorio"] for linha in validos]))
+        transaction.on_commit(autocompletar.avisar)
+        transaction.on_commit(partial(semelhantes.adicionar, [linha["id_laboratorio"] for linha in validos]))
+    return resultados
+
+
+def aprovar_macroscopia_em_lote(ids: Iterable[str], usuario: UsuarioCustomizado) -> dict[str, Optional[str]]:
+    return aprovar_em_lote("macro", ids, usuario)
+
+
+def aprovar_preparo_em_lote(ids: Iterable[str], usuario: UsuarioCustomizado) -> dict[str, Optional[str]]:
+    return aprovar_em_lote("preparo", ids, usuario)
+
+
+def aprovar_microscopia_em_lote(ids: Iterable[str], usuario: UsuarioCustomizado) -> dict[str, Optional[str]]:
+    return aprovar_em_lote("micro", ids, usuario)
+
+
+def aprovar_laudo_final_em_lote(ids: Iterable[str], usuario: UsuarioCustomizado) -> dict[str, Optional[str]]:
+    return aprovar_em_lote("final", ids, usuario)
 
 
 __all__ = [
+    "ConflitoTransicao",
+    "criar_caso",
     "registrar_macroscopia",
     "solicitar_macroscopia_aprovacao",
     "aprovar_macroscopia",
@@ -278,4 +568,9 @@ __all__ = [
     "solicitar_microscopia_aprovacao",
     "aprovar_microscopia",
     "aprovar_laudo_final",
+    "aprovar_em_lote",
+    "aprovar_macroscopia_em_lote",
+    "aprovar_preparo_em_lote",
+    "aprovar_microscopia_em_lote",
+    "aprovar_laudo_final_em_lote",
 ]
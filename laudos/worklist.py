@@ -0,0 +1,238 @@
+"""Paginação por cursor (keyset) e filtros da lista de casos do dashboard."""
+
+from __future__ import annotations
+
+import base64
+import binascii
+import datetime
+import json
+from dataclasses import dataclass, field
+from typing import Optional
+
+from django.db.models import BooleanField, Case, CharField, DateField, F, Q, QuerySet, Value, When
+
+from . import tags
+from .models import Caso, Paciente
+
+PAGE_SIZE = 25
+
+ORDENACAO = ("-data_recebimento", "-id_laboratorio")
+ORDENACAO_INVERSA = ("data_recebimento", "id_laboratorio")
+
+MASCARA = "***"
+PAPEIS_SEM_ANONIMIZACAO = {"ADMIN", "PROFESSOR"}
+
+STAGE_BADGE_CLASSES = {
+    "PENDENTE": "stage-badge stage-pendente",
+    "EM_PROGRESSO": "stage-badge stage-progresso",
+    "AGUARDANDO_APROVACAO": "stage-badge stage-aguardando",
+    "APROVADO": "stage-badge stage-aprovado",
+    "REPROVADO": "stage-badge stage-reprovado",
+}
+BADGE_PADRAO = STAGE_BADGE_CLASSES["PENDENTE"]
+
+STATUS_LABELS = dict(Caso.STATUS_CHOICES)
+ETAPA_STATUS_LABELS = dict(Caso.ETAPA_STATUS_CHOICES)
+SEXO_LABELS = dict(Paciente.SEXO_CHOICES)
+
+
+def _mapear(campo: str, tabela: dict, padrao: str = "") -> Case:
+    """Traduz ``campo`` pela tabela de consulta dentro do próprio SQL."""
+    return Case(
+        *[When(**{campo: chave}, then=Value(valor)) for chave, valor in tabela.items()],
+        default=Value(padrao),
+        output_field=CharField(),
+    )
+
+
+# Expressões montadas uma única vez na importação; o Django as copia ao resolver cada consulta.
+_EXPRESSOES_EXIBICAO = {
+    "status_display": _mapear("status", STATUS_LABELS),
+    "macro_status_display": _mapear("macro_status", ETAPA_STATUS_LABELS),
+    "preparo_status_display": _mapear("preparo_status", ETAPA_STATUS_LABELS),
+    "micro_status_display": _mapear("micro_status", ETAPA_STATUS_LABELS),
+    "macro_badge_class": _mapear("macro_status", STAGE_BADGE_CLASSES, BADGE_PADRAO),
+    "preparo_badge_class": _mapear("preparo_status", STAGE_BADGE_CLASSES, BADGE_PADRAO),
+    "micro_badge_class": _mapear("micro_status", STAGE_BADGE_CLASSES, BADGE_PADRAO),
+}
+_SEXO_DISPLAY = [When(paciente__sexo=chave, then=Value(valor)) for chave, valor in SEXO_LABELS.items()]
+
+CAMPOS_LINHA = (
+    "id_laboratorio",
+    "solicitante",
+    "status",
+    "data_recebimento",
+    "macro_status",
+    "preparo_status",
+    "micro_status",
+)
+
+
+@dataclass
+class Pagina:
+    itens: list = field(default_factory=list)
+    proximo_cursor: Optional[str] = None
+    anterior_cursor: Optional[str] = None
+
+    @property
+    def tem_proxima(self) -> bool:
+        return self.proximo_cursor is not None
+
+    @property
+    def tem_anterior(self) -> bool:
+        return self.anterior_cursor is not None
+
+
+def codificar_cursor(data_recebimento: datetime.date, id_laboratorio: str) -> str:
+    bruto = json.dumps([data_recebimento.isoformat(), id_laboratorio]).encode("utf-8")
+    return base64.urlsafe_b64encode(bruto).decode("ascii").rstrip("=")
+
+
+def decodificar_cursor(cursor: str) -> Optional[tuple[datetime.date, str]]:
+    """Retorna a chave (data_recebimento, id_laboratorio) ou None se o cursor for invalido."""
+    if not cursor:
+        return None
+    try:
+        bruto = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data_iso, id_laboratorio = json.loads(bruto.decode("utf-8"))
+        return datetime.date.fromisoformat(data_iso), str(id_laboratorio)
+    except (binascii.Error, ValueError, TypeError, UnicodeDecodeError):
+        return None
+
+
+def _chave(item) -> tuple[datetime.date, str]:
+    if isinstance(item, dict):
+        return item["data_recebimento"], item["id_laboratorio"]
+    return item.data_recebimento, item.id_laboratorio
+
+
+def _campos_paciente(usuario) -> dict:
+    sexo_display = Case(*_SEXO_DISPLAY, default=F("paciente__sexo"), output_field=CharField())
+    if usuario.role in PAPEIS_SEM_ANONIMIZACAO:
+        return {
+            "restrito": Value(False, output_field=BooleanField()),
+            "numero_prontuario": F("paciente__numero_prontuario"),
+            "data_nascimento": F("paciente__data_nascimento"),
+            "sexo": sexo_display,
+        }
+
+    visivel = Q(criado_por=usuario.pk)
+    return {
+        "restrito": Case(When(visivel, then=Value(False)), default=Value(True), output_field=BooleanField()),
+        "numero_prontuario": Case(
+            When(visivel, then=F("paciente__numero_prontuario")),
+            default=Value(MASCARA),
+            output_field=CharField(),
+        ),
+        "data_nascimento": Case(
+            When(visivel, then=F("paciente__data_nascimento")),
+            default=Value(None),
+            output_field=DateField(),
+        ),
+        "sexo": Case(When(visivel, then=sexo_display), default=Value(MASCARA), output_field=CharField()),
+    }
+
+
+def projetar(queryset: QuerySet, usuario) -> QuerySet:
+    """Reduz a consulta às colunas da tabela do dashboard, como linhas de ``values()``.
+
+    Rótulos, classes de badge e a anonimização do paciente são resolvidos no SQL:
+    quem não é professor/administrador só vê os dados de pacientes dos casos que criou.
+    """
+    return queryset.values(*CAMPOS_LINHA).annotate(**_campos_paciente(usuario), **_EXPRESSOES_EXIBICAO)
+
+
+def aplicar_filtros(queryset: QuerySet, filtros: dict) -> QuerySet:
+    """Aplica no banco os filtros validados pelo ``WorklistFiltroForm``."""
+    if filtros.get("status"):
+        queryset = queryset.filter(status=filtros["status"])
+    for etapa in ("macro_status", "preparo_status", "micro_status"):
+        if filtros.get(etapa):
+            queryset = queryset.filter(**{etapa: filtros[etapa]})
+    if filtros.get("data_inicio"):
+        queryset = queryset.filter(data_recebimento__gte=filtros["data_inicio"])
+    if filtros.get("data_fim"):
+        queryset = queryset.filter(data_recebimento__lte=filtros["data_fim"])
+    if filtros.get("criado_por"):
+        queryset = queryset.filter(criado_por=filtros["criado_por"])
+    if filtros.get("tags"):
+        queryset = tags.filtrar_casos(queryset, filtros["tags"], filtros.get("tags_modo") or "todas")
+    return queryset
+
+
+def consulta_pagina(
+    queryset: QuerySet,
+    apos: Optional[str] = None,
+    antes: Optional[str] = None,
+    page_size: int = PAGE_SIZE,
+) -> tuple[QuerySet, bool]:
+    """Monta a consulta de uma página; o booleano indica se ela volta em ordem inversa.
+
+    O limite redundante em data_recebimento deixa o SQLite usar uma busca por faixa
+    no índice em vez de percorrer as linhas anteriores ao cursor.
+    """
+    chave_apos = decodificar_cursor(apos) if apos else None
+    chave_antes = decodificar_cursor(antes) if antes and not chave_apos else None
+
+    if chave_antes:
+        data, id_lab = chave_antes
+        queryset = queryset.filter(
+            Q(data_recebimento__gt=data) | Q(data_recebimento=data, id_laboratorio__gt=id_lab),
+            data_recebimento__gte=data,
+        )
+        return queryset.order_by(*ORDENACAO_INVERSA)[: page_size + 1], True
+
+    if chave_apos:
+        data, id_lab = chave_apos
+        queryset = queryset.filter(
+            Q(data_recebimento__lt=data) | Q(data_recebimento=data, id_laboratorio__lt=id_lab),
+            data_recebimento__lte=data,
+        )
+    return queryset.order_by(*ORDENACAO)[: page_size + 1], False
+
+
+def paginar(
+    queryset: QuerySet,
+    apos: Optional[str] = None,
+    antes: Optional[str] = None,
+    page_size: int = PAGE_SIZE,
+) -> Pagina:
+    """Busca uma página ordenada por (data_recebimento, id_laboratorio) decrescente.
+
+    ``apos`` avança a partir da última linha da página anterior e ``antes`` volta a
+    partir da primeira linha da página atual. O custo depende apenas de ``page_size``,
+    nunca do tamanho da tabela, porque a consulta parte sempre da chave do cursor.
+    """
+    consulta, invertida = consulta_pagina(queryset, apos=apos, antes=antes, page_size=page_size)
+    itens = list(consulta)
+    tem_mais = len(itens) > page_size
+    itens = itens[:page_size]
+    pagina = Pagina(itens=itens)
+    if not itens:
+        return pagina
+
+    if invertida:
+        itens.reverse()
+        pagina.proximo_cursor = codificar_cursor(*_chave(itens[-1]))
+        if tem_mais:
+            pagina.anterior_cursor = codificar_cursor(*_chave(itens[0]))
+    else:
+        if tem_mais:
+            pagina.proximo_cursor = codificar_cursor(*_chave(itens[-1]))
+        if apos and decodificar_cursor(apos):
+            pagina.anterior_cursor = codificar_cursor(*_chave(itens[0]))
+    return pagina
+
+
+__all__ = [
+    "BADGE_PADRAO",
+    "PAGE_SIZE",
+    "Pagina",
+    "STAGE_BADGE_CLASSES",
+    "aplicar_filtros",
+    "consulta_pagina",
+    "codificar_cursor",
+    "decodificar_cursor",
+    "paginar",
+    "projetar",
+]
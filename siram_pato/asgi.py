@@ -3,6 +3,11 @@ ASGI config for siram_pato project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serve it with an ASGI server (e.g. ``uvicorn siram_pato.asgi:application``) so that
+the Server-Sent Events endpoint at /laudos/eventos/ keeps idle connections as
+suspended coroutines instead of one thread each. Events are broadcast in process,
+so run a single ASGI process for the live dashboard.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -48,6 +48,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'laudos.registro_atividade.ColetorLogsMiddleware',
 ]
 
 ROOT_URLCONF = 'siram_pato.urls'
@@ -143,3 +144,37 @@ AUTH_USER_MODEL = 'laudos.UsuarioCustomizado'
 # Configurações de redirecionamento de autenticação
 LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/'
+
+# Cache do dashboard. O LocMemCache vale apenas para um processo; com vários workers
+# use um backend compartilhado (Memcached, Redis ou DatabaseCache) para que a
+# invalidação feita pelo workflow alcance todos eles.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'siram-pato',
+    }
+}
+
+# Segundos que uma página renderizada da lista de casos permanece no cache.
+LAUDOS_WORKLIST_CACHE_TIMEOUT = 300
+
+# Grava os lotes de LogAtividade numa thread de fundo em vez de ao fim da requisição.
+LAUDOS_LOG_ASSINCRONO = False
+
+# Idade, em dias, a partir da qual o comando "arquivar" move casos finalizados e logs.
+LAUDOS_ARQUIVO_DIAS = 365
+
+# Cache em disco dos PDFs de laudo, descartando os menos usados acima do limite.
+LAUDOS_PDF_CACHE_DIR = BASE_DIR / 'var' / 'pdf'
+LAUDOS_PDF_CACHE_MAX_BYTES = 256 * 1024 * 1024
+# Atrás de um proxy, entrega o PDF por cabeçalho: 'X-Sendfile' (Apache) ou
+# 'X-Accel-Redirect' (nginx, com LAUDOS_PDF_SENDFILE_PREFIXO apontando a location interna).
+LAUDOS_PDF_SENDFILE = ''
+LAUDOS_PDF_SENDFILE_PREFIXO = ''
+
+# Processos que renderizam PDFs para as exportações em ZIP, somadas as simultâneas
+# (None: um por núcleo).
+LAUDOS_EXPORTACAO_PROCESSOS = None
+
+# Segmentos .npy do índice de casos semelhantes (TF-IDF), abertos por memory-mapping.
+LAUDOS_SEMELHANTES_DIR = BASE_DIR / 'var' / 'semelhantes'